@@ -1,13 +1,10 @@
 from spread import Spread
-from order import Order
-from copy import deepcopy
+from sizing import PositionSizes
+from order import Slice
+from retry import Retry, RetryExhausted
 from SmartApi import SmartConnect
-from typing import Optional, Dict, List
-import logging
-from time import sleep
-import sys
-
-log = logging.getLogger()
+from typing import Optional, Dict, List, Tuple
+from time import time
 
 
 class Account:
@@ -18,8 +15,8 @@ class Account:
 
     Attributes
     ----------
-    orders: Optional[List[Order, Order]], default: None
-        List of orders to be executed
+    orders: Optional[List[Tuple[Slice, Slice]]], default: None
+        Buy-sell slices to be executed
     account_id: str
         Account ID of the current account
     account_name: str
@@ -36,6 +33,10 @@ class Account:
         Refresh token generated by smartapi
     capital_to_use: Optional[float]
         Capital to use for trading
+    capital_limit: Optional[float]
+        Capital to use given in the credentials, the whole balance is used if None
+    funds_updated_at: Optional[float]
+        Epoch time when the balance was last read
 
     Methods
     -------
@@ -48,12 +49,14 @@ class Account:
         Gets current P&L data if an account
     get_total_number_of_spreads_and_symbols(self) -> Optional[Dict]:
         Gets total number of spreads and synbols that are currently in an open position
+    set_balance(self, balance: float = None) -> None:
+        Sets the available balance and the capital to use that follows from it
     """
 
     def __init__(self, account_id: str = None, account_name: str = None, balance: float = None,
                  realised_profit: float = None, unrealised_profit: float = None, smartapi: SmartConnect = None,
                  refresh_token: str = None):
-        self.orders: Optional[List[Order, Order]] = None
+        self.orders: Optional[List[Tuple[Slice, Slice]]] = None
         self.account_id: str = account_id
         self.account_name: str = account_name
         self.balance: float = balance
@@ -62,6 +65,8 @@ class Account:
         self.smartapi: SmartConnect = smartapi
         self.refresh_token: str = refresh_token
         self.capital_to_use: Optional[float] = None
+        self.capital_limit: Optional[float] = None
+        self.funds_updated_at: Optional[float] = None
 
     def create_list_of_orders(self, spread: Spread = None, freeze_quantity: int = None,
                               total_number_of_spreads: Optional[int] = None) -> None:
@@ -70,6 +75,7 @@ class Account:
 
         If total number of spreads is not defined, then based on margin required total number of spreads will be
         calculated. Based on the freeze quantity and total number of spreads possible order blocks will be created.
+        ENTRY sizes all accounts together with PositionSizes instead.
 
         Parameters
         ----------
@@ -82,7 +88,7 @@ class Account:
         """
         if spread is None or freeze_quantity is None:
             return None
-        order_list: list[[Order, Order]] = []
+        order_list: List[Tuple[Slice, Slice]] = []
         if total_number_of_spreads is None:
             total_number_of_spreads: int = int((self.capital_to_use * 1.0) / spread.margin_per_lot)
         spreads_per_order: int = freeze_quantity // spread.buying_order.qty
@@ -90,22 +96,8 @@ class Account:
         if spread.margin_per_lot is not None:
             print("Total capital used: Rs " + str(total_number_of_spreads * 1.0 * spread.margin_per_lot))
         if total_number_of_spreads > 0:
-            while total_number_of_spreads:
-                b_order: Order = deepcopy(spread.buying_order)
-                s_order: Order = deepcopy(spread.selling_order)
-                if total_number_of_spreads >= spreads_per_order:
-                    b_order.qty = freeze_quantity
-                    b_order.quantity = str(b_order.qty)
-                    s_order.qty = freeze_quantity
-                    s_order.quantity = str(s_order.qty)
-                    total_number_of_spreads = total_number_of_spreads - spreads_per_order
-                else:
-                    b_order.qty = int(spread.buying_order.qty * total_number_of_spreads)
-                    b_order.quantity = str(b_order.qty)
-                    s_order.qty = int(spread.selling_order.qty * total_number_of_spreads)
-                    s_order.quantity = str(s_order.qty)
-                    total_number_of_spreads = 0
-                order_list.append([b_order, s_order])
+            order_list = PositionSizes.slice_spread(spread=spread, lots=total_number_of_spreads,
+                                                    lots_per_slice=spreads_per_order)
         self.orders = order_list
 
     def get_current_positions(self, verification_data: Dict[str, Dict] = None) -> List[Dict]:
@@ -127,22 +119,11 @@ class Account:
             [{ "symbol_name": str,  "strike": str, "quantity": str }
         """
         smartapi: SmartConnect = self.smartapi
-        position_exception_present: bool = False
-        while True:
-            try:
-                position = smartapi.position()["data"]
-                if position_exception_present:
-                    print("Position exception in details solved.\n")
-                    position_exception_present = False
-                break
-            except Exception as exp:
-                log.exception("Position exception in details: " + str(exp))
-                if position_exception_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                position_exception_present = True
-                print("Position exception in details occurring.")
-            sleep(1)
+        try:
+            position = Retry.call(fn=lambda: smartapi.position()["data"], endpoint="position",
+                                  account_id=self.account_id, label="Position for details")
+        except RetryExhausted:
+            return []
         if position is None:
             return []
         strike_check: int = 0
@@ -186,22 +167,11 @@ class Account:
             Realised, unrealised, overall p&l
         """
         smartapi: SmartConnect = self.smartapi
-        position_exception_present: bool = False
-        while True:
-            try:
-                position = smartapi.position()["data"]
-                if position_exception_present:
-                    print("Position exception in pnl solved.\n")
-                    position_exception_present = False
-                break
-            except Exception as exp:
-                log.exception("Position exception in pnl: " + str(exp))
-                if position_exception_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                position_exception_present = True
-                print("Position exception in pnl occurring.")
-            sleep(1)
+        try:
+            position = Retry.call(fn=lambda: smartapi.position()["data"], endpoint="position",
+                                  account_id=self.account_id, label="Position for pnl")
+        except RetryExhausted:
+            return 0.0, 0.0, 0.0
         if position is None:
             return 0.0, 0.0, 0.0
         realised: float = 0.0
@@ -226,22 +196,11 @@ class Account:
             { "buying_symbol": str, "selling_symbol": str, "total_number_of_spreads": int }
         """
         smartapi: SmartConnect = self.smartapi
-        position_exception_present: bool = False
-        while True:
-            try:
-                position = smartapi.position()["data"]
-                if position_exception_present:
-                    print("Position exception in total number of spreads solved.\n")
-                    position_exception_present = False
-                break
-            except Exception as exp:
-                log.exception("Position exception in total number of spreads: " + str(exp))
-                if position_exception_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                position_exception_present = True
-                print("Position exception in total number of spreads occurring.")
-            sleep(1)
+        try:
+            position = Retry.call(fn=lambda: smartapi.position()["data"], endpoint="position",
+                                  account_id=self.account_id, label="Position for total number of spreads")
+        except RetryExhausted:
+            return None
         if position is None:
             return None
         quantity: int = 0
@@ -271,3 +230,22 @@ class Account:
                         "selling_symbol": selling_symbol,
                         "total_number_of_spreads": abs(quantity) // abs(lotsize)}
         return result
+
+    def set_balance(self, balance: float = None) -> None:
+        """
+        Sets the available balance and the capital to use that follows from it
+
+        The capital to use is the capital given in the credentials capped by the balance, or the whole balance if none
+        was given
+
+        Parameters
+        ----------
+        balance: float, default: None
+            Available cash of the account
+        """
+        self.balance = balance
+        if self.capital_limit is None:
+            self.capital_to_use = balance
+        else:
+            self.capital_to_use = min(self.capital_limit, balance)
+        self.funds_updated_at = time()
@@ -0,0 +1,211 @@
+from trading_symbols import TradingSymbols
+from index import Index
+from order import Order, Slice
+from retry import Retry, RetryExhausted
+from typing import Dict, List, Optional, Tuple
+from SmartApi import SmartConnect
+
+# Legs of a basket are told apart by one digit in their order tags
+MAX_LEGS: int = 10
+
+
+class Basket:
+    """
+    Class to represent a basket of option legs placed together, such as an iron condor or a ratio spread
+
+    Every leg is an order of one lot times its ratio. Long legs are hedges: they are placed first, and a short leg is
+    only placed once every long leg of the same option type is filled.
+
+    ...
+
+    Attributes
+    ----------
+    legs: List[Order]
+        Legs of the basket, quantity of each being the quantity of one lot of the basket
+    quantity_per_lot: Optional[int]
+        Quantity per lot of the index
+    margin_per_lot: Optional[float]
+        Margin required to place one lot of the basket
+    index: Optional[str]
+        Index of the legs
+    expiry: Optional[str]
+        Expiry date of the legs
+
+    Methods
+    -------
+    create_basket(self, index: str = None, legs: str = None, expiry: str = None) -> None:
+        Creates the legs of a basket from their description
+    get_margin_per_lot(self, smartapi: SmartConnect = None, account_id: Optional[str] = None) -> Optional[float]:
+        Gets the margin required to place one lot of the basket in a single call
+    largest_leg(self) -> int:
+        Quantity of the largest leg for one lot of the basket
+    lots(self, slices: Tuple[Slice, ...] = None) -> int:
+        Number of baskets in a slice of all legs
+    describe(self) -> str:
+        Legs as written in a command
+    exit_command(self) -> str:
+        EXIT command of the basket
+    reverse(self) -> None:
+        Flips every leg, so the basket closes what it opened
+    option_type(order: Order = None) -> str:
+        CE or PE
+    """
+
+    def __init__(self):
+        self.legs: List[Order] = []
+        self.quantity_per_lot: Optional[int] = None
+        self.margin_per_lot: Optional[float] = None
+        self.index: Optional[str] = None
+        self.expiry: Optional[str] = None
+
+    def create_basket(self, index: str = None, legs: str = None, expiry: str = None) -> None:
+        """
+        Creates the legs of a basket from their description
+
+        Legs are separated by commas. Each leg is + to buy or - to sell, an optional ratio followed by x, and the
+        strike with its option type, such as +21800PE,-22000PE,-22500CE,+22700CE or +22000PE,-2x21800PE. No leg is
+        created if any of them is wrong.
+
+        Parameters
+        ----------
+        index: str, default: None
+            Index on which trading is done
+        legs: str, default: None
+            Description of the legs
+        expiry: str, default: None
+            Expiry date of the options
+        """
+        if index is None or legs is None or expiry is None:
+            print("Either index or legs or expiry is None\n")
+            return None
+        index_details: Dict = Index.get_details(index=index)
+        if index_details == {}:
+            print("Index details is empty\n")
+            return None
+        descriptions: List[str] = [description.strip() for description in legs.split(',') if description.strip()]
+        if not 0 < len(descriptions) <= MAX_LEGS:
+            print("A basket takes 1 to " + str(MAX_LEGS) + " legs\n")
+            return None
+        orders: List[Order] = []
+        for description in descriptions:
+            if description[0] not in "+-":
+                print("Leg " + description + " has to start with + or -\n")
+                return None
+            tradetype: str = "BUY" if description[0] == "+" else "SELL"
+            ratio: str = "1"
+            strike: str = description[1:]
+            if "x" in strike:
+                ratio, strike = strike.split("x", 1)
+            option_type: str = strike[-2:].upper()
+            if not ratio.isdigit() or int(ratio) == 0 or option_type not in ("CE", "PE") or not strike[:-2].isdigit():
+                print("Leg " + description + " is wrong\n")
+                return None
+            symbol: str = index + expiry + strike[:-2] + option_type
+            token: Optional[str] = TradingSymbols.get_token(symbol=symbol)
+            if token is None:
+                print("Token of " + symbol + " not found\n")
+                return None
+            orders.append(Order(quantity=index_details["quantity_per_lot"] * int(ratio), symbol=symbol, token=token,
+                                tradetype=tradetype))
+        self.legs = orders
+        self.quantity_per_lot = index_details["quantity_per_lot"]
+        self.index = index
+        self.expiry = expiry
+
+        return None
+
+    def get_margin_per_lot(self, smartapi: SmartConnect = None, account_id: Optional[str] = None) -> Optional[float]:
+        """
+        Gets the margin required to place one lot of the basket in a single call
+
+        The broker nets the legs, so hedged baskets need far less than the sum of their legs
+
+        Parameters
+        ----------
+        smartapi: SmartConnect, default: None
+            SmartConnect object to connect to Angel One
+        account_id: Optional[str], default: None
+            Account ID of the account asking, used for its rate budget and circuit breaker
+
+        Returns
+        -------
+        Optional[float]:
+            Margin required to place one lot of the basket
+        """
+        if smartapi is None:
+            return None
+        params: Dict = {"positions": [order.to_margin_position() for order in self.legs]}
+        try:
+            data: Optional[Dict] = Retry.call(fn=lambda: smartapi.getMarginApi(params=params)["data"],
+                                              endpoint="margin", account_id=account_id, label="Basket margin")
+        except RetryExhausted:
+            return None
+        if data is None:
+            return None
+
+        margin_per_lot: float = float(data["totalMarginRequired"])
+        self.margin_per_lot = margin_per_lot
+
+        return margin_per_lot
+
+    def largest_leg(self) -> int:
+        """
+        Quantity of the largest leg for one lot of the basket
+        """
+        return max(order.qty for order in self.legs)
+
+    def lots(self, slices: Tuple[Slice, ...] = None) -> int:
+        """
+        Number of baskets in a slice of all legs
+
+        Parameters
+        ----------
+        slices: Tuple[Slice, ...], default: None
+            Slice of every leg, in the order of the legs
+
+        Returns
+        -------
+        int
+        """
+        return slices[0][1] // self.legs[0].qty
+
+    def describe(self) -> str:
+        """
+        Legs as written in a command, such as +22000PE,-2x21800PE
+        """
+        return ",".join(("+" if order.tradetype == "BUY" else "-")
+                        + (str(order.qty // self.quantity_per_lot) + "x" if order.qty != self.quantity_per_lot else "")
+                        + order.symbol[len(self.index + self.expiry):] for order in self.legs)
+
+    def exit_command(self) -> str:
+        """
+        EXIT command of the basket, with the legs as they were entered, as a spread is exited with its entry strike
+        """
+        return "EXIT " + self.index + " " + self.describe() + " " + self.expiry
+
+    def reverse(self) -> None:
+        """
+        Flips every leg, so the basket closes what it opened
+
+        Orders are shared templates, so new orders are created instead of changing them
+        """
+        self.legs = [order.with_tradetype(tradetype="SELL" if order.tradetype == "BUY" else "BUY")
+                     for order in self.legs]
+
+        return None
+
+    @staticmethod
+    def option_type(order: Order = None) -> str:
+        """
+        CE or PE
+
+        Parameters
+        ----------
+        order: Order, default: None
+            Leg of a basket
+
+        Returns
+        -------
+        str
+        """
+        return order.symbol[-2:]
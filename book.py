@@ -0,0 +1,266 @@
+from account import Account
+from metrics import Metrics
+from session import SessionManager
+from rate_limiter import RateLimiter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from time import sleep, time
+import threading
+from logs import log_event
+import logging
+
+
+class Snapshot:
+    """
+    Class to represent the latest known P&L and position state of one account
+
+    ...
+
+    Attributes
+    ----------
+    account_id: str
+        Account ID of the account
+    realised: float
+        Realised P&L across all positions
+    unrealised: float
+        Unrealised P&L across all positions
+    total: float
+        Realised + unrealised P&L
+    positions: Dict[str, Dict]
+        Open and closed positions of the day keyed by trading symbol
+        { "symbol_name": str, "strike": str, "token": str, "quantity": int, "lotsize": int, "realised": float,
+          "unrealised": float }
+    updated_at: Optional[float]
+        Epoch time of the last successful refresh
+    error_count: int
+        Number of failed refreshes since start
+    """
+
+    def __init__(self, account_id: str = None):
+        self.account_id: str = account_id
+        self.realised: float = 0.0
+        self.unrealised: float = 0.0
+        self.total: float = 0.0
+        self.positions: Dict[str, Dict] = {}
+        self.updated_at: Optional[float] = None
+        self.error_count: int = 0
+
+    def age(self) -> Optional[float]:
+        """
+        Seconds since the last successful refresh, None if the account was never refreshed
+        """
+        if self.updated_at is None:
+            return None
+        return time() - self.updated_at
+
+
+class Book:
+    """
+    Shared P&L state of all accounts
+
+    Every consumer (exit rules, dashboards, exporters) reads from the same snapshots instead of making its own
+    position call. Listeners are notified with the snapshot of the account that changed, so a consumer only has to
+    look at the work related to that account.
+
+    ...
+
+    Methods
+    -------
+    refresh(self, account: Account = None) -> bool:
+        Fetches positions of an account once and updates its snapshot
+    get(self, account_id: str = None) -> Optional[Snapshot]:
+        Returns the snapshot of an account
+    subscribe(self, listener: Callable[[Snapshot], None] = None) -> None:
+        Registers a listener called after every successful refresh
+    unsubscribe(self, listener: Callable[[Snapshot], None] = None) -> None:
+        Removes a listener
+    """
+
+    def __init__(self):
+        self.snapshots: Dict[str, Snapshot] = {}
+        self.listeners: List[Callable[[Snapshot], None]] = []
+        self.lock: threading.Lock = threading.Lock()
+
+    def refresh(self, account: Account = None) -> bool:
+        """
+        Fetches positions of an account once and updates its snapshot
+
+        There is no retry here, but the call takes its token from the position budget of the account, shared with
+        every other position call. A failed refresh only increments the error count and leaves the previous snapshot
+        in place, its age tells the reader how stale it is.
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account to refresh
+
+        Returns
+        -------
+        bool:
+            True if the snapshot was refreshed
+        """
+        snapshot: Snapshot = self._snapshot(account_id=account.account_id)
+        try:
+            RateLimiter.acquire(account_id=account.account_id, endpoint="position")
+            position: Optional[List[Dict]] = account.smartapi.position()["data"]
+        except Exception as exp:
+            log_event(event="book_refresh_failed", level=logging.WARNING, exc_info=True, endpoint="position",
+                      account=account.account_id, error=str(exp))
+            Metrics.record_failure(endpoint="position", account_id=account.account_id, exp=exp)
+            SessionManager.report(account_id=account.account_id, exp=exp)
+            with self.lock:
+                snapshot.error_count += 1
+            return False
+        realised: float = 0.0
+        unrealised: float = 0.0
+        positions: Dict[str, Dict] = {}
+        for single_position in position or []:
+            single_realised: float = float(single_position["realised"])
+            single_unrealised: float = float(single_position["unrealised"])
+            realised = realised + single_realised
+            unrealised = unrealised + single_unrealised
+            positions[single_position["tradingsymbol"]] = {
+                "symbol_name": str(single_position["symbolname"]),
+                "strike": str(int(float(single_position["strikeprice"]))) + " " + single_position["optiontype"],
+                "token": str(single_position["symboltoken"]),
+                "quantity": int(single_position["netqty"]),
+                "lotsize": int(single_position["lotsize"]),
+                "realised": single_realised,
+                "unrealised": single_unrealised}
+        with self.lock:
+            snapshot.realised = realised
+            snapshot.unrealised = unrealised
+            snapshot.total = realised + unrealised
+            snapshot.positions = positions
+            snapshot.updated_at = time()
+            listeners: List[Callable[[Snapshot], None]] = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception as exp:
+                log_event(event="book_listener_failed", level=logging.ERROR, exc_info=True, error=str(exp))
+
+        return True
+
+    def get(self, account_id: str = None) -> Optional[Snapshot]:
+        """
+        Returns the snapshot of an account
+
+        Parameters
+        ----------
+        account_id: str, default: None
+            Account ID of the account
+
+        Returns
+        -------
+        Optional[Snapshot]:
+            Latest snapshot, None if the account was never refreshed
+        """
+        with self.lock:
+            return self.snapshots.get(account_id)
+
+    def subscribe(self, listener: Callable[[Snapshot], None] = None) -> None:
+        """
+        Registers a listener called after every successful refresh
+
+        Parameters
+        ----------
+        listener: Callable[[Snapshot], None], default: None
+            Function receiving the refreshed snapshot
+        """
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Snapshot], None] = None) -> None:
+        """
+        Removes a listener
+
+        Parameters
+        ----------
+        listener: Callable[[Snapshot], None], default: None
+            Function registered earlier
+        """
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _snapshot(self, account_id: str = None) -> Snapshot:
+        with self.lock:
+            if account_id not in self.snapshots:
+                self.snapshots[account_id] = Snapshot(account_id=account_id)
+            return self.snapshots[account_id]
+
+
+class BookPoller:
+    """
+    Keeps the book fresh for the accounts somebody is watching
+
+    Accounts are reference counted, so two consumers watching the primary account still cause one position call per
+    cycle. All watched accounts are refreshed concurrently, once per interval.
+
+    ...
+
+    Methods
+    -------
+    watch(self, account: Account = None) -> None:
+        Starts polling an account
+    unwatch(self, account: Account = None) -> None:
+        Stops polling an account once no consumer watches it anymore
+    """
+
+    def __init__(self, book: Book = None, interval: float = 1.0, max_workers: int = 16):
+        self.book: Book = book
+        self.interval: float = interval
+        self.max_workers: int = max_workers
+        self.watched: Dict[str, Account] = {}
+        self.watch_count: Dict[str, int] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def watch(self, account: Account = None) -> None:
+        """
+        Starts polling an account
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account to poll
+        """
+        with self.lock:
+            self.watch_count[account.account_id] = self.watch_count.get(account.account_id, 0) + 1
+            self.watched[account.account_id] = account
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="book-poller")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def unwatch(self, account: Account = None) -> None:
+        """
+        Stops polling an account once no consumer watches it anymore
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account to stop polling
+        """
+        with self.lock:
+            count: int = self.watch_count.get(account.account_id, 0) - 1
+            if count > 0:
+                self.watch_count[account.account_id] = count
+                return None
+            self.watch_count.pop(account.account_id, None)
+            self.watched.pop(account.account_id, None)
+
+        return None
+
+    def _run(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="book") as pool:
+            while True:
+                with self.lock:
+                    accounts: List[Account] = list(self.watched.values())
+                    if not accounts:
+                        self.thread = None
+                        return None
+                list(pool.map(self.book.refresh, accounts))
+                sleep(self.interval)
@@ -1,16 +1,32 @@
-import trade_entry
-import trade_exit
-import trade_auto_exit
-import trade_details
-import trade_pnl
-from typing import List
+from typing import List, Optional, Callable, Dict
 from account import Account
+from book import Book, BookPoller
+from exit_rules import ExitScheduler
+from jobs import Job, JobManager
+from history import HistoryStore
+from market_data import shared_hub
+from time import time
+import constants as Const
+import threading
+
+book: Book = Book()
+poller: BookPoller = BookPoller(book=book)
+book.subscribe(HistoryStore.record_pnl)
+jobs: JobManager = JobManager()
+scheduler: Optional[ExitScheduler] = None
+scheduler_job: Optional[Job] = None
+dashboard_job: Optional[Job] = None
+metrics_job: Optional[Job] = None
 
 
 def driver(command: str = None, accounts: List[Account] = None, my_account: Account = None) -> None:
     """
     This driver is for processing a command and perform necessary actions
 
+    Long lived commands (PNL, DETAILS, AUTOEXIT, RULE, SCHEDULE, MARGIN WATCH and METRICS) run as background jobs on the
+    same logged in accounts, so the prompt is free for the next command. Only one of PNL and DETAILS is shown at a time.
+    The module of a command is imported the first time the command runs, so none of them delays the first prompt.
+
     Parameters
     ----------
     command: str, default: None
@@ -27,15 +43,215 @@ def driver(command: str = None, accounts: List[Account] = None, my_account: Acco
     command = command.strip()
     command_type: str = command.split(' ')[0]
     if command_type == "ENTRY":
+        import trade_entry
         trade_entry.trade_entry(command=command, accounts=accounts, my_account=my_account)
     elif command_type == "EXIT":
+        import trade_exit
         trade_exit.trade_exit(command=command, accounts=accounts)
+    elif command_type == "BASKET":
+        import trade_basket
+        trade_basket.trade_basket(command=command, accounts=accounts, my_account=my_account)
+    elif command_type == "FIX":
+        import trade_fix
+        trade_fix.trade_fix(command=command)
+    elif command_type == "EXITALL":
+        import trade_exit_all
+        trade_exit_all.trade_exit_all(accounts=accounts)
+    elif command_type == "BATCH":
+        import trade_batch
+        trade_batch.trade_batch(command=command, accounts=accounts, my_account=my_account)
+    elif command_type == "SCHEDULE":
+        import trade_schedule
+        trade_schedule.trade_schedule(command=command, accounts=accounts, my_account=my_account, jobs=jobs)
+    elif command_type == "MARGIN":
+        import trade_margin
+        trade_margin.trade_margin(command=command, my_account=my_account, jobs=jobs)
     elif command_type == "AUTOEXIT":
-        trade_auto_exit.trade_auto_exit(command=command, accounts=accounts, my_account=my_account)
+        import trade_auto_exit
+        trade_auto_exit.trade_auto_exit(command=command, accounts=accounts, my_account=my_account,
+                                        scheduler=get_scheduler(accounts=accounts))
+    elif command_type == "RULE" or command_type == "RULES":
+        import trade_rules
+        trade_rules.trade_rules(command=command, accounts=accounts, my_account=my_account,
+                                scheduler=get_scheduler(accounts=accounts))
     elif command_type == "DETAILS":
-        trade_details.details(accounts=accounts, my_account=my_account)
+        import trade_details
+        start_dashboard(name=command, target=trade_details.details,
+                        kwargs={"accounts": accounts, "my_account": my_account, "book": book, "poller": poller})
     elif command_type == "PNL":
-        trade_pnl.pnl(accounts=accounts)
+        import trade_pnl
+        start_dashboard(name=command, target=trade_pnl.pnl,
+                        kwargs={"accounts": accounts, "book": book, "poller": poller})
+    elif command_type == "HISTORY":
+        import trade_history
+        trade_history.trade_history(command=command, my_account=my_account)
+    elif command_type == "QUOTE":
+        import trade_quote
+        trade_quote.trade_quote(command=command,
+                                hub=shared_hub(smartapi=my_account.smartapi, account_id=my_account.account_id))
+    elif command_type == "METRICS":
+        metrics(command=command, accounts=accounts)
+    elif command_type == "JOBS":
+        list_jobs()
+    elif command_type == "STOP":
+        stop(command=command)
     else:
         print("Wrong command\n")
     return None
+
+
+def get_scheduler(accounts: List[Account] = None) -> ExitScheduler:
+    """
+    Returns the exit scheduler, starting it as a job on first use
+
+    Parameters
+    ----------
+    accounts: List[Account], default: None
+        List of accounts to trade
+
+    Returns
+    -------
+    ExitScheduler
+    """
+    global scheduler, scheduler_job
+    if scheduler is None:
+        scheduler = ExitScheduler(book=book, poller=poller, accounts=accounts)
+
+        def finished(job: Job) -> None:
+            global scheduler, scheduler_job
+            scheduler = None
+            scheduler_job = None
+
+        scheduler_job = jobs.start(name="EXIT RULES", target=scheduler.run, on_exit=finished)
+    return scheduler
+
+
+def start_dashboard(name: str = None, target: Callable = None, kwargs: Dict = None) -> None:
+    """
+    Runs a dashboard as a job, replacing the one already shown
+
+    Parameters
+    ----------
+    name: str, default: None
+        Command that started the dashboard
+    target: Callable, default: None
+        Dashboard function accepting a stop_event
+    kwargs: Dict, default: None
+        Arguments of the dashboard function
+    """
+    global dashboard_job
+    if dashboard_job is not None:
+        jobs.stop(job_id=dashboard_job.job_id)
+    dashboard_job = jobs.start(name=name, target=target, kwargs=kwargs)
+
+
+def list_jobs() -> None:
+    """
+    Prints the running jobs
+    """
+    running: List[Job] = jobs.jobs()
+    if not running:
+        print("No running jobs\n")
+        return None
+    for job in running:
+        description: str = job.name
+        if job is scheduler_job and scheduler is not None:
+            description = description + " (" + str(len(scheduler.rules())) + " rules)"
+        print(str(job.job_id) + "\t" + description + "\t" + str(int(time() - job.started_at)) + "s")
+    print("\n")
+    return None
+
+
+def stop(command: str = None) -> None:
+    """
+    Stops a job
+
+    STOP without a job ID closes the dashboard shown by PNL or DETAILS.
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    """
+    global dashboard_job
+    parts: List[str] = command.split()
+    if len(parts) == 1:
+        if dashboard_job is None:
+            print("No dashboard shown\n")
+            return None
+        jobs.stop(job_id=dashboard_job.job_id)
+        dashboard_job = None
+        return None
+    if len(parts) != 2 or not parts[1].isdigit():
+        print("Wrong command\n")
+        return None
+    if not jobs.stop(job_id=int(parts[1])):
+        print("No job " + parts[1] + "\n")
+        return None
+    if dashboard_job is not None and dashboard_job.job_id == int(parts[1]):
+        dashboard_job = None
+    print("Job " + parts[1] + " stopped\n")
+    return None
+
+
+def metrics(command: str = None, accounts: List[Account] = None) -> None:
+    """
+    Starts or stops the local metrics endpoint
+
+    The endpoint runs as a job. While it is up, all accounts are kept in the shared book so scrapes always find P&L
+    and positions at most a second old, without a broker call per scrape.
+
+    Sample commands:
+        METRICS
+        METRICS <port>
+        METRICS STOP
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    """
+    global metrics_job
+    parts: List[str] = command.split()
+    if len(parts) == 2 and parts[1] == "STOP":
+        if metrics_job is None:
+            print("Metrics endpoint is not running\n")
+            return None
+        jobs.stop(job_id=metrics_job.job_id)
+        print("Metrics endpoint stopped\n")
+        return None
+    if metrics_job is not None:
+        print("Metrics endpoint already running as job " + str(metrics_job.job_id) + "\n")
+        return None
+    if len(parts) > 2 or (len(parts) == 2 and not parts[1].isdigit()):
+        print("Wrong command\n")
+        return None
+    port: int = int(parts[1]) if len(parts) == 2 else Const.METRICS_PORT
+    from metrics_server import MetricsServer
+    server: MetricsServer = MetricsServer(book=book, account_ids=[account.account_id for account in accounts],
+                                          port=port)
+    try:
+        server.start()
+    except OSError as exp:
+        print("Could not start metrics endpoint: " + str(exp) + "\n")
+        return None
+
+    def serve(stop_event: threading.Event = None) -> None:
+        for account in accounts:
+            poller.watch(account)
+        try:
+            stop_event.wait()
+        finally:
+            server.stop()
+            for account in accounts:
+                poller.unwatch(account)
+
+    def finished(job: Job) -> None:
+        global metrics_job
+        metrics_job = None
+
+    metrics_job = jobs.start(name=command, target=serve, on_exit=finished)
+    print("Metrics on http://127.0.0.1:" + str(port) + "/metrics and /metrics.json\n")
+    return None
@@ -0,0 +1,150 @@
+from account import Account
+from execute import Execute, order_lock
+from history import HistoryStore
+from order import Order, Slice
+from spread import Spread
+from typing import Callable, Dict, List, Optional, Tuple
+from time import perf_counter, time
+import threading
+
+
+class CommandPlan:
+    """
+    Class to represent the orders of one command, planned before anything is sent
+
+    ...
+
+    Attributes
+    ----------
+    command: str
+        The command
+    accounts: List[Account]
+        Accounts with orders to place
+    order_lists: Dict[str, List[Tuple[Slice, ...]]]
+        Buy-sell slices, or basket slices, of each account keyed by account ID
+    on_fill: Optional[Callable[..., None]]
+        Called every time a spread gets completed
+    finish: Optional[Callable[[], None]]
+        Called once all orders of the command are done
+    filled: int
+        Number of completed spreads
+    elapsed: Optional[float]
+        Seconds taken to place all orders of the command
+    payload_lists: Optional[Dict[str, List[List[Dict]]]]
+        Request payloads built by stage, in the same layout as order_lists
+    first_sent_at: Optional[float]
+        Epoch time when the first order request was sent
+    tag_prefix: str
+        Prefix of the client tags of all orders of the command
+
+    Methods
+    -------
+    add_orders(self, account: Account = None, spread: Spread = None, freeze_quantity: int = None,
+               total_number_of_spreads: Optional[int] = None) -> None:
+        Plans the orders of an account
+    add_slices(self, account: Account = None, order_list: List[Tuple[Slice, ...]] = None) -> None:
+        Adds the buy-sell slices of an account planned elsewhere
+    total_orders(self) -> int:
+        Number of buy-sell pairs planned
+    stage(self) -> None:
+        Builds the request payloads of all orders ahead of time
+    execute(self) -> None:
+        Places all orders of the command and runs its finishing step
+    """
+
+    def __init__(self, command: str = None, on_fill: Optional[Callable[..., None]] = None,
+                 finish: Optional[Callable[[], None]] = None):
+        self.command: str = command
+        self.accounts: List[Account] = []
+        self.order_lists: Dict[str, List[Tuple[Slice, ...]]] = {}
+        self.on_fill: Optional[Callable[..., None]] = on_fill
+        self.finish: Optional[Callable[[], None]] = finish
+        self.filled: int = 0
+        self.elapsed: Optional[float] = None
+        self.payload_lists: Optional[Dict[str, List[List[Dict]]]] = None
+        self.first_sent_at: Optional[float] = None
+        self.tag_prefix: str = Execute.new_tag_prefix(command=command)
+        self.lock: threading.Lock = threading.Lock()
+
+    def add_orders(self, account: Account = None, spread: Spread = None, freeze_quantity: int = None,
+                   total_number_of_spreads: Optional[int] = None) -> None:
+        """
+        Plans the orders of an account
+
+        The orders are built by Account.create_list_of_orders and moved into the plan right away, so plans of
+        different commands do not share account.orders.
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account to plan
+        spread: Spread, default: None
+            Spread to place
+        freeze_quantity: int, default: None
+            Freeze quantity for the current index
+        total_number_of_spreads: Optional[int], default: None
+            Total number of spreads, calculated from the margin if not given
+        """
+        with order_lock:
+            account.create_list_of_orders(spread=spread, freeze_quantity=freeze_quantity,
+                                          total_number_of_spreads=total_number_of_spreads)
+            order_list: List[Tuple[Slice, ...]] = account.orders or []
+            account.orders = None
+        self.add_slices(account=account, order_list=order_list)
+
+    def add_slices(self, account: Account = None, order_list: List[Tuple[Slice, ...]] = None) -> None:
+        """
+        Adds the buy-sell slices of an account planned elsewhere
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account to plan
+        order_list: List[Tuple[Slice, ...]], default: None
+            Buy-sell slices of the account
+        """
+        self.accounts.append(account)
+        self.order_lists[account.account_id] = order_list
+
+    def total_orders(self) -> int:
+        """
+        Number of buy-sell pairs planned
+        """
+        return sum(len(order_list) for order_list in self.order_lists.values())
+
+    def stage(self) -> None:
+        """
+        Builds the request payloads of all orders ahead of time
+
+        Once staged, executing the plan only sends requests
+        """
+        self.payload_lists = {}
+        for account_id, order_list in self.order_lists.items():
+            self.payload_lists[account_id] = [
+                [order.to_payload(quantity=quantity, tag=tag)
+                 for (order, quantity), tag in zip(slices, Execute.leg_tags(
+                     tag=Execute.order_tag(tag_prefix=self.tag_prefix, position=position), slices=slices))]
+                for position, slices in enumerate(order_list)]
+
+    def execute(self) -> None:
+        """
+        Places all orders of the command and runs its finishing step
+        """
+        started_at: float = perf_counter()
+        HistoryStore.record_command(tag_prefix=self.tag_prefix, command=self.command)
+        Execute.place_order(accounts=self.accounts, on_fill=self._filled, order_lists=self.order_lists,
+                            payload_lists=self.payload_lists, on_send=self._sent, tag_prefix=self.tag_prefix)
+        self.elapsed = perf_counter() - started_at
+        if self.finish is not None:
+            self.finish()
+
+    def _sent(self, account: Account, order: Order) -> None:
+        with self.lock:
+            if self.first_sent_at is None:
+                self.first_sent_at = time()
+
+    def _filled(self, account: Account, *slices: Slice) -> None:
+        with self.lock:
+            self.filled += 1
+        if self.on_fill is not None:
+            self.on_fill(account, *slices)
@@ -0,0 +1,196 @@
+from typing import Callable, List, Optional
+import threading
+import codecs
+import queue
+import os
+
+# Lines written with one fsync at most
+COMMIT_SIZE: int = 1000
+# Seconds the writer waits for a line before checking whether it was stopped
+COMMIT_WAIT: float = 0.2
+
+
+class Commit:
+    """
+    Class to represent one line waiting to be written
+
+    ...
+
+    Attributes
+    ----------
+    line: str
+        The line, with its newline
+    done: threading.Event
+        Set once the line is written and synced, or given up
+
+    Methods
+    -------
+    wait(self, timeout: Optional[float] = None) -> bool:
+        Waits for the line and tells whether it was written
+    """
+
+    def __init__(self, line: str = None):
+        self.line: str = line
+        self.done: threading.Event = threading.Event()
+        self.written: bool = False
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the line and tells whether it was written
+
+        Parameters
+        ----------
+        timeout: Optional[float], default: None
+            Seconds to wait at most, no limit if None
+
+        Returns
+        -------
+        bool:
+            False if the line was given up, or is still waiting after the timeout
+        """
+        return self.done.wait(timeout=timeout) and self.written
+
+
+class CommitWriter(threading.Thread):
+    """
+    Single thread appending lines to a file, every batch made durable with one fsync
+
+    Every line waiting on the queue is written and synced together, so a caller which needs its line on disk waits
+    for at most one fsync, shared with every caller appending at the same time. The file is opened for each batch under
+    the lock given, so it can be rewritten between two batches. If the file cannot be written, on_error is called with
+    the exception, the writer stops and every line waiting is given up, so callers never wait for a commit that never
+    comes.
+
+    ...
+
+    Attributes
+    ----------
+    error: Optional[str]
+        Error which stopped the writer, None while it writes
+
+    Methods
+    -------
+    append(self, line: str = None) -> Commit:
+        Queues a line to be written
+    sync(self) -> bool:
+        Waits until every line queued before is written
+    run(self) -> None:
+        Commits lines until stopped or the file cannot be written
+    alive(self) -> bool:
+        True while lines are still written
+    stop(self) -> None:
+        Commits what is left and stops
+    """
+
+    def __init__(self, name: str = None, path: Callable[[], str] = None, lock: Optional[threading.Lock] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None):
+        super().__init__(name=name, daemon=True)
+        self.path: Callable[[], str] = path
+        self.lock: threading.Lock = lock or threading.Lock()
+        self.on_error: Optional[Callable[[Exception], None]] = on_error
+        self.entries: queue.SimpleQueue = queue.SimpleQueue()
+        self.stop_event: threading.Event = threading.Event()
+        self.error: Optional[str] = None
+
+    def append(self, line: str = None) -> Commit:
+        """
+        Queues a line to be written
+
+        Parameters
+        ----------
+        line: str, default: None
+            The line, with its newline
+
+        Returns
+        -------
+        Commit
+        """
+        commit: Commit = Commit(line=line)
+        if not self.alive():
+            commit.done.set()
+            return commit
+        self.entries.put(commit)
+        if not self.alive():
+            # The writer may have stopped after the check, and before the line was queued
+            self._give_up()
+        return commit
+
+    def sync(self) -> bool:
+        """
+        Waits until every line queued before is written
+
+        Returns
+        -------
+        bool:
+            False if the writer stopped on an error
+        """
+        return self.append(line="").wait()
+
+    def run(self) -> None:
+        try:
+            while not self.stop_event.is_set():
+                self._commit(batch=self._next_batch(wait=COMMIT_WAIT))
+            self._commit(batch=self._next_batch(wait=0))
+        except Exception as exp:
+            self.error = str(exp)
+            if self.on_error is not None:
+                self.on_error(exp)
+            self._give_up()
+
+    def alive(self) -> bool:
+        """
+        True while lines are still written
+        """
+        return self.error is None and self.is_alive()
+
+    def stop(self) -> None:
+        """
+        Commits what is left and stops
+        """
+        self.stop_event.set()
+        self.join(timeout=5)
+
+    def _next_batch(self, wait: float = None) -> List[Commit]:
+        batch: List[Commit] = []
+        try:
+            batch.append(self.entries.get(timeout=wait) if wait else self.entries.get_nowait())
+            while len(batch) < COMMIT_SIZE:
+                batch.append(self.entries.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _commit(self, batch: List[Commit] = None) -> None:
+        if not batch:
+            return None
+        try:
+            with self.lock:
+                path: str = self.path()
+                # Keeps the first line of the batch off a line left partial by a crash
+                partial: bool = os.path.exists(path) and os.path.getsize(path) > 0 and not _ends_with_newline(path)
+                commit_file = codecs.open(path, "a", encoding="utf-8")
+                try:
+                    commit_file.write(("\n" if partial else "") + "".join(commit.line for commit in batch))
+                    commit_file.flush()
+                    os.fsync(commit_file.fileno())
+                finally:
+                    commit_file.close()
+            for commit in batch:
+                commit.written = True
+        finally:
+            for commit in batch:
+                commit.done.set()
+
+    def _give_up(self) -> None:
+        while True:
+            batch: List[Commit] = self._next_batch(wait=0)
+            if not batch:
+                break
+            for commit in batch:
+                commit.done.set()
+
+
+def _ends_with_newline(path: str = None) -> bool:
+    with open(path, "rb") as commit_file:
+        commit_file.seek(-1, os.SEEK_END)
+        return commit_file.read(1) == b"\n"
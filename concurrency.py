@@ -0,0 +1,174 @@
+from metrics import Metrics, is_rate_limited, is_server_error
+from rate_limiter import RATE_LIMITS
+from typing import Dict, Optional, Tuple
+from time import monotonic
+import threading
+
+# Requests of one account and endpoint in flight at start, the fixed window used before
+INITIAL_LIMIT: float = 6.0
+MIN_LIMIT: float = 1.0
+# Widest window of endpoints without a rate limit, the others stop at their requests per second
+DEFAULT_MAX_LIMIT: float = 20.0
+# Seconds within which a response counts as healthy
+LATENCY_TARGET: float = 0.5
+# Share of the window kept after a rate-limit or server error
+DECREASE_FACTOR: float = 0.5
+# Seconds after a decrease in which further errors, from requests already in flight, do not shrink it again
+DECREASE_INTERVAL: float = 1.0
+
+windows: Dict[Tuple[Optional[str], str], "Window"] = {}
+window_lock: threading.Lock = threading.Lock()
+
+
+class Window:
+    """
+    Class to represent the requests of one account and endpoint allowed in flight
+
+    The limit grows by one every time a full window of healthy responses comes back, and is halved on a rate-limit
+    or server error. Slow responses stop the growth. Other errors leave it as it is.
+
+    ...
+
+    Attributes
+    ----------
+    account_id: Optional[str]
+        Account ID of the account, None for calls not tied to one
+    endpoint: str
+        Name of the broker call
+    limit: float
+        Requests allowed in flight, the integer part is used
+    max_limit: float
+        Widest the window can get
+    in_flight: int
+        Requests sent and not answered yet
+    decreased_at: float
+        Monotonic time of the last decrease
+    """
+
+    def __init__(self, account_id: Optional[str] = None, endpoint: str = None):
+        self.account_id: Optional[str] = account_id
+        self.endpoint: str = endpoint
+        self.max_limit: float = RATE_LIMITS.get(endpoint, DEFAULT_MAX_LIMIT)
+        self.limit: float = min(INITIAL_LIMIT, self.max_limit)
+        self.in_flight: int = 0
+        self.decreased_at: float = 0.0
+        self.condition: threading.Condition = threading.Condition()
+
+    def size(self) -> int:
+        """
+        Requests allowed in flight right now
+        """
+        return max(int(MIN_LIMIT), int(self.limit))
+
+
+class ConcurrencyControl:
+    """
+    Adaptive limit of the broker requests of every account and endpoint in flight
+
+    Every broker call takes a slot of its window for the time of the request and returns it with how the request
+    went, AIMD style: the window widens while latencies and errors stay healthy and halves as soon as the broker
+    throttles or fails, so each account sends as much as the broker takes at the moment instead of a fixed guess.
+    Limits are exported as the concurrency_limit gauge.
+
+    ...
+
+    Methods
+    -------
+    acquire(account_id: Optional[str] = None, endpoint: str = None) -> None:
+        Waits for a free slot of the window
+    release(account_id: Optional[str] = None, endpoint: str = None, latency: float = None,
+            exp: Optional[Exception] = None) -> None:
+        Frees a slot and adapts the window to the response
+    size(account_id: Optional[str] = None, endpoint: str = None) -> int:
+        Requests currently allowed in flight
+    """
+
+    @staticmethod
+    def acquire(account_id: Optional[str] = None, endpoint: str = None) -> None:
+        """
+        Waits for a free slot of the window
+
+        Parameters
+        ----------
+        account_id: Optional[str], default: None
+            Account ID of the account sending the request
+        endpoint: str, default: None
+            Name of the broker call
+        """
+        window: Window = _window(account_id=account_id, endpoint=endpoint)
+        with window.condition:
+            while window.in_flight >= window.size():
+                window.condition.wait()
+            window.in_flight += 1
+
+    @staticmethod
+    def release(account_id: Optional[str] = None, endpoint: str = None, latency: float = None,
+                exp: Optional[Exception] = None) -> None:
+        """
+        Frees a slot and adapts the window to the response
+
+        Parameters
+        ----------
+        account_id: Optional[str], default: None
+            Account ID of the account that sent the request
+        endpoint: str, default: None
+            Name of the broker call
+        latency: float, default: None
+            Seconds the request took
+        exp: Optional[Exception], default: None
+            Exception raised by the request, None if it succeeded
+        """
+        window: Window = _window(account_id=account_id, endpoint=endpoint)
+        with window.condition:
+            window.in_flight -= 1
+            previous: int = window.size()
+            if exp is not None and (is_rate_limited(exp=exp) or is_server_error(exp=exp)):
+                now: float = monotonic()
+                if now - window.decreased_at >= DECREASE_INTERVAL:
+                    window.limit = max(MIN_LIMIT, window.limit * DECREASE_FACTOR)
+                    window.decreased_at = now
+            elif exp is None and latency <= LATENCY_TARGET:
+                window.limit = min(window.max_limit, window.limit + 1.0 / window.limit)
+            window.condition.notify_all()
+            size: int = window.size()
+        if size != previous:
+            Metrics.set(name="concurrency_limit", labels=_labels(account_id=account_id, endpoint=endpoint),
+                        value=size)
+
+    @staticmethod
+    def size(account_id: Optional[str] = None, endpoint: str = None) -> int:
+        """
+        Requests currently allowed in flight
+
+        Parameters
+        ----------
+        account_id: Optional[str], default: None
+            Account ID of the account
+        endpoint: str, default: None
+            Name of the broker call
+
+        Returns
+        -------
+        int
+        """
+        window: Window = _window(account_id=account_id, endpoint=endpoint)
+        with window.condition:
+            return window.size()
+
+
+def _window(account_id: Optional[str] = None, endpoint: str = None) -> Window:
+    with window_lock:
+        window: Optional[Window] = windows.get((account_id, endpoint))
+        if window is None:
+            window = Window(account_id=account_id, endpoint=endpoint)
+            windows[(account_id, endpoint)] = window
+            Metrics.set(name="concurrency_limit", labels=_labels(account_id=account_id, endpoint=endpoint),
+                        value=window.size())
+        return window
+
+
+def _labels(account_id: Optional[str] = None, endpoint: str = None) -> Dict[str, str]:
+    labels: Dict[str, str] = {"endpoint": endpoint}
+    if account_id is not None:
+        labels["account"] = str(account_id)
+    return labels
@@ -0,0 +1,123 @@
+from typing import Dict, List, Optional, Tuple
+import threading
+import queue
+
+# Seconds between two renders of the status line
+RENDER_INTERVAL: float = 0.5
+
+# (what is failing, account ID) -> attempt
+statuses: Dict[Tuple[str, Optional[str]], int] = {}
+messages: queue.SimpleQueue = queue.SimpleQueue()
+console_lock: threading.Lock = threading.Lock()
+renderer: Optional[threading.Thread] = None
+
+
+class Console:
+    """
+    Status lines of background threads, printed by a single thread
+
+    Threads only record what they are doing. One renderer thread prints a single line summarising everything that is
+    failing whenever it changes, and the one-off messages in the order they came, so hundreds of threads retrying at
+    once produce one line instead of hundreds.
+
+    ...
+
+    Methods
+    -------
+    status(what: str = None, account_id: Optional[str] = None, attempt: int = None) -> None:
+        Records that a call of an account is being retried
+    clear(what: str = None, account_id: Optional[str] = None, message: Optional[str] = None) -> None:
+        Records that a call is no longer being retried
+    message(text: str = None) -> None:
+        Prints a message from the renderer thread
+    """
+
+    @staticmethod
+    def status(what: str = None, account_id: Optional[str] = None, attempt: int = None) -> None:
+        """
+        Records that a call of an account is being retried
+
+        Parameters
+        ----------
+        what: str, default: None
+            Name of the call
+        account_id: Optional[str], default: None
+            Account ID of the account, None if the call is not tied to one
+        attempt: int, default: None
+            Number of the failed attempt
+        """
+        _start()
+        with console_lock:
+            statuses[(what, account_id)] = attempt
+
+    @staticmethod
+    def clear(what: str = None, account_id: Optional[str] = None, message: Optional[str] = None) -> None:
+        """
+        Records that a call is no longer being retried
+
+        Parameters
+        ----------
+        what: str, default: None
+            Name of the call
+        account_id: Optional[str], default: None
+            Account ID of the account, None if the call is not tied to one
+        message: Optional[str], default: None
+            Printed once the status is removed
+        """
+        with console_lock:
+            removed: bool = statuses.pop((what, account_id), None) is not None
+        if removed and message is not None:
+            Console.message(text=message)
+
+    @staticmethod
+    def message(text: str = None) -> None:
+        """
+        Prints a message from the renderer thread
+
+        Parameters
+        ----------
+        text: str, default: None
+            Message to print
+        """
+        _start()
+        messages.put(text)
+
+
+def _start() -> None:
+    global renderer
+    if renderer is not None:
+        return None
+    with console_lock:
+        if renderer is None:
+            renderer = threading.Thread(target=_render, name="console", daemon=True)
+            renderer.start()
+
+
+def _summary() -> str:
+    with console_lock:
+        current: List[Tuple[str, Optional[str]]] = list(statuses.keys())
+    if not current:
+        return ""
+    accounts_by_call: Dict[str, int] = {}
+    for what, _ in current:
+        accounts_by_call[what] = accounts_by_call.get(what, 0) + 1
+    return "Retrying: " + ", ".join(what + " (" + str(count) + ")" for what, count in sorted(accounts_by_call.items()))
+
+
+def _render() -> None:
+    shown: str = ""
+    while True:
+        try:
+            text: str = messages.get(timeout=RENDER_INTERVAL)
+            print(text)
+            while True:
+                print(messages.get_nowait())
+        except queue.Empty:
+            pass
+        summary: str = _summary()
+        if summary != shown:
+            if summary:
+                print(summary)
+            elif shown:
+                print("Retrying: none")
+            shown = summary
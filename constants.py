@@ -3,3 +3,13 @@ PROFILE_FETCHING_EXCEPTION = "profile_fetching_exception"
 TOKEN_GENERATION_EXCEPTION = "token_generation_exception"
 RMS_EXCEPTION = "rms_exception"
 PLACE_ORDER_FULL_RESPONSE_EXCEPTION = "place_order_full_response_exception"
+METRICS_PORT = 9108
+MARGIN_TTL = 15.0
+MARGIN_REFRESH_INTERVAL = 5.0
+FUNDS_DEADLINE = 2.0
+# Seconds before a broker request times out, short since placing an order again is safe
+REQUEST_TIMEOUT = 3
+# The broker accepts client order tags of up to 20 characters
+ORDER_TAG_LENGTH = 14
+# Order tags start with a prefix of this length identifying the command
+TAG_PREFIX_LENGTH = 8
@@ -0,0 +1,218 @@
+from account import Account
+from book import Book, BookPoller, Snapshot
+from typing import Dict, List, Optional, Set, Tuple
+from time import sleep
+import threading
+import shutil
+import sys
+
+PROMPT_LINES: int = 10
+
+
+class Dashboard:
+    """
+    Full screen table that only redraws the cells which changed
+
+    The table is drawn at the top of the terminal and a scroll region is set below it, so the command prompt and any
+    other output keep scrolling underneath while the table stays in place. Every frame is compared cell by cell with
+    the previous one and only the changed cells are written, with the cursor saved and restored around the write so
+    whatever the operator is typing is not disturbed. No subprocess is spawned.
+
+    ...
+
+    Methods
+    -------
+    open(self) -> None:
+        Reserves the top of the terminal for the table
+    render(self, header: List[str] = None, rows: List[List[str]] = None) -> None:
+        Draws a frame, writing only the cells which differ from the last frame
+    close(self) -> None:
+        Gives the whole terminal back to the prompt
+    capacity(self) -> int:
+        Number of table rows which fit on the screen
+    """
+
+    def __init__(self, columns: List[Tuple[str, int]] = None, header_lines: int = 4):
+        self.columns: List[Tuple[str, int]] = columns
+        self.header_lines: int = header_lines
+        self.offsets: List[int] = []
+        offset: int = 1
+        for _, width in columns:
+            self.offsets.append(offset)
+            offset = offset + width + 1
+        self.previous: Dict[Tuple[int, int], str] = {}
+        self.height: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def capacity(self) -> int:
+        """
+        Number of table rows which fit on the screen
+        """
+        lines: int = shutil.get_terminal_size((120, 40)).lines
+        return max(1, lines - PROMPT_LINES - self.header_lines - 1)
+
+    def open(self) -> None:
+        """
+        Reserves the top of the terminal for the table
+        """
+        self.height = self.header_lines + 1 + self.capacity()
+        lines: int = shutil.get_terminal_size((120, 40)).lines
+        with self.lock:
+            self.previous = {}
+            sys.stdout.write("\033[2J\033[" + str(self.height + 1) + ";" + str(lines) + "r"
+                             + "\033[" + str(lines) + ";1H")
+            sys.stdout.flush()
+
+    def render(self, header: List[str] = None, rows: List[List[str]] = None) -> None:
+        """
+        Draws a frame, writing only the cells which differ from the last frame
+
+        Parameters
+        ----------
+        header: List[str], default: None
+            Lines printed above the table
+        rows: List[List[str]], default: None
+            Table rows, one string per column
+        """
+        cells: Dict[Tuple[int, int], str] = {}
+        for line_number, line in enumerate(header[:self.header_lines]):
+            cells[(line_number + 1, 0)] = line
+        title: List[str] = [name for name, _ in self.columns]
+        for row_number, row in enumerate([title] + rows[:self.height - self.header_lines - 1]):
+            for column_number, value in enumerate(row):
+                cells[(self.header_lines + 1 + row_number, column_number)] = value
+        output: List[str] = []
+        for key in set(cells) | set(self.previous):
+            value: str = cells.get(key, "")
+            if self.previous.get(key) == value:
+                continue
+            line_number, column_number = key
+            if column_number == 0 and line_number <= self.header_lines:
+                output.append("\033[" + str(line_number) + ";1H\033[2K" + value)
+                continue
+            width: int = self.columns[column_number][1]
+            output.append("\033[" + str(line_number) + ";" + str(self.offsets[column_number]) + "H"
+                          + value[:width].ljust(width))
+        self.previous = {key: value for key, value in cells.items() if value != ""}
+        if not output:
+            return None
+        with self.lock:
+            sys.stdout.write("\0337" + "".join(output) + "\0338")
+            sys.stdout.flush()
+
+        return None
+
+    def close(self) -> None:
+        """
+        Gives the whole terminal back to the prompt
+        """
+        with self.lock:
+            sys.stdout.write("\033[r\033[2J\033[H")
+            sys.stdout.flush()
+        self.previous = {}
+
+
+def monitor(accounts: List[Account] = None, my_account: Optional[Account] = None, book: Book = None,
+            poller: BookPoller = None, stop_event: threading.Event = None, verify: bool = False) -> None:
+    """
+    Shows P&L, positions, data age and API error counts of all accounts until stopped
+
+    All accounts are polled through the shared book, so the data is also available to exit rules and other readers
+    without extra position calls. When there are more accounts than rows on the screen, the accounts with the lowest
+    P&L are shown.
+
+    Parameters
+    ----------
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Optional[Account], default: None
+        My primary trading account, its positions are the reference when verify is set
+    book: Book, default: None
+        Shared P&L state
+    poller: BookPoller, default: None
+        Poller keeping the book fresh
+    stop_event: threading.Event, default: None
+        Set to stop the dashboard
+    verify: bool, default: False
+        Compares the positions of every account with the primary account
+    """
+    columns: List[Tuple[str, int]] = [("Account ID", 10), ("Realised", 11), ("Unrealised", 11), ("P&L", 11),
+                                      ("Positions", 44), ("Match", 5), ("Age", 5), ("Errors", 6)]
+    dashboard: Dashboard = Dashboard(columns=columns)
+    for account in accounts:
+        poller.watch(account)
+    dashboard.open()
+    try:
+        while not stop_event.is_set():
+            header, rows = _frame(accounts=accounts, my_account=my_account, book=book, verify=verify,
+                                  capacity=dashboard.capacity())
+            dashboard.render(header=header, rows=rows)
+            sleep(0.5)
+    finally:
+        for account in accounts:
+            poller.unwatch(account)
+        dashboard.close()
+
+    return None
+
+
+def _frame(accounts: List[Account] = None, my_account: Optional[Account] = None, book: Book = None,
+           verify: bool = False, capacity: int = 0) -> (List[str], List[List[str]]):
+    total_realised: float = 0.0
+    total_unrealised: float = 0.0
+    incomplete_trades: int = 0
+    stale: int = 0
+    errors: int = 0
+    reference: Optional[Set[Tuple[str, str, bool]]] = None
+    if verify and my_account is not None:
+        primary: Optional[Snapshot] = book.get(account_id=my_account.account_id)
+        if primary is not None and primary.updated_at is not None:
+            reference = _signature(snapshot=primary)
+    snapshots: List[Tuple[Account, Optional[Snapshot]]] = []
+    matches: Dict[str, str] = {}
+    for account in accounts:
+        snapshot: Optional[Snapshot] = book.get(account_id=account.account_id)
+        snapshots.append((account, snapshot))
+        if snapshot is not None:
+            errors += snapshot.error_count
+        if snapshot is None or snapshot.updated_at is None:
+            stale += 1
+            continue
+        total_realised += snapshot.realised
+        total_unrealised += snapshot.unrealised
+        if snapshot.age() > 5:
+            stale += 1
+        if reference is not None:
+            matches[account.account_id] = "OK" if _signature(snapshot=snapshot) == reference else "NO"
+            if matches[account.account_id] == "NO":
+                incomplete_trades += 1
+    snapshots.sort(key=lambda item: item[1].total if item[1] is not None else 0.0)
+    rows: List[List[str]] = []
+    for account, snapshot in snapshots[:capacity]:
+        account_id: str = "*****" + str(account.account_id)[-3:]
+        if snapshot is None or snapshot.updated_at is None:
+            rows.append([account_id, "-", "-", "-", "waiting for data", "-", "-",
+                         str(snapshot.error_count if snapshot is not None else 0)])
+            continue
+        positions: List[str] = [("+" if position["quantity"] > 0 else "") + str(position["quantity"]) + " "
+                                + position["symbol_name"] + " " + position["strike"]
+                                for position in snapshot.positions.values() if position["quantity"] != 0]
+        rows.append([account_id, str(round(snapshot.realised, 2)), str(round(snapshot.unrealised, 2)),
+                     str(round(snapshot.total, 2)), ", ".join(positions) or "no position",
+                     matches.get(account.account_id, "-"), str(int(snapshot.age())) + "s",
+                     str(snapshot.error_count)])
+    header: List[str] = ["Total realised: Rs " + str(round(total_realised, 2))
+                         + "    Total unrealised: Rs " + str(round(total_unrealised, 2))
+                         + "    Total p&l: Rs " + str(round(total_realised + total_unrealised, 2)),
+                         "Accounts: " + str(len(accounts)) + "    Stale: " + str(stale)
+                         + "    API errors: " + str(errors),
+                         "Incomplete trades: " + str(incomplete_trades) if reference is not None else "",
+                         "Showing " + str(len(rows)) + " of " + str(len(accounts))
+                         + " accounts, lowest P&L first. STOP to close."]
+
+    return header, rows
+
+
+def _signature(snapshot: Snapshot = None) -> Set[Tuple[str, str, bool]]:
+    return {(position["symbol_name"], position["strike"], position["quantity"] > 0)
+            for position in snapshot.positions.values() if position["quantity"] != 0}
@@ -1,13 +1,48 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Callable, Set, Tuple
 from SmartApi import SmartConnect
-from order import Order
+from order import Order, Slice
+from basket import Basket
 from account import Account
+from metrics import Metrics
+from retry import Retry, RetryExhausted
+from rate_limiter import RateLimiter
+from concurrency import ConcurrencyControl
+import constants as Const
+from logs import log_event
+from journal import Journal
+from history import HistoryStore
 import threading
-from time import sleep
-import logging
-import sys
+from time import sleep, perf_counter, time
+import hashlib
+import uuid
 
-log = logging.getLogger()
+# Orders are planned into account.orders, so planning of two commands must not overlap
+order_lock: threading.Lock = threading.Lock()
+
+# Legs of a slice and the revert of its buying leg, appended to the tag of the slice
+LEG_TAGS: Dict[str, str] = {"buy": "B", "sell": "S", "revert": "R"}
+
+# Seconds between two checks for a free slot in the window of pairs in flight
+WINDOW_POLL: float = 0.05
+
+# Order statuses after which an order does not change any more
+FINAL_STATUSES: Tuple[str, ...] = ("complete", "rejected", "cancelled")
+# Seconds between two reads of the status of an order, doubled after every read up to the longest wait
+ORDER_POLL: float = 0.1
+ORDER_POLL_MAX: float = 1.0
+
+# Seed shared by all worker processes of a sharded run, and the tag prefixes made from it per command
+tag_seed: Optional[str] = None
+tag_counts: Dict[str, int] = {}
+tag_lock: threading.Lock = threading.Lock()
+
+# Last order book read of each account, with the time the read started, shared by the legs looking up their tags
+order_books: Dict[str, Tuple[float, Dict[str, Dict]]] = {}
+order_book_locks: Dict[str, threading.Lock] = {}
+order_book_lock: threading.Lock = threading.Lock()
+
+# perf_counter time the last order request of any command was sent
+last_sent_at: float = 0.0
 
 
 class Execute:
@@ -18,23 +53,53 @@ class Execute:
 
     Methods
     -------
-    place_order(accounts=None) -> None:
+    place_order(accounts: List[Account] = None, on_fill: Optional[Callable] = None,
+                order_lists: Optional[Dict[str, List]] = None, payload_lists: Optional[Dict[str, List]] = None,
+                on_send: Optional[Callable] = None, tag_prefix: Optional[str] = None) -> None:
         Places order for all accounts one by one
-    place_order_for_one_account(account: Account = None) -> None:
+    place_order_for_one_account(account: Account = None, on_fill: Optional[Callable] = None,
+                                order_list: Optional[List] = None, payload_list: Optional[List] = None,
+                                on_send: Optional[Callable] = None, tag_prefix: Optional[str] = None) -> None:
         Places orders for one particular account
-    place_spread(b_order: Order = None, s_order: Order = None, account: Account = None) -> bool:
+    place_spread(b_slice: Slice = None, s_slice: Slice = None, account: Account = None,
+                 on_fill: Optional[Callable] = None, payloads: Optional[List[Dict]] = None,
+                 on_send: Optional[Callable] = None, tag: Optional[str] = None) -> bool:
         Places spread order and returns status of placed spread if any
-    place_leg(order: Order = None, account: Account = None) -> (str, str):
+    place_basket(slices: Tuple[Slice, ...] = None, account: Account = None, on_fill: Optional[Callable] = None,
+                 payloads: Optional[List[Dict]] = None, on_send: Optional[Callable] = None,
+                 tag: Optional[str] = None) -> bool:
+        Places all legs of a basket, hedges first, and returns True if all of them got completed
+    place_leg(order: Order = None, account: Account = None, quantity: Optional[int] = None,
+              payload: Optional[Dict] = None, on_send: Optional[Callable] = None, tag: Optional[str] = None)
+              -> (str, str):
         Places any leg of any strategy
-    revert_order(unique_orderid: str = None, account: Account = None) -> bool:
+    revert_order(unique_orderid: str = None, account: Account = None, tag: Optional[str] = None) -> bool:
         Reverts any previous completed order
+    new_tag_prefix(command: str = None) -> str:
+        Creates the prefix of the order tags of one command
+    seed_tag_prefixes(seed: Optional[str] = None) -> None:
+        Makes the tag prefixes of the next commands depend only on a seed
+    order_tag(tag_prefix: str = None, position: int = None, leg: str = None) -> str:
+        Client order tag of one leg of one slice
+    leg_tags(tag: str = None, slices: Tuple[Slice, ...] = None) -> List[str]:
+        Client order tags of all legs of one slice
+    is_spread(slices: Tuple[Slice, ...] = None) -> bool:
+        True if the slices are the buying and selling legs of a spread
+    find_order(account: Account = None, tag: str = None, since: Optional[float] = None) -> Optional[Dict]:
+        Looks up an order by its tag in the order book of the account
+    last_sent() -> float:
+        perf_counter time the last order request was sent
     """
 
     def __init__(self):
         pass
 
     @staticmethod
-    def place_order(accounts: List[Account] = None) -> None:
+    def place_order(accounts: List[Account] = None, on_fill: Optional[Callable[..., None]] = None,
+                    order_lists: Optional[Dict[str, List[Tuple[Slice, ...]]]] = None,
+                    payload_lists: Optional[Dict[str, List[List[Dict]]]] = None,
+                    on_send: Optional[Callable[[Account, Order], None]] = None,
+                    tag_prefix: Optional[str] = None) -> None:
         """
         Places order for all accounts one by one.
 
@@ -45,11 +110,32 @@ class Execute:
         ---------
         accounts : List[Account], default: None
             List of accounts where orders have to be placed
+        on_fill : Optional[Callable[..., None]], default: None
+            Called with the account and all slices every time a spread or basket gets completed
+        order_lists : Optional[Dict[str, List[Tuple[Slice, ...]]]], default: None
+            Orders of each account keyed by account ID, account.orders is used if not given
+        payload_lists : Optional[Dict[str, List[List[Dict]]]], default: None
+            Request payloads built ahead of time, in the same layout as order_lists
+        on_send : Optional[Callable[[Account, Order], None]], default: None
+            Called right before an order request is sent
+        tag_prefix : Optional[str], default: None
+            Prefix of the order tags, a new one is created if not given
         """
+        if tag_prefix is None:
+            tag_prefix = Execute.new_tag_prefix()
         all_threads: List[threading.Thread] = []
         for account in accounts:
+            order_list: Optional[List[Tuple[Slice, ...]]] = account.orders
+            if order_lists is not None:
+                order_list = order_lists.get(account.account_id)
+            payload_list: Optional[List[List[Dict]]] = None
+            if payload_lists is not None:
+                payload_list = payload_lists.get(account.account_id)
             thread: threading.Thread = threading.Thread(target=Execute.place_order_for_one_account,
-                                                        kwargs={"account": account},
+                                                        kwargs={"account": account, "on_fill": on_fill,
+                                                                "order_list": order_list,
+                                                                "payload_list": payload_list,
+                                                                "on_send": on_send, "tag_prefix": tag_prefix},
                                                         name="")
             all_threads.append(thread)
         for thread in all_threads:
@@ -59,43 +145,65 @@ class Execute:
             thread.join()
 
     @staticmethod
-    def place_order_for_one_account(account: Account = None) -> None:
+    def place_order_for_one_account(account: Account = None,
+                                    on_fill: Optional[Callable[..., None]] = None,
+                                    order_list: Optional[List[Tuple[Slice, ...]]] = None,
+                                    payload_list: Optional[List[List[Dict]]] = None,
+                                    on_send: Optional[Callable[[Account, Order], None]] = None,
+                                    tag_prefix: Optional[str] = None) -> None:
         """
         Places orders for one particular account.
 
-        Each buy-sell pair is assigned a single thread for placing order. Since api limit is 20 per second and each
-        pair can have at max 3 orders in a very short span of time, a max of 6 pairs is allowed to be executed in one
-        batch of threads.
+        Each buy-sell pair, or basket slice, is assigned a single thread for placing order. As many pairs are in flight
+        as the adaptive window of the account's order requests allows, a new pair starting as soon as one finishes, so
+        the account sends more while the broker answers fast and less once it throttles. Requests are also taken from
+        the account's shared rate budget, so several commands running together stay within the limit.
 
         Parameters
         ----------
         account : Account, default: None
             Account where order has to be placed
+        on_fill : Optional[Callable[..., None]], default: None
+            Called with the account and all slices every time a spread or basket gets completed
+        order_list : Optional[List[Tuple[Slice, ...]]], default: None
+            Buy-sell pairs or basket slices to place, account.orders is used if not given
+        payload_list : Optional[List[List[Dict]]], default: None
+            Request payloads of the pairs built ahead of time
+        on_send : Optional[Callable[[Account, Order], None]], default: None
+            Called right before an order request is sent
+        tag_prefix : Optional[str], default: None
+            Prefix of the order tags, a new one is created if not given
         """
-        order_list: Optional[list[[Order, Order]]] = account.orders
+        if tag_prefix is None:
+            tag_prefix = Execute.new_tag_prefix()
+        if order_list is None:
+            order_list = account.orders
         all_threads: List[threading.Thread] = []
         if order_list is None:
             return None
-        for order in order_list:
-            b_order: Order = order[0]
-            s_order: Order = order[1]
-            thread: threading.Thread = threading.Thread(target=Execute.place_spread,
-                                      kwargs={"b_order": b_order, "s_order": s_order, "account": account},
-                                      name="")
+        for position, order in enumerate(order_list):
+            kwargs: Dict = {"account": account, "on_fill": on_fill,
+                            "payloads": payload_list[position] if payload_list else None, "on_send": on_send,
+                            "tag": Execute.order_tag(tag_prefix=tag_prefix, position=position)}
+            if Execute.is_spread(slices=order):
+                thread: threading.Thread = threading.Thread(target=Execute.place_spread,
+                                                            kwargs=dict(kwargs, b_slice=order[0], s_slice=order[1]),
+                                                            name="")
+            else:
+                thread = threading.Thread(target=Execute.place_basket, kwargs=dict(kwargs, slices=order), name="")
             all_threads.append(thread)
-        start: int = 0
-        end: int = 6
-        while True:
-            current_batch: List[threading.Thread] = all_threads[start: end]
-            for single_thread in current_batch:
-                single_thread.daemon = False
-                single_thread.start()
-            for single_thread in current_batch:
-                single_thread.join()
-            if start == len(all_threads):
-                break
-            start = end
-            end = min(start + 6, len(all_threads))
+        running: List[threading.Thread] = []
+        for single_thread in all_threads:
+            while True:
+                running = [thread for thread in running if thread.is_alive()]
+                if len(running) < ConcurrencyControl.size(account_id=account.account_id, endpoint="place_order"):
+                    break
+                running[0].join(timeout=WINDOW_POLL)
+            single_thread.daemon = False
+            single_thread.start()
+            running.append(single_thread)
+        for single_thread in running:
+            single_thread.join()
         name: str = str(account.account_name)
         name = name[:3] + "*****"
         print("All orders placed for " + name + "\n")
@@ -103,47 +211,169 @@ class Execute:
         return None
 
     @staticmethod
-    def place_spread(b_order: Order = None, s_order: Order = None, account: Account = None) -> bool:
+    def place_spread(b_slice: Slice = None, s_slice: Slice = None, account: Account = None,
+                     on_fill: Optional[Callable[[Account, Slice, Slice], None]] = None,
+                     payloads: Optional[List[Dict]] = None,
+                     on_send: Optional[Callable[[Account, Order], None]] = None, tag: Optional[str] = None) -> bool:
         """
         Places spread order and returns status of placed spread if any.
 
         First buying leg is placed. If buying leg is completed, then selling leg is placed, else execution of the
         spread is cancelled. If after a successful execution of buying leg, selling leg gets rejected, then buying leg
-        gets reverted.
+        gets reverted. If the status of a leg cannot be read, nothing more is placed or reverted for the spread.
 
         Parameters
         ----------
-        b_order : Order, default: None
-            Buying order
-        s_order : Order, default: None
-            Selling order
+        b_slice : Slice, default: None
+            Buying order and its quantity
+        s_slice : Slice, default: None
+            Selling order and its quantity
         account : Account, default: None
             Account where spread has to be placed
+        on_fill : Optional[Callable[[Account, Slice, Slice], None]], default: None
+            Called with the account and both slices if the spread gets completed
+        payloads : Optional[List[Dict]], default: None
+            Request payloads of the buying and selling orders built ahead of time
+        on_send : Optional[Callable[[Account, Order], None]], default: None
+            Called right before an order request is sent
+        tag : Optional[str], default: None
+            Tag of the slice, each leg is tagged with it and the leg's letter
 
         Returns
         -------
         bool
         """
-        status, unique_orderid = Execute.place_leg(order=b_order, account=account)
+        b_tag: Optional[str] = None if tag is None else tag + LEG_TAGS["buy"]
+        s_tag: Optional[str] = None if tag is None else tag + LEG_TAGS["sell"]
+        r_tag: Optional[str] = None if tag is None else tag + LEG_TAGS["revert"]
+        b_payload: Optional[Dict] = payloads[0] if payloads else None
+        s_payload: Optional[Dict] = payloads[1] if payloads else None
+        status, unique_orderid = Execute.place_leg(order=b_slice[0], account=account, quantity=b_slice[1],
+                                                   payload=b_payload, on_send=on_send, tag=b_tag)
         if status == "rejected":
             return False
+        if status == "unknown":
+            print("Status of buying order " + str(unique_orderid or b_tag) + " unknown, selling leg not placed\n")
+            return False
         if status == "complete":
             sleep(1)
-            status, _ = Execute.place_leg(order=s_order, account=account)
+            status, _ = Execute.place_leg(order=s_slice[0], account=account, quantity=s_slice[1], payload=s_payload,
+                                          on_send=on_send, tag=s_tag)
             if status == "rejected":
-                Execute.revert_order(unique_orderid=unique_orderid, account=account)
+                Journal.record(kind="revert", account_id=account.account_id, tag=r_tag, order_id=unique_orderid,
+                               durable=True)
+                Execute.revert_order(unique_orderid=unique_orderid, account=account, tag=r_tag)
+                return False
+            if status == "unknown":
+                print("Status of selling order unknown, buying order " + str(unique_orderid) + " not reverted\n")
                 return False
             if status == "complete":
+                if on_fill is not None:
+                    on_fill(account, b_slice, s_slice)
                 return True
 
     @staticmethod
-    def place_leg(order: Order = None, account: Account = None) -> (str, str):
+    def place_basket(slices: Tuple[Slice, ...] = None, account: Account = None,
+                     on_fill: Optional[Callable[..., None]] = None, payloads: Optional[List[Dict]] = None,
+                     on_send: Optional[Callable[[Account, Order], None]] = None, tag: Optional[str] = None) -> bool:
+        """
+        Places all legs of a basket, hedges first, and returns True if all of them got completed
+
+        All buying legs are placed together first. Then all selling legs are placed together, except those whose option
+        type has a buying leg that was not completed, as they would be left without their hedge. If no selling leg of
+        an option type gets completed, its completed buying legs are reverted. Buying legs that hedge a completed
+        selling leg are never reverted, and nothing is reverted for an option type with a leg of unknown status.
+
+        Parameters
+        ----------
+        slices : Tuple[Slice, ...], default: None
+            Legs of the basket and their quantities
+        account : Account, default: None
+            Account where the basket has to be placed
+        on_fill : Optional[Callable[..., None]], default: None
+            Called with the account and all slices if every leg gets completed
+        payloads : Optional[List[Dict]], default: None
+            Request payloads of the legs built ahead of time
+        on_send : Optional[Callable[[Account, Order], None]], default: None
+            Called right before an order request is sent
+        tag : Optional[str], default: None
+            Tag of the slice, each leg is tagged with it, the leg's letter and its position
+
+        Returns
+        -------
+        bool
+        """
+        if tag is None:
+            tag = Execute.new_tag_prefix() + "0000"
+        tags: List[str] = Execute.leg_tags(tag=tag, slices=slices)
+        results: List[Tuple[Optional[str], Optional[str]]] = [(None, None)] * len(slices)
+
+        def place(position: int) -> None:
+            order, quantity = slices[position]
+            results[position] = Execute.place_leg(order=order, account=account, quantity=quantity,
+                                                  payload=payloads[position] if payloads else None, on_send=on_send,
+                                                  tag=tags[position])
+
+        def place_together(positions: List[int]) -> None:
+            all_threads: List[threading.Thread] = []
+            for position in positions:
+                thread: threading.Thread = threading.Thread(target=place, kwargs={"position": position}, name="")
+                all_threads.append(thread)
+            for thread in all_threads:
+                thread.daemon = False
+                thread.start()
+            for thread in all_threads:
+                thread.join()
+
+        hedges: List[int] = [position for position, (order, _) in enumerate(slices) if order.tradetype == "BUY"]
+        shorts: List[int] = [position for position, (order, _) in enumerate(slices) if order.tradetype == "SELL"]
+        place_together(positions=hedges)
+        unhedged: Set[str] = {Basket.option_type(order=slices[position][0]) for position in hedges
+                         if results[position][0] != "complete"}
+        place_together(positions=[position for position in shorts
+                                  if Basket.option_type(order=slices[position][0]) not in unhedged])
+        if all(status == "complete" for status, _ in results):
+            if on_fill is not None:
+                on_fill(account, *slices)
+            return True
+
+        for option_type in sorted({Basket.option_type(order=order) for order, _ in slices}):
+            side: List[int] = [position for position in range(len(slices))
+                               if Basket.option_type(order=slices[position][0]) == option_type]
+            side_shorts: List[int] = [position for position in side if position in shorts]
+            if not side_shorts or all(results[position][0] == "complete" for position in side_shorts):
+                continue
+            if any(results[position][0] == "unknown" for position in side):
+                print("Status of a " + option_type + " leg unknown, " + option_type + " legs not reverted\n")
+                continue
+            if any(results[position][0] == "complete" for position in side_shorts):
+                print("Some " + option_type + " selling legs not completed, their hedges are kept\n")
+                continue
+            for position in side:
+                status, unique_orderid = results[position]
+                if position in shorts or status != "complete":
+                    continue
+                r_tag: str = tag + LEG_TAGS["revert"] + str(position)
+                Journal.record(kind="revert", account_id=account.account_id, tag=r_tag, order_id=unique_orderid,
+                               durable=True)
+                Execute.revert_order(unique_orderid=unique_orderid, account=account, tag=r_tag)
+        return False
+
+    @staticmethod
+    def place_leg(order: Order = None, account: Account = None, quantity: Optional[int] = None,
+                  payload: Optional[Dict] = None,
+                  on_send: Optional[Callable[[Account, Order], None]] = None,
+                  tag: Optional[str] = None) -> (str, str):
         """
         Places any leg of any strategy.
 
         After placing order, the order is identified by a unique order-id. This unique order-id is then used to
         fetch status of the order and accordingly retrying continues. At the end the status and the unique order-id is
-        returned.
+        returned. Status is unknown if the order was placed but its status could not be read.
+        Every order carries a client tag. Before sending it again after a failed attempt, the order book is searched
+        for the tag, so an order whose response was lost is never placed twice. Once the attempts are used up, the
+        order book is searched one last time, and the order is only rejected if it has no order with the tag, as a
+        timed out attempt may still have reached the broker. Otherwise its status is unknown.
 
         Parameters
         ----------
@@ -151,6 +381,14 @@ class Execute:
             Order to place
         account : Account, default: None
             Account where order is placed
+        quantity : Optional[int], default: None
+            Quantity to place, quantity of the order if not given
+        payload : Optional[Dict], default: None
+            Request payload built ahead of time, built from the order if not given
+        on_send : Optional[Callable[[Account, Order], None]], default: None
+            Called right before the order request is sent
+        tag : Optional[str], default: None
+            Client order tag, a new one is created if not given
 
         Returns
         -------
@@ -158,53 +396,108 @@ class Execute:
             Status, unique order-id
         """
         smartapi: SmartConnect = account.smartapi
-        buying_order_exception_present: bool = False
-        while True:
+        if tag is None:
+            tag = uuid.uuid4().hex[:Const.ORDER_TAG_LENGTH]
+        if payload is None:
+            payload = order.to_payload(quantity=quantity, tag=tag)
+        elif payload.get("ordertag") != tag:
+            payload = dict(payload, ordertag=tag)
+        Journal.record(kind="intent", account_id=account.account_id, tag=tag, symbol=order.symbol, token=order.token,
+                       tradetype=order.tradetype, quantity=payload["quantity"], durable=True)
+        submitted_at: float = perf_counter()
+        attempts: List[int] = [0]
+        # Time the last attempt ended, an order book read after it shows the order if the attempt reached the broker
+        sent_until: List[Optional[float]] = [None]
+
+        def send() -> Optional[Dict]:
+            global last_sent_at
+            attempts[0] += 1
+            if sent_until[0] is not None:
+                placed: Optional[Dict] = Execute.find_order(account=account, tag=tag, since=sent_until[0])
+                if placed is not None:
+                    Metrics.increment(name="duplicate_orders_avoided_total")
+                    return placed
+            if on_send is not None:
+                on_send(account, order)
+            Journal.record(kind="submit", account_id=account.account_id, tag=tag, attempt=attempts[0])
+            request_started_at: float = perf_counter()
+            last_sent_at = request_started_at
             try:
-                order_response: Optional[Dict] = smartapi.placeOrderFullResponse(order.__dict__)["data"]
-                if buying_order_exception_present:
-                    print("Buying order exception solved.\n")
-                    buying_order_exception_present = False
-                break
-            except Exception as exp:
-                log.exception("Buying order exception: " + str(exp))
-                if buying_order_exception_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                buying_order_exception_present = True
-                print("Buying order exception occurring.")
-            sleep(1)
+                data: Optional[Dict] = smartapi.placeOrderFullResponse(payload)["data"]
+            finally:
+                sent_until[0] = perf_counter()
+            Metrics.observe(name="request_latency_seconds", labels={"endpoint": "place_order"},
+                            seconds=perf_counter() - request_started_at)
+            return data
+
+        try:
+            order_response: Optional[Dict] = Retry.call(fn=send, endpoint="place_order", account_id=account.account_id,
+                                                        label="Order")
+        except RetryExhausted:
+            order_response = None
+            if sent_until[0] is not None:
+                try:
+                    order_response = Execute.find_order(account=account, tag=tag, since=sent_until[0])
+                except Exception as exp:
+                    Metrics.increment(name="orders_total", labels={"status": "unknown"})
+                    Journal.record(kind="unknown", account_id=account.account_id, tag=tag)
+                    log_event(event="order_status", account=account.account_id, tag=tag, status="unknown",
+                              attempts=attempts[0], error=str(exp))
+                    return "unknown", None
         unique_orderid: Optional[str] = None
         if order_response:
             unique_orderid = order_response["uniqueorderid"]
         else:
+            Metrics.increment(name="orders_total", labels={"status": "rejected"})
+            Journal.record(kind="reject", account_id=account.account_id, tag=tag)
+            log_event(event="order_not_placed", account=account.account_id, tag=tag, attempts=attempts[0])
             return "rejected", unique_orderid
+        Journal.record(kind="ack", account_id=account.account_id, tag=tag, order_id=unique_orderid)
+        log_event(event="order_placed", account=account.account_id, order_id=unique_orderid, tag=tag,
+                  endpoint="place_order", attempts=attempts[0], latency=round(perf_counter() - submitted_at, 4))
         order_status: Optional[str] = None
-        order_detail_exception_present: bool = False
-        while order_status != "complete":
+        poll_wait: float = ORDER_POLL
+        while True:
             try:
-                order_data: Optional[Dict] = smartapi.individual_order_details(unique_orderid)["data"]
-                if order_detail_exception_present:
-                    print("Order detail exception solved.\n")
-                    order_detail_exception_present = False
-                if order_data:
-                    order_status = order_data["orderstatus"]
-                if order_status == "rejected":
-                    return "rejected", unique_orderid
-            except Exception as exp:
-                log.exception("Order detail exception: " + str(exp))
-                if order_detail_exception_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                order_detail_exception_present = True
-                print("Order details exception occurring.")
-                order_status = None
-                sleep(1)
+                order_data: Optional[Dict] = Retry.call(
+                    fn=lambda: smartapi.individual_order_details(unique_orderid)["data"],
+                    endpoint="order_details", account_id=account.account_id, label="Order details")
+            except RetryExhausted:
+                Metrics.increment(name="orders_total", labels={"status": "unknown"})
+                Journal.record(kind="unknown", account_id=account.account_id, tag=tag, order_id=unique_orderid)
+                log_event(event="order_status", account=account.account_id, order_id=unique_orderid, tag=tag,
+                          status="unknown")
+                return "unknown", unique_orderid
+            if order_data:
+                order_status = order_data["orderstatus"]
+            if order_status in FINAL_STATUSES:
+                break
+            sleep(poll_wait)
+            poll_wait = min(poll_wait * 2, ORDER_POLL_MAX)
+        if order_status != "complete":
+            # A cancelled order is handled as a rejected one, neither of them holds a position
+            Metrics.increment(name="orders_total", labels={"status": "rejected"})
+            Journal.record(kind="reject", account_id=account.account_id, tag=tag, order_id=unique_orderid,
+                           reason=order_status)
+            log_event(event="order_status", account=account.account_id, order_id=unique_orderid, tag=tag,
+                      status=order_status)
+            return "rejected", unique_orderid
+
+        Metrics.increment(name="orders_total", labels={"status": "complete"})
+        Journal.record(kind="fill", account_id=account.account_id, tag=tag, order_id=unique_orderid)
+        HistoryStore.record_fill(account_id=account.account_id, tag=tag, order_id=unique_orderid, symbol=order.symbol,
+                                 token=order.token, tradetype=order.tradetype, quantity=int(payload["quantity"]),
+                                 price=float(order_data.get("averageprice") or 0.0),
+                                 latency=perf_counter() - submitted_at)
+        Metrics.observe(name="order_latency_seconds", labels={"account": str(account.account_id)},
+                        seconds=perf_counter() - submitted_at)
+        log_event(event="order_status", account=account.account_id, order_id=unique_orderid, tag=tag,
+                  status="complete", latency=round(perf_counter() - submitted_at, 4))
 
         return "complete", unique_orderid
 
     @staticmethod
-    def revert_order(unique_orderid: str = None, account: Account = None) -> bool:
+    def revert_order(unique_orderid: str = None, account: Account = None, tag: Optional[str] = None) -> bool:
         """
         Reverts any previous completed order.
 
@@ -217,37 +510,177 @@ class Execute:
             Unique order-id of the order to revert
         account: Account, default: None
             Account for which order is to be reverted
+        tag: Optional[str], default: None
+            Client order tag of the reverting order
 
         Returns
         -------
         bool
         """
         smartapi: SmartConnect = account.smartapi
-        order_detail_exception_in_revert_present = False
-        while True:
-            try:
-                order_data: Optional[Dict] = smartapi.individual_order_details(unique_orderid)["data"]
-                if order_detail_exception_in_revert_present:
-                    print("Order detail exception in revert solved.\n")
-                    order_detail_exception_in_revert_present = False
-                break
-            except Exception as exp:
-                log.exception("Order detail exception in revert: " + str(exp))
-                if order_detail_exception_in_revert_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                order_detail_exception_in_revert_present = True
-                print("Exception while getting individual order details. " + str(exp) + "\n")
-                sleep(1)
+        try:
+            order_data: Optional[Dict] = Retry.call(
+                fn=lambda: smartapi.individual_order_details(unique_orderid)["data"],
+                endpoint="order_details", account_id=account.account_id, label="Order details in revert")
+        except RetryExhausted:
+            print("Revert not placed for order " + str(unique_orderid) + ", check the account manually\n")
+            return False
         if order_data:
             reverting_order: Order = Order(quantity=int(order_data["quantity"]),
                                            symbol=order_data["tradingsymbol"],
                                            token=order_data["symboltoken"],
                                            tradetype="SELL")
-            status, unique_orderid = Execute.place_leg(order=reverting_order, account=account)
+            status, unique_orderid = Execute.place_leg(order=reverting_order, account=account, tag=tag)
             if status == "complete":
                 return True
             if status == "rejected":
                 return False
         else:
             return False
+
+    @staticmethod
+    def new_tag_prefix(command: str = None) -> str:
+        """
+        Creates the prefix of the order tags of one command
+
+        Parameters
+        ----------
+        command: str, default: None
+            The command
+
+        Returns
+        -------
+        str
+        """
+        with tag_lock:
+            if tag_seed is None:
+                seed: str = str(command) + "|" + str(time()) + "|" + uuid.uuid4().hex
+            else:
+                count: int = tag_counts.get(command, 0)
+                tag_counts[command] = count + 1
+                seed = str(command) + "|" + tag_seed + "|" + str(count)
+        return hashlib.sha1(seed.encode()).hexdigest()[:Const.TAG_PREFIX_LENGTH]
+
+    @staticmethod
+    def seed_tag_prefixes(seed: Optional[str] = None) -> None:
+        """
+        Makes the tag prefixes of the next commands depend only on a seed
+
+        Every worker process of a sharded run gets the same seed with a command, so the same command has the same tag
+        prefix in all of them and the trade history sees one command.
+
+        Parameters
+        ----------
+        seed: Optional[str], default: None
+            Seed sent with the command, random prefixes again if None
+        """
+        global tag_seed
+        with tag_lock:
+            tag_seed = seed
+            tag_counts.clear()
+
+    @staticmethod
+    def order_tag(tag_prefix: str = None, position: int = None, leg: str = None) -> str:
+        """
+        Client order tag of one leg of one slice
+
+        The tag only depends on the command, the position of the slice and the leg, so every attempt of the same leg
+        carries the same tag.
+
+        Parameters
+        ----------
+        tag_prefix: str, default: None
+            Prefix of the command
+        position: int, default: None
+            Position of the slice in the account's list
+        leg: str, default: None
+            Key of LEG_TAGS, the tag of the slice is returned if not given
+
+        Returns
+        -------
+        str
+        """
+        tag: str = tag_prefix + str(position).zfill(4)
+        if leg is not None:
+            tag = tag + LEG_TAGS[leg]
+        return tag
+
+    @staticmethod
+    def leg_tags(tag: str = None, slices: Tuple[Slice, ...] = None) -> List[str]:
+        """
+        Client order tags of all legs of one slice
+
+        Legs of a spread get the letter of their side, legs of a basket also get their position
+
+        Parameters
+        ----------
+        tag: str, default: None
+            Tag of the slice
+        slices: Tuple[Slice, ...], default: None
+            Legs of the slice
+
+        Returns
+        -------
+        List[str]
+        """
+        if Execute.is_spread(slices=slices):
+            return [tag + LEG_TAGS["buy"], tag + LEG_TAGS["sell"]]
+        return [tag + LEG_TAGS["buy" if order.tradetype == "BUY" else "sell"] + str(position)
+                for position, (order, _) in enumerate(slices)]
+
+    @staticmethod
+    def is_spread(slices: Tuple[Slice, ...] = None) -> bool:
+        """
+        True if the slices are the buying and selling legs of a spread
+
+        Parameters
+        ----------
+        slices: Tuple[Slice, ...], default: None
+            Legs of the slice
+
+        Returns
+        -------
+        bool
+        """
+        return len(slices) == 2 and slices[0][0].tradetype == "BUY" and slices[1][0].tradetype == "SELL"
+
+    @staticmethod
+    def find_order(account: Account = None, tag: str = None, since: Optional[float] = None) -> Optional[Dict]:
+        """
+        Looks up an order by its tag in the order book of the account
+
+        The order book is read at most once per retry round of an account: legs looking up their tags at the same
+        time wait for one read and share it, as long as it started after their own attempt ended.
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account to look in
+        tag: str, default: None
+            Client order tag
+        since: Optional[float], default: None
+            perf_counter time after which the read has to start, the order book is always read if not given
+
+        Returns
+        -------
+        Optional[Dict]:
+            Order as returned by the broker, None if no order has the tag
+        """
+        with order_book_lock:
+            lock: threading.Lock = order_book_locks.setdefault(account.account_id, threading.Lock())
+        with lock:
+            read: Optional[Tuple[float, Dict[str, Dict]]] = order_books.get(account.account_id)
+            if read is None or since is None or read[0] < since:
+                read_at: float = perf_counter()
+                RateLimiter.acquire(account_id=account.account_id, endpoint="order_book")
+                orders: Optional[List[Dict]] = account.smartapi.orderBook()["data"]
+                read = (read_at, {placed.get("ordertag"): placed for placed in orders or []})
+                order_books[account.account_id] = read
+        return read[1].get(tag)
+
+    @staticmethod
+    def last_sent() -> float:
+        """
+        perf_counter time the last order request was sent, 0 if none was
+        """
+        return last_sent_at
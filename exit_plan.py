@@ -0,0 +1,399 @@
+from spread import Spread
+from commit_writer import CommitWriter
+from logs import log_event
+from typing import Dict, List, Optional
+import threading
+import logging
+import codecs
+import atexit
+import json
+import os
+
+EXIT_PLAN_FILE: str = "exit_plans.jsonl"
+EXIT_FILE: str = "exit_file.txt"
+
+plan_lock: threading.Lock = threading.Lock()
+plan_path: str = EXIT_PLAN_FILE
+plan_writer: Optional[CommitWriter] = None
+plan_writer_lock: threading.Lock = threading.Lock()
+exit_file_lock: threading.Lock = threading.Lock()
+exit_file_path: str = EXIT_FILE
+
+
+class ExitPlan:
+    """
+    Class to represent what has to be exited from one account for one trade
+
+    ...
+
+    Attributes
+    ----------
+    account_id: str
+        Account ID of the account
+    buying_symbol: str
+        Symbol of the buying leg placed at entry
+    buying_token: str
+        Token of the buying leg placed at entry
+    selling_symbol: str
+        Symbol of the selling leg placed at entry
+    selling_token: str
+        Token of the selling leg placed at entry
+    quantity_per_lot: int
+        Quantity per lot of the index
+    slices: List[List[int]]
+        Filled buying and selling quantity of each completed slice
+    """
+
+    def __init__(self, account_id: str = None, buying_symbol: str = None, buying_token: str = None,
+                 selling_symbol: str = None, selling_token: str = None, quantity_per_lot: int = None):
+        self.account_id: str = account_id
+        self.buying_symbol: str = buying_symbol
+        self.buying_token: str = buying_token
+        self.selling_symbol: str = selling_symbol
+        self.selling_token: str = selling_token
+        self.quantity_per_lot: int = quantity_per_lot
+        self.slices: List[List[int]] = []
+
+    def total_number_of_spreads(self) -> int:
+        """
+        Total number of spreads filled in all slices
+        """
+        return sum(min(b_qty, s_qty) for b_qty, s_qty in self.slices) // self.quantity_per_lot
+
+
+class ExitPlanStore:
+    """
+    Durable store of exit plans written at entry time
+
+    The store is an append-only file of json lines. ENTRY writes the plan of an account with its first completed slice
+    and appends a line for every completed slice, so the file is always as current as the fills. EXIT reads the plans
+    and can place orders right away, without fetching positions first. EXIT appends every exited slice as a negative
+    fill, so a partly exited plan holds what is left, and drops the plan of an account by compacting the file once all
+    its slices are exited. A basket only records how many baskets every completed slice opened or closed. Lines are
+    appended by one writer thread: the fills of all accounts waiting at the same time are synced with one fsync, and
+    each fill only waits for its own batch.
+
+    ...
+
+    Methods
+    -------
+    use(path: str = EXIT_PLAN_FILE) -> None:
+        Keeps the plans in another file
+    start(exit_command: str = None, account_id: str = None, spread: Spread = None) -> None:
+        Records the plan of an account before its first fill
+    record_fill(exit_command: str = None, account_id: str = None, buying_quantity: int = None,
+                selling_quantity: int = None) -> None:
+        Records one completed slice
+    load(exit_command: str = None) -> Dict[str, ExitPlan]:
+        Returns the plans of a trade keyed by account ID
+    record_lots(exit_command: str = None, account_id: str = None, lots: int = None) -> None:
+        Records the baskets of one completed slice of a basket
+    load_lots(exit_command: str = None) -> Dict[str, int]:
+        Returns the baskets still open of a basket trade keyed by account ID
+    clear(exit_command: Optional[str] = None, account_ids: Optional[List[str]] = None) -> None:
+        Drops the plans of a trade, or of all trades, for the given accounts, or for all accounts
+    """
+
+    @staticmethod
+    def use(path: str = EXIT_PLAN_FILE) -> None:
+        """
+        Keeps the plans in another file
+
+        Every worker process of a sharded run keeps the plans of its own accounts, so clearing the plans of a trade
+        in one of them does not drop those of the others.
+
+        Parameters
+        ----------
+        path: str, default: EXIT_PLAN_FILE
+            Exit plan file
+        """
+        global plan_path
+        plan_path = path
+
+    @staticmethod
+    def start(exit_command: str = None, account_id: str = None, spread: Spread = None) -> None:
+        """
+        Records the plan of an account before its first fill
+
+        If a plan for the same trade already exists, the new fills are added to it
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the trade
+        account_id: str, default: None
+            Account ID of the account
+        spread: Spread, default: None
+            Spread being entered
+        """
+        ExitPlanStore._append({"command": exit_command,
+                               "account_id": account_id,
+                               "plan": {"buying_symbol": spread.buying_order.symbol,
+                                        "buying_token": spread.buying_order.token,
+                                        "selling_symbol": spread.selling_order.symbol,
+                                        "selling_token": spread.selling_order.token,
+                                        "quantity_per_lot": spread.buying_order.qty}})
+
+    @staticmethod
+    def record_fill(exit_command: str = None, account_id: str = None, buying_quantity: int = None,
+                    selling_quantity: int = None) -> None:
+        """
+        Records one completed slice, with negative quantities for a slice exited
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the trade
+        account_id: str, default: None
+            Account ID of the account
+        buying_quantity: int, default: None
+            Filled quantity of the buying leg
+        selling_quantity: int, default: None
+            Filled quantity of the selling leg
+        """
+        ExitPlanStore._append({"command": exit_command,
+                               "account_id": account_id,
+                               "fill": [buying_quantity, selling_quantity]})
+
+    @staticmethod
+    def load(exit_command: str = None) -> Dict[str, ExitPlan]:
+        """
+        Returns the plans of a trade keyed by account ID
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the trade
+
+        Returns
+        -------
+        Dict[str, ExitPlan]
+        """
+        plans: Dict[str, ExitPlan] = {}
+        for record in ExitPlanStore._read():
+            if record["command"] != exit_command:
+                continue
+            account_id: str = record["account_id"]
+            if "plan" in record:
+                if account_id not in plans:
+                    plans[account_id] = ExitPlan(account_id=account_id, **record["plan"])
+            elif "fill" in record and account_id in plans:
+                plans[account_id].slices.append(record["fill"])
+
+        return plans
+
+    @staticmethod
+    def record_lots(exit_command: str = None, account_id: str = None, lots: int = None) -> None:
+        """
+        Records the baskets of one completed slice of a basket
+
+        A basket needs no symbols in its plan, its EXIT command names all its legs
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the basket
+        account_id: str, default: None
+            Account ID of the account
+        lots: int, default: None
+            Baskets of the slice, negative for a slice exited
+        """
+        ExitPlanStore._append({"command": exit_command,
+                               "account_id": account_id,
+                               "lots": lots})
+
+    @staticmethod
+    def load_lots(exit_command: str = None) -> Dict[str, int]:
+        """
+        Returns the baskets still open of a basket trade keyed by account ID
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the basket
+
+        Returns
+        -------
+        Dict[str, int]
+        """
+        lots: Dict[str, int] = {}
+        for record in ExitPlanStore._read():
+            if record["command"] == exit_command and "lots" in record:
+                lots[record["account_id"]] = lots.get(record["account_id"], 0) + int(record["lots"])
+
+        return lots
+
+    @staticmethod
+    def clear(exit_command: Optional[str] = None, account_ids: Optional[List[str]] = None) -> None:
+        """
+        Drops the plans of a trade, or of all trades, for the given accounts, or for all accounts
+
+        Parameters
+        ----------
+        exit_command: Optional[str], default: None
+            EXIT command of the trade, all trades if None
+        account_ids: Optional[List[str]], default: None
+            Accounts to drop, all accounts if None
+        """
+        with plan_lock:
+            records: List[Dict] = ExitPlanStore._read()
+            kept: List[Dict] = [record for record in records
+                                if (exit_command is not None and record["command"] != exit_command)
+                                or (account_ids is not None and record["account_id"] not in account_ids)]
+            temp_path: str = plan_path + ".tmp"
+            plan_file = codecs.open(temp_path, "w")
+            for record in kept:
+                plan_file.write(json.dumps(record) + "\n")
+            plan_file.flush()
+            os.fsync(plan_file.fileno())
+            plan_file.close()
+            os.replace(temp_path, plan_path)
+
+    @staticmethod
+    def _append(record: Dict = None) -> None:
+        line: str = json.dumps(record) + "\n"
+        if ExitPlanStore._writer().append(line=line).wait():
+            return None
+        # The writer stopped on an error, the record is written on its own
+        with plan_lock:
+            plan_file = codecs.open(plan_path, "a")
+            plan_file.write(line)
+            plan_file.flush()
+            os.fsync(plan_file.fileno())
+            plan_file.close()
+
+    @staticmethod
+    def _writer() -> CommitWriter:
+        global plan_writer
+        with plan_writer_lock:
+            if plan_writer is None:
+                # Writes to the file in use at every batch, and never while the file is compacted
+                plan_writer = CommitWriter(name="exit-plans", path=lambda: plan_path, lock=plan_lock,
+                                           on_error=_failed)
+                plan_writer.start()
+                atexit.register(plan_writer.stop)
+            return plan_writer
+
+    @staticmethod
+    def _read() -> List[Dict]:
+        if not os.path.exists(plan_path):
+            return []
+        records: List[Dict] = []
+        plan_file = codecs.open(plan_path, "r")
+        for lin in plan_file:
+            if len(lin.strip()) == 0:
+                continue
+            try:
+                records.append(json.loads(lin))
+            except ValueError:
+                # A crash in the middle of an append can leave a partial last line
+                continue
+        plan_file.close()
+
+        return records
+
+
+def _failed(exp: Exception = None) -> None:
+    log_event(event="exit_plan_write_failed", level=logging.ERROR, exc_info=True, error=str(exp))
+
+
+class ExitFile:
+    """
+    The exit commands of the open trades, one per line in exit_file.txt
+
+    ENTRY adds the exit command of its trade once its orders are done and EXIT removes it, so several trades entered
+    one after the other, or together in a batch, can all be exited by hand or by the exit rules. The last line is the
+    trade entered last.
+
+    ...
+
+    Methods
+    -------
+    use(path: str = EXIT_FILE) -> None:
+        Keeps the exit commands in another file
+    commands() -> List[str]:
+        Exit commands of the open trades, the one entered last at the end
+    add(exit_command: str = None) -> None:
+        Adds the exit command of a trade just entered
+    remove(exit_command: str = None) -> None:
+        Removes the exit command of a trade exited
+    clear() -> None:
+        Removes the exit commands of all trades
+    """
+
+    @staticmethod
+    def use(path: str = EXIT_FILE) -> None:
+        """
+        Keeps the exit commands in another file
+
+        Every worker process of a sharded run keeps the exit commands of its own trades, so an exit in one of them
+        does not drop the line of a trade still open in the others.
+
+        Parameters
+        ----------
+        path: str, default: EXIT_FILE
+            Exit file
+        """
+        global exit_file_path
+        with exit_file_lock:
+            exit_file_path = path
+
+    @staticmethod
+    def commands() -> List[str]:
+        """
+        Exit commands of the open trades, the one entered last at the end
+        """
+        with exit_file_lock:
+            return ExitFile._read()
+
+    @staticmethod
+    def add(exit_command: str = None) -> None:
+        """
+        Adds the exit command of a trade just entered
+
+        A trade entered again is moved to the end
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the trade
+        """
+        with exit_file_lock:
+            ExitFile._write(commands=[command for command in ExitFile._read() if command != exit_command]
+                            + [exit_command])
+
+    @staticmethod
+    def remove(exit_command: str = None) -> None:
+        """
+        Removes the exit command of a trade exited
+
+        Parameters
+        ----------
+        exit_command: str, default: None
+            EXIT command of the trade
+        """
+        with exit_file_lock:
+            ExitFile._write(commands=[command for command in ExitFile._read() if command != exit_command])
+
+    @staticmethod
+    def clear() -> None:
+        """
+        Removes the exit commands of all trades
+        """
+        with exit_file_lock:
+            ExitFile._write(commands=[])
+
+    @staticmethod
+    def _read() -> List[str]:
+        if not os.path.exists(exit_file_path):
+            return []
+        exit_file = codecs.open(exit_file_path, "r")
+        commands: List[str] = [" ".join(lin.split()) for lin in exit_file if len(lin.strip()) != 0]
+        exit_file.close()
+        return commands
+
+    @staticmethod
+    def _write(commands: List[str] = None) -> None:
+        exit_file = codecs.open(exit_file_path, "w")
+        exit_file.write("".join(command + "\n" for command in commands))
+        exit_file.close()
@@ -0,0 +1,360 @@
+from account import Account
+from book import Book, BookPoller, Snapshot
+from typing import Dict, List, Optional, Tuple
+from time import time
+import threading
+from logs import log_event
+import logging
+import heapq
+import queue
+
+
+class Rule:
+    """
+    Base class of an exit rule
+
+    A rule watches the snapshot of a single account and, once its condition is met, exits the trades described by
+    exit_commands in the accounts of its scope.
+
+    ...
+
+    Attributes
+    ----------
+    rule_id: Optional[int]
+        ID assigned by the scheduler
+    watch_account_id: Optional[str]
+        Account whose P&L is evaluated, None for rules that do not depend on P&L
+    exit_commands: List[str]
+        EXIT commands run when the rule fires, one per trade
+    scope_account_id: Optional[str]
+        Only this account is exited if set, else all accounts are exited
+
+    Methods
+    -------
+    evaluate(self, snapshot: Snapshot = None) -> Optional[str]:
+        Returns the reason to exit if the rule is met
+    describe(self) -> str:
+        Human readable description of the rule
+    """
+
+    def __init__(self, watch_account_id: Optional[str] = None, exit_commands: List[str] = None,
+                 scope_account_id: Optional[str] = None):
+        self.rule_id: Optional[int] = None
+        self.watch_account_id: Optional[str] = watch_account_id
+        self.exit_commands: List[str] = exit_commands
+        self.scope_account_id: Optional[str] = scope_account_id
+
+    def evaluate(self, snapshot: Snapshot = None) -> Optional[str]:
+        """
+        Returns the reason to exit if the rule is met
+
+        Parameters
+        ----------
+        snapshot: Snapshot, default: None
+            Latest snapshot of the watched account
+
+        Returns
+        -------
+        Optional[str]:
+            Reason to exit, None if the rule is not met
+        """
+        return None
+
+    def describe(self) -> str:
+        """
+        Human readable description of the rule
+        """
+        return "; ".join(self.exit_commands)
+
+
+class ThresholdRule(Rule):
+    """
+    Exits when unrealised P&L goes below the stoploss or above the target, same as the original AUTOEXIT
+    """
+
+    def __init__(self, sl: float = None, tgt: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.sl: float = sl
+        self.tgt: float = tgt
+
+    def evaluate(self, snapshot: Snapshot = None) -> Optional[str]:
+        if snapshot.unrealised > self.tgt:
+            return "Target reached"
+        if snapshot.unrealised < self.sl:
+            return "SL hit"
+        return None
+
+    def describe(self) -> str:
+        return "SL=" + str(self.sl) + " TGT=" + str(self.tgt) + " on " + _mask(self.watch_account_id)
+
+
+class TrailingStopRule(Rule):
+    """
+    Exits when unrealised P&L falls more than trail below the highest unrealised P&L seen so far
+    """
+
+    def __init__(self, trail: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.trail: float = trail
+        self.peak: Optional[float] = None
+
+    def evaluate(self, snapshot: Snapshot = None) -> Optional[str]:
+        if self.peak is None or snapshot.unrealised > self.peak:
+            self.peak = snapshot.unrealised
+        if snapshot.unrealised <= self.peak - self.trail:
+            return "Trailing SL hit at " + str(snapshot.unrealised) + " (peak " + str(self.peak) + ")"
+        return None
+
+    def describe(self) -> str:
+        return "TRAIL=" + str(self.trail) + " on " + _mask(self.watch_account_id) + " peak " + str(self.peak)
+
+
+class AccountMaxLossRule(Rule):
+    """
+    Exits an account on its own once its overall P&L loses more than max_loss
+    """
+
+    def __init__(self, max_loss: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_loss: float = max_loss
+
+    def evaluate(self, snapshot: Snapshot = None) -> Optional[str]:
+        if snapshot.total <= -self.max_loss:
+            return "Max loss hit for " + _mask(self.watch_account_id)
+        return None
+
+    def describe(self) -> str:
+        return "MAXLOSS=" + str(self.max_loss) + " on " + _mask(self.watch_account_id)
+
+
+class SpreadStopRule(Rule):
+    """
+    Exits one spread when the unrealised P&L of its two legs goes below the stoploss
+    """
+
+    def __init__(self, sl: float = None, symbols: Tuple[str, str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.sl: float = sl
+        self.symbols: Tuple[str, str] = symbols
+
+    def evaluate(self, snapshot: Snapshot = None) -> Optional[str]:
+        legs: List[Dict] = [snapshot.positions[symbol] for symbol in self.symbols if symbol in snapshot.positions]
+        if not legs:
+            return None
+        unrealised: float = sum(leg["unrealised"] for leg in legs)
+        if unrealised < self.sl:
+            return "Spread SL hit for " + self.exit_commands[0]
+        return None
+
+    def describe(self) -> str:
+        return "SPREADSL=" + str(self.sl) + " " + self.exit_commands[0]
+
+
+class TimeExitRule(Rule):
+    """
+    Exits at a fixed time of the day
+    """
+
+    def __init__(self, at: float = None, label: str = None, **kwargs):
+        super().__init__(**kwargs)
+        self.at: float = at
+        self.label: str = label
+
+    def describe(self) -> str:
+        return "TIME=" + str(self.label)
+
+
+class ExitScheduler:
+    """
+    Evaluates all exit rules in one loop over the shared book
+
+    Rules are indexed by the account they watch, so a refresh of one account only evaluates the rules of that
+    account. Time based rules are kept in a heap and only the rules that are due are looked at. Fired exits are queued
+    and run one by one on the thread running the scheduler, the command prompt is never blocked.
+
+    ...
+
+    Methods
+    -------
+    add(self, rule: Rule = None) -> int:
+        Adds a rule and starts watching its account
+    remove(self, rule_id: int = None) -> bool:
+        Removes a rule
+    rules(self) -> List[Rule]:
+        Returns all active rules
+    run(self, stop_event: threading.Event = None) -> None:
+        Evaluates rules and runs fired exits until stopped
+    """
+
+    def __init__(self, book: Book = None, poller: BookPoller = None, accounts: List[Account] = None):
+        self.book: Book = book
+        self.poller: BookPoller = poller
+        self.accounts: List[Account] = accounts
+        self.accounts_by_id: Dict[str, Account] = {account.account_id: account for account in accounts}
+        self.rules_by_id: Dict[int, Rule] = {}
+        self.rules_by_account: Dict[str, Dict[int, Rule]] = {}
+        self.time_rules: List[Tuple[float, int]] = []
+        self.next_rule_id: int = 1
+        self.fired: queue.Queue = queue.Queue()
+        self.lock: threading.Lock = threading.Lock()
+
+    def add(self, rule: Rule = None) -> int:
+        """
+        Adds a rule and starts watching its account
+
+        Parameters
+        ----------
+        rule: Rule, default: None
+            Rule to add
+
+        Returns
+        -------
+        int:
+            ID of the rule
+        """
+        with self.lock:
+            rule.rule_id = self.next_rule_id
+            self.next_rule_id += 1
+            self.rules_by_id[rule.rule_id] = rule
+            if isinstance(rule, TimeExitRule):
+                heapq.heappush(self.time_rules, (rule.at, rule.rule_id))
+            else:
+                self.rules_by_account.setdefault(rule.watch_account_id, {})[rule.rule_id] = rule
+        if rule.watch_account_id is not None:
+            self.poller.watch(self.accounts_by_id[rule.watch_account_id])
+
+        return rule.rule_id
+
+    def remove(self, rule_id: int = None) -> bool:
+        """
+        Removes a rule
+
+        Parameters
+        ----------
+        rule_id: int, default: None
+            ID of the rule
+
+        Returns
+        -------
+        bool:
+            False if no such rule exists
+        """
+        with self.lock:
+            rule: Optional[Rule] = self._remove(rule_id=rule_id)
+        if rule is None:
+            return False
+        if rule.watch_account_id is not None:
+            self.poller.unwatch(self.accounts_by_id[rule.watch_account_id])
+
+        return True
+
+    def rules(self) -> List[Rule]:
+        """
+        Returns all active rules
+        """
+        with self.lock:
+            return sorted(self.rules_by_id.values(), key=lambda r: r.rule_id)
+
+    def on_update(self, snapshot: Snapshot = None) -> None:
+        """
+        Evaluates the rules watching the refreshed account
+
+        Parameters
+        ----------
+        snapshot: Snapshot, default: None
+            Refreshed snapshot
+        """
+        with self.lock:
+            for rule in list(self.rules_by_account.get(snapshot.account_id, {}).values()):
+                reason: Optional[str] = rule.evaluate(snapshot=snapshot)
+                if reason is not None:
+                    self._remove(rule_id=rule.rule_id)
+                    self.fired.put((rule, reason))
+
+        return None
+
+    def _remove(self, rule_id: int = None) -> Optional[Rule]:
+        rule: Optional[Rule] = self.rules_by_id.pop(rule_id, None)
+        if rule is not None and not isinstance(rule, TimeExitRule):
+            account_rules: Dict[int, Rule] = self.rules_by_account.get(rule.watch_account_id, {})
+            account_rules.pop(rule_id, None)
+            if not account_rules:
+                self.rules_by_account.pop(rule.watch_account_id, None)
+        return rule
+
+    def _due_time_rules(self) -> None:
+        now: float = time()
+        with self.lock:
+            while self.time_rules and self.time_rules[0][0] <= now:
+                _, rule_id = heapq.heappop(self.time_rules)
+                rule: Optional[Rule] = self._remove(rule_id=rule_id)
+                if rule is not None:
+                    self.fired.put((rule, "Exit time reached"))
+
+    def run(self, stop_event: threading.Event = None) -> None:
+        """
+        Evaluates rules and runs fired exits until stopped
+
+        All rules are dropped once the scheduler stops.
+
+        Parameters
+        ----------
+        stop_event: threading.Event, default: None
+            Set to stop the scheduler
+        """
+        self.book.subscribe(self.on_update)
+        try:
+            self._run(stop_event=stop_event)
+        finally:
+            self.book.unsubscribe(self.on_update)
+            for rule in self.rules():
+                self.remove(rule_id=rule.rule_id)
+
+    def _run(self, stop_event: threading.Event = None) -> None:
+        # Imported here, so adding a rule does not load the exit path before the first rule fires
+        import trade_exit
+        while not stop_event.is_set():
+            self._due_time_rules()
+            try:
+                rule, reason = self.fired.get(timeout=1)
+            except queue.Empty:
+                continue
+            if rule.watch_account_id is not None:
+                self.poller.unwatch(self.accounts_by_id[rule.watch_account_id])
+            print(reason)
+            print("\n")
+            accounts: List[Account] = self.accounts
+            if rule.scope_account_id is not None:
+                accounts = [self.accounts_by_id[rule.scope_account_id]]
+            exited: List[str] = []
+            # An exit of all accounts only drops the line and the exit plans of its own trade, other trades stay
+            for exit_command in rule.exit_commands:
+                try:
+                    trade_exit.trade_exit(command=exit_command, accounts=accounts,
+                                          clear_exit_file=rule.scope_account_id is None)
+                except Exception as exp:
+                    log_event(event="exit_rule_failed", level=logging.ERROR, exc_info=True, rule=rule.rule_id,
+                              command=exit_command, error=str(exp))
+                    print("Exit failed for rule " + str(rule.rule_id) + ": " + str(exp) + "\n")
+                    continue
+                exited.append(exit_command)
+            self._drop_rules_of_exited_trades(rule=rule, exited=exited)
+
+    def _drop_rules_of_exited_trades(self, rule: Rule = None, exited: List[str] = None) -> None:
+        # Other rules of the same scope forget the exited trades, and are dropped once they have none left
+        stale: List[int] = []
+        with self.lock:
+            for other in self.rules_by_id.values():
+                if rule.scope_account_id is not None and other.scope_account_id != rule.scope_account_id:
+                    continue
+                other.exit_commands = [command for command in other.exit_commands if command not in exited]
+                if not other.exit_commands:
+                    stale.append(other.rule_id)
+        for rule_id in stale:
+            self.remove(rule_id=rule_id)
+
+
+def _mask(account_id: Optional[str] = None) -> str:
+    if account_id is None:
+        return "all accounts"
+    return "*****" + str(account_id)[-3:]
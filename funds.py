@@ -0,0 +1,95 @@
+from account import Account
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from session import SessionManager
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from datetime import datetime
+import constants as Const
+from logs import log_event
+import threading
+import logging
+
+# One thread per account up to this many, so every RMS call is sent at once and only waits on the rate budget
+MAX_WORKERS: int = 256
+# Share of accounts left on their last balance above which the refresh is reported as too slow
+STALE_WARNING: float = 0.1
+
+# Shared by all entries and only grown when more accounts are refreshed, so threads are not started per entry
+pool: Optional[ThreadPoolExecutor] = None
+pool_size: int = 0
+pool_lock: threading.Lock = threading.Lock()
+
+
+def refresh_funds(accounts: List[Account] = None, deadline: float = Const.FUNDS_DEADLINE) -> List[Account]:
+    """
+    Reads the available balance of all accounts in parallel right before sizing
+
+    Every account gets a single RMS call, taken from its rate budget, on a pool with a thread for every account.
+    Balances that arrive within the deadline are applied, the other accounts keep their last balance and are listed
+    with a warning. Answers arriving after the deadline are dropped, so the balance never changes while an entry is
+    being sized. If more than STALE_WARNING of the accounts are left on their last balance, that is reported as well.
+
+    Parameters
+    ----------
+    accounts: List[Account], default: None
+        Accounts to refresh
+    deadline: float, default: Const.FUNDS_DEADLINE
+        Seconds to wait for all accounts
+
+    Returns
+    -------
+    List[Account]:
+        Accounts still on their last balance
+    """
+    executor: ThreadPoolExecutor = _pool(size=len(accounts))
+    futures: Dict[Future, Account] = {executor.submit(_read_balance, account): account for account in accounts}
+    done, _ = wait(futures, timeout=deadline)
+    stale: List[Account] = []
+    for future, account in futures.items():
+        balance: Optional[float] = future.result() if future in done else None
+        if balance is None:
+            stale.append(account)
+            continue
+        account.set_balance(balance=balance)
+    for account in stale:
+        updated_at: str = "an unknown time"
+        if account.funds_updated_at is not None:
+            updated_at = datetime.fromtimestamp(account.funds_updated_at).strftime("%H:%M:%S")
+        print("Funds not refreshed for *****" + str(account.account_id)[-3:] + ", using Rs "
+              + str(account.capital_to_use) + " from " + updated_at)
+    Metrics.set(name="funds_stale_accounts", value=len(stale))
+    if accounts and len(stale) > STALE_WARNING * len(accounts):
+        log_event(event="funds_mostly_stale", level=logging.WARNING, stale=len(stale), accounts=len(accounts),
+                  deadline=deadline, workers=pool_size)
+        print("Funds of " + str(len(stale)) + " of " + str(len(accounts)) + " accounts not refreshed within "
+              + str(deadline) + "s, their entries are sized on older balances")
+
+    return stale
+
+
+def _pool(size: int = None) -> ThreadPoolExecutor:
+    global pool, pool_size
+    with pool_lock:
+        size = min(max(size, 1), MAX_WORKERS)
+        if pool is None or size > pool_size:
+            if pool is not None:
+                pool.shutdown(wait=False)
+            pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="funds")
+            pool_size = size
+        return pool
+
+
+def _read_balance(account: Account = None) -> Optional[float]:
+    try:
+        RateLimiter.acquire(account_id=account.account_id, endpoint="rms")
+        rms: Optional[Dict] = account.smartapi.rmsLimit()["data"]
+        if rms is None:
+            return None
+        return float(rms["availablecash"])
+    except Exception as exp:
+        log_event(event="funds_refresh_failed", level=logging.WARNING, exc_info=True, endpoint="rms",
+                  account=account.account_id, error=str(exp))
+        Metrics.record_failure(endpoint="rms", account_id=account.account_id, exp=exp)
+        SessionManager.report(account_id=account.account_id, exp=exp)
+        return None
@@ -0,0 +1,320 @@
+from book import Snapshot
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from time import time
+import constants as Const
+import threading
+import sqlite3
+import atexit
+import queue
+
+HISTORY_FILE: str = "trade_history.db"
+# Rows inserted in one transaction at most
+BATCH_SIZE: int = 2000
+# Seconds the writer waits for more rows before inserting what it has
+BATCH_WAIT: float = 1.0
+# Seconds between two P&L points of the same account
+PNL_INTERVAL: float = 60.0
+
+SCHEMA: List[str] = [
+    "CREATE TABLE IF NOT EXISTS commands (tag_prefix TEXT PRIMARY KEY, time REAL, date TEXT, command TEXT)",
+    "CREATE TABLE IF NOT EXISTS fills (time REAL, date TEXT, account_id TEXT, tag_prefix TEXT, tag TEXT, "
+    "order_id TEXT, symbol TEXT, token TEXT, tradetype TEXT, quantity INTEGER, price REAL, latency REAL)",
+    "CREATE TABLE IF NOT EXISTS pnl (time REAL, date TEXT, account_id TEXT, realised REAL, unrealised REAL, "
+    "total REAL)",
+    "CREATE INDEX IF NOT EXISTS commands_by_command ON commands (command, date)",
+    "CREATE INDEX IF NOT EXISTS fills_by_account ON fills (account_id, date)",
+    "CREATE INDEX IF NOT EXISTS fills_by_symbol ON fills (symbol, date)",
+    "CREATE INDEX IF NOT EXISTS fills_by_date ON fills (date, tag_prefix)",
+    "CREATE INDEX IF NOT EXISTS pnl_by_account ON pnl (account_id, date, time)",
+]
+INSERTS: Dict[str, str] = {
+    "commands": "INSERT OR IGNORE INTO commands VALUES (?, ?, ?, ?)",
+    "fills": "INSERT INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "pnl": "INSERT INTO pnl VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+rows: queue.SimpleQueue = queue.SimpleQueue()
+writer: Optional["HistoryWriter"] = None
+history_path: str = HISTORY_FILE
+# Account ID -> epoch time of the last P&L point
+last_pnl: Dict[str, float] = {}
+pnl_lock: threading.Lock = threading.Lock()
+
+
+class HistoryWriter(threading.Thread):
+    """
+    Single thread inserting the rows of the trade history
+
+    Rows are taken from the queue in batches and every batch is inserted in one transaction, so trading threads only
+    pay for a queue put.
+
+    ...
+
+    Methods
+    -------
+    run(self) -> None:
+        Inserts batches until stopped
+    stop(self) -> None:
+        Inserts what is left and stops
+    """
+
+    def __init__(self, path: str = None):
+        super().__init__(name="history-writer", daemon=True)
+        self.path: str = path
+        self.stop_event: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        connection: sqlite3.Connection = _connect(path=self.path)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+        while not self.stop_event.is_set():
+            self._insert(connection=connection, batch=self._next_batch(wait=BATCH_WAIT))
+        self._insert(connection=connection, batch=self._next_batch(wait=0))
+        connection.close()
+
+    def stop(self) -> None:
+        """
+        Inserts what is left and stops
+        """
+        self.stop_event.set()
+        self.join(timeout=5)
+
+    def _next_batch(self, wait: float = None) -> List[Tuple[str, Tuple]]:
+        batch: List[Tuple[str, Tuple]] = []
+        try:
+            batch.append(rows.get(timeout=wait) if wait else rows.get_nowait())
+            while len(batch) < BATCH_SIZE:
+                batch.append(rows.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _insert(self, connection: sqlite3.Connection = None, batch: List[Tuple[str, Tuple]] = None) -> None:
+        if not batch:
+            return None
+        by_table: Dict[str, List[Tuple]] = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+        with connection:
+            for table, table_rows in by_table.items():
+                connection.executemany(INSERTS[table], table_rows)
+
+
+class HistoryStore:
+    """
+    Local SQLite store of commands, fills and P&L points kept across runs
+
+    Rows are queued by the trading threads and inserted by a single writer thread. Queries open their own connection
+    and can run while trading goes on.
+
+    ...
+
+    Methods
+    -------
+    start(path: str = HISTORY_FILE) -> None:
+        Creates the store if needed and starts the writer
+    record_command(tag_prefix: str = None, command: str = None) -> None:
+        Records the command behind a tag prefix
+    record_fill(account_id: str = None, tag: str = None, order_id: str = None, symbol: str = None,
+                token: str = None, tradetype: str = None, quantity: int = None, price: Optional[float] = None,
+                latency: float = None) -> None:
+        Records a completed order
+    record_pnl(snapshot: Snapshot = None) -> None:
+        Records a P&L point of an account, at most once per PNL_INTERVAL
+    pnl_curve(account_id: str = None, day: str = None) -> List[Tuple[float, float, float, float]]:
+        P&L points of an account on a day
+    fill_prices(day: str = None) -> List[Tuple[str, str, str, str, str, float, int]]:
+        Average fill price of every account, command, symbol and trade type on a day
+    fill_latencies(since: str = None) -> List[Tuple[str, float]]:
+        Fill latency of every completed order since a day
+    """
+
+    @staticmethod
+    def start(path: str = HISTORY_FILE) -> None:
+        """
+        Creates the store if needed and starts the writer
+
+        Parameters
+        ----------
+        path: str, default: HISTORY_FILE
+            SQLite database file
+        """
+        global writer, history_path
+        if writer is not None:
+            return None
+        history_path = path
+        writer = HistoryWriter(path=path)
+        writer.start()
+        atexit.register(writer.stop)
+
+    @staticmethod
+    def record_command(tag_prefix: str = None, command: str = None) -> None:
+        """
+        Records the command behind a tag prefix
+
+        Parameters
+        ----------
+        tag_prefix: str, default: None
+            Prefix of the order tags of the command
+        command: str, default: None
+            The command
+        """
+        if writer is None:
+            return None
+        now: float = time()
+        rows.put(("commands", (tag_prefix, now, _day(epoch=now), command)))
+
+    @staticmethod
+    def record_fill(account_id: str = None, tag: str = None, order_id: str = None, symbol: str = None,
+                    token: str = None, tradetype: str = None, quantity: int = None, price: Optional[float] = None,
+                    latency: float = None) -> None:
+        """
+        Records a completed order
+
+        Parameters
+        ----------
+        account_id: str, default: None
+            Account ID of the account
+        tag: str, default: None
+            Client order tag of the order
+        order_id: str, default: None
+            Unique order-id of the order
+        symbol: str, default: None
+            Trading symbol
+        token: str, default: None
+            Symbol token
+        tradetype: str, default: None
+            BUY or SELL
+        quantity: int, default: None
+            Quantity of the order
+        price: Optional[float], default: None
+            Average fill price reported by the broker
+        latency: float, default: None
+            Seconds from sending the order to its completion
+        """
+        if writer is None:
+            return None
+        now: float = time()
+        rows.put(("fills", (now, _day(epoch=now), account_id, tag[:Const.TAG_PREFIX_LENGTH], tag, order_id, symbol,
+                            token, tradetype, quantity, price, latency)))
+
+    @staticmethod
+    def record_pnl(snapshot: Snapshot = None) -> None:
+        """
+        Records a P&L point of an account, at most once per PNL_INTERVAL
+
+        Subscribed to the book, so every refresh of any consumer feeds the history
+
+        Parameters
+        ----------
+        snapshot: Snapshot, default: None
+            Refreshed snapshot of the account
+        """
+        if writer is None:
+            return None
+        with pnl_lock:
+            if snapshot.updated_at - last_pnl.get(snapshot.account_id, 0.0) < PNL_INTERVAL:
+                return None
+            last_pnl[snapshot.account_id] = snapshot.updated_at
+        rows.put(("pnl", (snapshot.updated_at, _day(epoch=snapshot.updated_at), snapshot.account_id,
+                          snapshot.realised, snapshot.unrealised, snapshot.total)))
+
+    @staticmethod
+    def pnl_curve(account_id: str = None, day: str = None) -> List[Tuple[float, float, float, float]]:
+        """
+        P&L points of an account on a day
+
+        Parameters
+        ----------
+        account_id: str, default: None
+            Account ID of the account
+        day: str, default: None
+            Day as YYYY-MM-DD
+
+        Returns
+        -------
+        List[Tuple[float, float, float, float]]:
+            Epoch time, realised, unrealised and total P&L of every point, oldest first
+        """
+        return _query(sql="SELECT time, realised, unrealised, total FROM pnl WHERE account_id = ? AND date = ? "
+                          "ORDER BY time", parameters=(account_id, day))
+
+    @staticmethod
+    def fill_prices(day: str = None) -> List[Tuple[str, str, str, str, str, float, int]]:
+        """
+        Average fill price of every account, command, symbol and trade type on a day
+
+        Parameters
+        ----------
+        day: str, default: None
+            Day as YYYY-MM-DD
+
+        Returns
+        -------
+        List[Tuple[str, str, str, str, str, float, int]]:
+            Tag prefix, command, account ID, symbol, trade type, quantity weighted price and total quantity
+        """
+        return _query(sql="SELECT fills.tag_prefix, commands.command, fills.account_id, fills.symbol, fills.tradetype, "
+                          "SUM(fills.price * fills.quantity) / SUM(fills.quantity), SUM(fills.quantity) "
+                          "FROM fills JOIN commands ON commands.tag_prefix = fills.tag_prefix "
+                          "WHERE fills.date = ? AND fills.price > 0 "
+                          "GROUP BY fills.tag_prefix, fills.account_id, fills.symbol, fills.tradetype "
+                          "ORDER BY commands.time", parameters=(day,))
+
+    @staticmethod
+    def fill_latencies(since: str = None) -> List[Tuple[str, float]]:
+        """
+        Fill latency of every completed order since a day
+
+        Parameters
+        ----------
+        since: str, default: None
+            First day as YYYY-MM-DD
+
+        Returns
+        -------
+        List[Tuple[str, float]]:
+            Day and latency in seconds, by day
+        """
+        return _query(sql="SELECT date, latency FROM fills WHERE date >= ? AND latency IS NOT NULL ORDER BY date",
+                      parameters=(since,))
+
+
+def days_ago(days: int = None) -> str:
+    """
+    Day as YYYY-MM-DD a number of days before today
+
+    Parameters
+    ----------
+    days: int, default: None
+        Number of days
+
+    Returns
+    -------
+    str
+    """
+    return (date.today() - timedelta(days=days)).isoformat()
+
+
+def _day(epoch: float = None) -> str:
+    return datetime.fromtimestamp(epoch).date().isoformat()
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    connection: sqlite3.Connection = sqlite3.connect(path, timeout=10)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def _query(sql: str = None, parameters: Tuple = None) -> List[Tuple]:
+    connection: sqlite3.Connection = _connect(path=history_path)
+    try:
+        return connection.execute(sql, parameters).fetchall()
+    except sqlite3.OperationalError:
+        # The writer has not created the tables yet
+        return []
+    finally:
+        connection.close()
@@ -0,0 +1,164 @@
+from typing import Callable, Dict, List, Optional
+from datetime import datetime
+from time import time
+import threading
+from logs import log_event
+import logging
+
+
+class Job:
+    """
+    Class to represent a long running command running in the background
+
+    ...
+
+    Attributes
+    ----------
+    job_id: int
+        ID of the job
+    name: str
+        Command that started the job
+    stop_event: threading.Event
+        Set to ask the job to stop
+    thread: threading.Thread
+        Thread running the job
+    started_at: float
+        Epoch time when the job started
+    """
+
+    def __init__(self, job_id: int = None, name: str = None, target: Callable = None, kwargs: Dict = None,
+                 on_exit: Optional[Callable[["Job"], None]] = None):
+        self.job_id: int = job_id
+        self.name: str = name
+        self.stop_event: threading.Event = threading.Event()
+        self.started_at: float = time()
+        self.thread: threading.Thread = threading.Thread(target=self._run,
+                                                         kwargs={"target": target, "kwargs": kwargs,
+                                                                 "on_exit": on_exit},
+                                                         name="job-" + str(job_id))
+        self.thread.daemon = True
+
+    def _run(self, target: Callable = None, kwargs: Dict = None,
+             on_exit: Optional[Callable[["Job"], None]] = None) -> None:
+        try:
+            target(stop_event=self.stop_event, **kwargs)
+        except Exception as exp:
+            log_event(event="job_failed", level=logging.ERROR, exc_info=True, job=self.name, error=str(exp))
+            print("Job " + str(self.job_id) + " (" + self.name + ") failed: " + str(exp) + "\n")
+        finally:
+            if on_exit is not None:
+                on_exit(self)
+
+
+class JobManager:
+    """
+    Runs long lived commands in the background on the already logged in accounts
+
+    Every job gets a stop event which it has to check regularly. Jobs share the accounts, the book and the rate of
+    the broker API with the commands typed at the prompt, no new session is created.
+
+    ...
+
+    Methods
+    -------
+    start(self, name: str = None, target: Callable = None, kwargs: Dict = None) -> Job:
+        Starts a job
+    stop(self, job_id: int = None) -> bool:
+        Stops a job and waits for it to finish
+    jobs(self) -> List[Job]:
+        Returns the running jobs
+    """
+
+    def __init__(self):
+        self.running: Dict[int, Job] = {}
+        self.next_job_id: int = 1
+        self.lock: threading.Lock = threading.Lock()
+
+    def start(self, name: str = None, target: Callable = None, kwargs: Dict = None,
+              on_exit: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        Starts a job
+
+        Parameters
+        ----------
+        name: str, default: None
+            Name shown in the list of jobs
+        target: Callable, default: None
+            Function to run, called with stop_event and kwargs
+        kwargs: Dict, default: None
+            Arguments of the function
+        on_exit: Optional[Callable[[Job], None]], default: None
+            Called once the job has finished, for whatever reason
+
+        Returns
+        -------
+        Job
+        """
+        def finished(job: Job) -> None:
+            with self.lock:
+                self.running.pop(job.job_id, None)
+            if on_exit is not None:
+                on_exit(job)
+
+        with self.lock:
+            job: Job = Job(job_id=self.next_job_id, name=name, target=target, kwargs=kwargs or {}, on_exit=finished)
+            self.next_job_id += 1
+            self.running[job.job_id] = job
+        job.thread.start()
+
+        return job
+
+    def stop(self, job_id: int = None) -> bool:
+        """
+        Stops a job and waits for it to finish
+
+        Parameters
+        ----------
+        job_id: int, default: None
+            ID of the job
+
+        Returns
+        -------
+        bool:
+            False if no such job is running
+        """
+        with self.lock:
+            job: Optional[Job] = self.running.get(job_id)
+        if job is None:
+            return False
+        job.stop_event.set()
+        if job.thread is not threading.current_thread():
+            job.thread.join()
+
+        return True
+
+    def jobs(self) -> List[Job]:
+        """
+        Returns the running jobs
+        """
+        with self.lock:
+            return sorted(self.running.values(), key=lambda job: job.job_id)
+
+
+def today_at(value: str = None) -> Optional[datetime]:
+    """
+    Today at a time of the day, as given to SCHEDULE or RULE TIME
+
+    Parameters
+    ----------
+    value: str, default: None
+        HH:MM, HH:MM:SS or HH:MM:SS.ffffff
+
+    Returns
+    -------
+    Optional[datetime]:
+        None if the time is wrong
+    """
+    for time_format in ("%H:%M:%S.%f", "%H:%M:%S", "%H:%M"):
+        try:
+            clock: datetime = datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        return datetime.now().replace(hour=clock.hour, minute=clock.minute, second=clock.second,
+                                      microsecond=clock.microsecond)
+    return None
@@ -0,0 +1,170 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime
+from logs import log_event
+from commit_writer import Commit, CommitWriter
+import threading
+import logging
+import codecs
+import atexit
+import json
+import os
+
+ORDER_JOURNAL_FILE: str = "order_journal.jsonl"
+# Kinds after which nothing more happens to a leg
+FINAL_KINDS: Tuple[str, ...] = ("fill", "reject")
+# Seconds a durable record waits for its commit before the order goes on without it
+DURABLE_TIMEOUT: float = 5.0
+
+writer: Optional[CommitWriter] = None
+
+
+class Journal:
+    """
+    Append-only journal of every order leg
+
+    Each leg is recorded as it goes through intent, submit, ack, fill or reject, and a failed spread records the
+    revert of its buying leg before the revert is placed. Intents and reverts are on disk before anything is sent,
+    the other records follow in the next commit. Legs are identified by their client order tag, so after a crash the
+    journal tells which orders were in flight, and recover_orders finds out how they ended.
+
+    ...
+
+    Methods
+    -------
+    start(path: str = ORDER_JOURNAL_FILE) -> None:
+        Starts the journal writer
+    record(kind: str = None, account_id: str = None, tag: str = None, durable: bool = False, **fields) -> None:
+        Appends a record of one leg
+    replay(path: str = ORDER_JOURNAL_FILE) -> Tuple[Dict[Tuple[str, str], Dict], Dict[Tuple[str, str], Dict]]:
+        Rebuilds the last state of every leg and the reverts decided
+    compact(path: str = ORDER_JOURNAL_FILE) -> None:
+        Rewrites the journal with only the legs and reverts of the day still open
+    """
+
+    @staticmethod
+    def start(path: str = ORDER_JOURNAL_FILE) -> None:
+        """
+        Starts the journal writer
+
+        Parameters
+        ----------
+        path: str, default: ORDER_JOURNAL_FILE
+            Journal file, appended to
+        """
+        global writer
+        if writer is not None:
+            return None
+        writer = CommitWriter(name="order-journal", path=lambda: path, on_error=_failed)
+        writer.start()
+        atexit.register(writer.stop)
+
+    @staticmethod
+    def record(kind: str = None, account_id: str = None, tag: str = None, durable: bool = False, **fields) -> None:
+        """
+        Appends a record of one leg
+
+        Nothing is recorded until the journal is started or once its writer has stopped on an error. A durable record
+        waits at most DURABLE_TIMEOUT seconds for its commit.
+
+        Parameters
+        ----------
+        kind: str, default: None
+            intent, submit, ack, fill, reject, unknown or revert
+        account_id: str, default: None
+            Account ID of the account
+        tag: str, default: None
+            Client order tag of the leg
+        durable: bool, default: False
+            Waits until the record is on disk
+        fields:
+            Order ID, symbol, token, trade type or quantity of the leg
+        """
+        if writer is None or not writer.alive():
+            return None
+        line: str = json.dumps(dict({"time": datetime.now().isoformat(timespec="milliseconds"), "kind": kind,
+                                     "account_id": account_id, "tag": tag}, **fields)) + "\n"
+        commit: Commit = writer.append(line=line)
+        if durable and not commit.done.wait(timeout=DURABLE_TIMEOUT):
+            log_event(event="journal_commit_late", level=logging.WARNING, kind=kind, account=account_id, tag=tag,
+                      timeout=DURABLE_TIMEOUT)
+
+    @staticmethod
+    def replay(path: str = ORDER_JOURNAL_FILE) -> Tuple[Dict[Tuple[str, str], Dict], Dict[Tuple[str, str], Dict]]:
+        """
+        Rebuilds the last state of every leg and the reverts decided
+
+        Parameters
+        ----------
+        path: str, default: ORDER_JOURNAL_FILE
+            Journal file
+
+        Returns
+        -------
+        Dict[Tuple[str, str], Dict], Dict[Tuple[str, str], Dict]:
+            Fields of every leg merged in order and revert records, both keyed by account ID and tag
+        """
+        legs: Dict[Tuple[str, str], Dict] = {}
+        reverts: Dict[Tuple[str, str], Dict] = {}
+        if not os.path.exists(path):
+            return legs, reverts
+        journal_file = codecs.open(path, "r", encoding="utf-8")
+        for lin in journal_file:
+            if len(lin.strip()) == 0:
+                continue
+            try:
+                record: Dict = json.loads(lin)
+            except ValueError:
+                # A crash in the middle of a commit can leave a partial last line
+                continue
+            key: Tuple[str, str] = (record["account_id"], record["tag"])
+            if record["kind"] == "revert":
+                reverts[key] = record
+                continue
+            leg: Dict = legs.setdefault(key, {})
+            if leg.get("kind") in FINAL_KINDS:
+                continue
+            leg.update(record)
+        journal_file.close()
+
+        return legs, reverts
+
+    @staticmethod
+    def compact(path: str = ORDER_JOURNAL_FILE) -> None:
+        """
+        Rewrites the journal with only the legs and reverts of the day still open
+
+        Every leg kept is written as one record holding its merged fields, so the journal replayed on the next start
+        only grows with the orders of the day. Records waiting for the writer are committed first, and no commit is
+        written while the journal is rewritten.
+
+        Parameters
+        ----------
+        path: str, default: ORDER_JOURNAL_FILE
+            Journal file
+        """
+        if not os.path.exists(path):
+            return None
+        lock: threading.Lock = threading.Lock()
+        if writer is not None:
+            writer.sync()
+            lock = writer.lock
+        with lock:
+            legs, reverts = Journal.replay(path=path)
+            today: str = date.today().isoformat()
+            kept: List[Dict] = [leg for leg in legs.values()
+                                if leg.get("kind") not in FINAL_KINDS and leg["time"][:10] == today]
+            kept += [revert for key, revert in reverts.items()
+                     if legs.get(key, {}).get("kind") not in FINAL_KINDS and revert["time"][:10] == today]
+            temp_path: str = path + ".tmp"
+            journal_file = codecs.open(temp_path, "w", encoding="utf-8")
+            for record in kept:
+                journal_file.write(json.dumps(record) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+            journal_file.close()
+            os.replace(temp_path, path)
+
+
+def _failed(exp: Exception = None) -> None:
+    log_event(event="journal_write_failed", level=logging.ERROR, exc_info=True, error=str(exp))
+    print("Order journal not written: " + str(exp) + ", orders are placed without it\n")
@@ -2,13 +2,17 @@ import codecs
 from SmartApi import SmartConnect
 import pyotp
 from account import Account
+from metrics import Metrics
 from typing import List, Dict, Optional
+from logs import log_event
 import logging
+from retry import Retry, RetryExhausted
+from session import SessionManager
 import constants as Const
-from time import sleep
-import sys
+from concurrent.futures import ThreadPoolExecutor
 
-log = logging.getLogger()
+# Accounts logged in at the same time
+LOGIN_WORKERS: int = 8
 
 
 class Login:
@@ -22,8 +26,14 @@ class Login:
     login(api_key:str = None, totp_qr: str = None, username: str = None, pin: str = None) ->
         (Optional[SmartConnect], Optional[str], Optional[str], Dict[str, bool]):
         Login to Angel One for any particular account
-    read_credentials_and_login() -> (List[Account], Optional[str]):
+    read_credentials_and_login(shard: int = 0, shards: int = 1) -> (List[Account], Optional[str]):
         Read credentials from file and login
+    read_credentials(shard: int = 0, shards: int = 1) -> (List[Dict], Optional[str]):
+        Read the credentials of the accounts of a shard from file
+    login_all(credentials: List[Dict] = None) -> List[Account]:
+        Logs in all accounts, several at the same time
+    login_account(credentials: Dict = None) -> Optional[Account]:
+        Logs in one account and reads its balance
     """
 
     @staticmethod
@@ -53,10 +63,12 @@ class Login:
         totp: str = pyotp.TOTP(totp_qr).now()
         exception_type: Dict[str, bool] = {}
         try:
-            smartapi: SmartConnect = SmartConnect(api_key)
+            smartapi: SmartConnect = SmartConnect(api_key, timeout=Const.REQUEST_TIMEOUT)
             data: Optional[Dict] = smartapi.generateSession(username, pin, totp)["data"]
         except Exception as exp:
-            log.exception("Session generation exception: " + str(exp))
+            log_event(event="login_failed", level=logging.WARNING, exc_info=True, endpoint="login", account=username,
+                      error=str(exp))
+            Metrics.record_failure(endpoint="login", account_id=username, exp=exp)
             exception_type[Const.SESSION_GENERATION_EXCEPTION] = True
             return None, None, None, exception_type
         if data is None:
@@ -65,7 +77,9 @@ class Login:
         try:
             profile: Optional[Dict] = smartapi.getProfile(refresh_token)["data"]
         except Exception as exp:
-            log.exception("Profile fetching exception: " + str(exp))
+            log_event(event="login_failed", level=logging.WARNING, exc_info=True, endpoint="profile", account=username,
+                      error=str(exp))
+            Metrics.record_failure(endpoint="profile", account_id=username, exp=exp)
             exception_type[Const.PROFILE_FETCHING_EXCEPTION] = True
             return None, None, None, exception_type
         if profile is None:
@@ -73,33 +87,65 @@ class Login:
         try:
             smartapi.generateToken(refresh_token)
         except Exception as exp:
-            log.exception("Token generation exception: " + str(exp))
+            log_event(event="login_failed", level=logging.WARNING, exc_info=True, endpoint="token", account=username,
+                      error=str(exp))
+            Metrics.record_failure(endpoint="token", account_id=username, exp=exp)
             exception_type[Const.TOKEN_GENERATION_EXCEPTION] = True
             return None, None, None, exception_type
         return smartapi, refresh_token, profile["name"], exception_type
 
     @staticmethod
-    def read_credentials_and_login() -> (List[Account], Optional[str]):
+    def read_credentials_and_login(shard: int = 0, shards: int = 1) -> (List[Account], Optional[str]):
         """
         Read credentials from file and login
 
         For each account, username, api key, pin and totp_qr are fetched and an attempt to login is made.
         If successful, a smartconnect object and refresh token are generated.
         All credentials are stored in credentials.txt
+        With shards, only every shards-th set of credentials starting at the given shard is logged in, so a worker
+        process owns the sessions of its own accounts only. Up to LOGIN_WORKERS accounts are logged in at the same
+        time.
+
+        Parameters
+        ----------
+        shard: int, default: 0
+            Shard whose accounts are logged in
+        shards: int, default: 1
+            Number of shards the accounts are split into
 
         Returns
         -------
         List[Account], Optional[str]:
             List of account objects, my account id
         """
+        credentials, my_account_id = Login.read_credentials(shard=shard, shards=shards)
+        return Login.login_all(credentials=credentials), my_account_id
+
+    @staticmethod
+    def read_credentials(shard: int = 0, shards: int = 1) -> (List[Dict], Optional[str]):
+        """
+        Read the credentials of the accounts of a shard from file
+
+        Parameters
+        ----------
+        shard: int, default: 0
+            Shard whose accounts are read
+        shards: int, default: 1
+            Number of shards the accounts are split into
+
+        Returns
+        -------
+        List[Dict], Optional[str]:
+            Credentials of every account in the order of the file, my account id
+        """
         credentials_file = codecs.open("credentials.txt", "r")
-        accounts: List[Account] = []
+        credentials: List[Dict] = []
         my_account_id: Optional[str] = None
         username: Optional[str] = None
         api_key: Optional[str] = None
         pin: Optional[str] = None
         capital_to_use: Optional[float] = None
-        exception_present: bool = False
+        position: int = -1
         for lin in credentials_file:
             if lin[0] == "#":
                 continue
@@ -123,66 +169,85 @@ class Login:
             elif key == "capital_to_use":
                 capital_to_use = float(value)
             elif key == "totp_qr":
-                totp_qr: str = value
-                exception_count: int = 0
-                while True:
-                    smartapi, refresh_token, name, exception_type = Login.login(api_key=api_key,
-                                                                            totp_qr=totp_qr,
-                                                                            username=username,
-                                                                            pin=pin)
-                    if exception_type != {}:
-                        if not exception_present:
-                            exception_present = True
-                            print("Login exception occurring: " + list(exception_type.keys())[0]
-                                  + ": " + str(exception_count))
-                        else:
-                            exception_count += 1
-                            sys.stdout.write("\033[F")
-                            sys.stdout.write("\033[K")
-                            print("Login exception occurring: " + list(exception_type.keys())[0]
-                                  + ": " + str(exception_count))
-                    elif exception_type == {}:
-                        if exception_present:
-                            exception_present = False
-                            print("Login exception solved.\n")
-                        break
-                    sleep(1)
-                if smartapi is None or refresh_token is None or name is None:
+                position += 1
+                if position % shards != shard:
                     continue
-                current_account: Account = Account()
-                current_account.account_id = username
-                current_account.capital_to_use = capital_to_use
-                exception_count = 0
-                rms_exception_present: bool = False
-                while True:
-                    try:
-                        rms: Optional[Dict] = smartapi.rmsLimit()["data"]
-                        if rms_exception_present:
-                            print("RMS exception solved.\n")
-                            rms_exception_present = False
-                        break
-                    except Exception as exp:
-                        log.exception("RMS exception: " + str(exp))
-                        exception_count += 1
-                        if rms_exception_present:
-                            sys.stdout.write("\033[F")
-                            sys.stdout.write("\033[K")
-                        rms_exception_present = True
-                        print("RMS exception occurring: " + str(exception_count))
-                    sleep(1)
-                if rms is None:
-                    continue
-                current_account.balance = float(rms["availablecash"])
-                if current_account.capital_to_use is None:
-                    current_account.capital_to_use = current_account.balance
-                else:
-                    current_account.capital_to_use = min(current_account.capital_to_use, current_account.balance)
-                current_account.account_name = name
-                current_account.smartapi = smartapi
-                current_account.refresh_token = refresh_token
-                accounts.append(current_account)
+                credentials.append({"username": username, "api_key": api_key, "pin": pin,
+                                    "capital_to_use": capital_to_use, "totp_qr": value})
             else:
                 break
         credentials_file.close()
 
-        return accounts, my_account_id
+        return credentials, my_account_id
+
+    @staticmethod
+    def login_all(credentials: List[Dict] = None) -> List[Account]:
+        """
+        Logs in all accounts, several at the same time
+
+        Parameters
+        ----------
+        credentials: List[Dict], default: None
+            Credentials of every account as read by read_credentials
+
+        Returns
+        -------
+        List[Account]:
+            Accounts logged in, in the order of the credentials
+        """
+        # Logins wait on the broker, so accounts are logged in together and kept in the order of the file
+        with ThreadPoolExecutor(max_workers=LOGIN_WORKERS, thread_name_prefix="login") as pool:
+            accounts: List[Account] = [account for account in pool.map(Login.login_account, credentials)
+                                       if account is not None]
+
+        return accounts
+
+    @staticmethod
+    def login_account(credentials: Dict = None) -> Optional[Account]:
+        """
+        Logs in one account and reads its balance
+
+        Parameters
+        ----------
+        credentials: Dict, default: None
+            { "username": str, "api_key": str, "pin": str, "capital_to_use": float, "totp_qr": str }
+
+        Returns
+        -------
+        Optional[Account]:
+            None if the login or the balance failed
+        """
+        username: str = credentials["username"]
+
+        def attempt_login() -> (Optional[SmartConnect], Optional[str], Optional[str]):
+            session, token, account_name, exception_type = Login.login(api_key=credentials["api_key"],
+                                                                       totp_qr=credentials["totp_qr"],
+                                                                       username=username, pin=credentials["pin"])
+            if exception_type != {}:
+                raise Exception(list(exception_type.keys())[0])
+            return session, token, account_name
+
+        try:
+            smartapi, refresh_token, name = Retry.call(fn=attempt_login, endpoint="session", account_id=username,
+                                                       label="Login")
+        except RetryExhausted:
+            return None
+        if smartapi is None or refresh_token is None or name is None:
+            return None
+        current_account: Account = Account()
+        current_account.account_id = username
+        try:
+            rms: Optional[Dict] = Retry.call(fn=lambda: smartapi.rmsLimit()["data"], endpoint="rms",
+                                             account_id=username, label="RMS")
+        except RetryExhausted:
+            return None
+        if rms is None:
+            return None
+        current_account.capital_limit = credentials["capital_to_use"]
+        current_account.set_balance(balance=float(rms["availablecash"]))
+        current_account.account_name = name
+        current_account.smartapi = smartapi
+        current_account.refresh_token = refresh_token
+        SessionManager.register(account_id=username, smartapi=smartapi, refresh_token=refresh_token,
+                                totp_qr=credentials["totp_qr"], pin=credentials["pin"])
+        return current_account
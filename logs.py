@@ -0,0 +1,177 @@
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Dict, List, Optional
+from datetime import datetime
+import threading
+import logging
+import atexit
+import queue
+import json
+
+log = logging.getLogger()
+
+# Records written to disk in one go at most
+BATCH_SIZE: int = 500
+# Seconds the writer waits for more records before writing what it has
+BATCH_WAIT: float = 0.2
+MAX_BYTES: int = 20 * 1024 * 1024
+BACKUP_COUNT: int = 5
+
+records: queue.SimpleQueue = queue.SimpleQueue()
+writer: Optional["LogWriter"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one json line
+
+    The message is the event name, fields given with log_event are added as they are and a traceback, if any, is
+    added as error_trace.
+    """
+
+    def format(self, record: logging.LogRecord = None) -> str:
+        line: Dict = {"time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+                      "level": record.levelname,
+                      "thread": record.threadName,
+                      "event": record.getMessage()}
+        line.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            line["error_trace"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+class EnqueueHandler(QueueHandler):
+    """
+    Puts records on the queue of the log writer as they are
+
+    Formatting, tracebacks included, is left to the writer thread, so logging costs the calling thread a queue put.
+    """
+
+    def prepare(self, record: logging.LogRecord = None) -> logging.LogRecord:
+        return record
+
+
+class LogWriter(threading.Thread):
+    """
+    Single thread writing all log records to a rotating file
+
+    Records are taken from the queue in batches and every batch is written and flushed once. A batch which cannot be
+    written, such as on a full disk, is reported on stderr and dropped, and the writer goes on with the next one.
+
+    ...
+
+    Methods
+    -------
+    run(self) -> None:
+        Writes batches until stopped
+    stop(self) -> None:
+        Writes what is left and stops
+    """
+
+    def __init__(self, path: str = None):
+        super().__init__(name="log-writer", daemon=True)
+        self.handler: RotatingFileHandler = RotatingFileHandler(filename=path, maxBytes=MAX_BYTES,
+                                                                backupCount=BACKUP_COUNT, encoding="utf-8",
+                                                                delay=False)
+        self.handler.setFormatter(JsonFormatter())
+        self.stop_event: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            self._write(batch=self._next_batch(wait=BATCH_WAIT))
+        self._write(batch=self._next_batch(wait=0))
+
+    def stop(self) -> None:
+        """
+        Writes what is left and stops
+        """
+        self.stop_event.set()
+        self.join(timeout=5)
+
+    def _next_batch(self, wait: float = None) -> List[logging.LogRecord]:
+        batch: List[logging.LogRecord] = []
+        try:
+            batch.append(records.get(timeout=wait) if wait else records.get_nowait())
+            while len(batch) < BATCH_SIZE:
+                batch.append(records.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch: List[logging.LogRecord] = None) -> None:
+        if not batch:
+            return None
+        try:
+            # A failed rollover leaves the handler without a file, it is opened again as the stock handler would
+            if self.handler.stream is None:
+                self.handler.stream = self.handler._open()
+            lines: List[str] = []
+            # Size the file would have with the lines not written yet, rolled over as the stock handler would
+            size: int = self.handler.stream.tell()
+            for record in batch:
+                try:
+                    line: str = self.handler.format(record) + "\n"
+                except Exception:
+                    continue
+                if self.handler.maxBytes > 0 and size > 0 and size + len(line) >= self.handler.maxBytes:
+                    self._flush(lines=lines)
+                    lines = []
+                    self.handler.doRollover()
+                    size = 0
+                lines.append(line)
+                size += len(line)
+            self._flush(lines=lines)
+        except OSError:
+            self.handler.handleError(batch[0])
+
+    def _flush(self, lines: List[str] = None) -> None:
+        if not lines:
+            return None
+        # The stream is opened by _write before the first line of a batch and by doRollover after every rollover
+        self.handler.acquire()
+        try:
+            self.handler.stream.write("".join(lines))
+            self.handler.flush()
+        finally:
+            self.handler.release()
+
+
+def start_logging(path: str = "all.log", level: int = logging.INFO) -> None:
+    """
+    Sends all logging through a queue to a single writer thread
+
+    Parameters
+    ----------
+    path: str, default: "all.log"
+        Log file, rotated every MAX_BYTES
+    level: int, default: logging.INFO
+        Lowest level written
+    """
+    global writer
+    if writer is not None:
+        return None
+    writer = LogWriter(path=path)
+    writer.start()
+    root: logging.Logger = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(EnqueueHandler(records))
+    root.setLevel(level)
+    atexit.register(writer.stop)
+
+
+def log_event(event: str = None, level: int = logging.INFO, exc_info: bool = False, **fields) -> None:
+    """
+    Logs a structured event
+
+    Parameters
+    ----------
+    event: str, default: None
+        Name of the event
+    level: int, default: logging.INFO
+        Level of the event
+    exc_info: bool, default: False
+        Adds the traceback of the exception being handled
+    fields:
+        Values written with the event, such as account, order_id, endpoint or latency
+    """
+    log.log(level, event, exc_info=exc_info, extra={"fields": fields})
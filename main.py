@@ -1,12 +1,16 @@
+from startup import StartupProfile, BackgroundStep
 from login import Login
 from trading_symbols import TradingSymbols
-from typing import Optional
+from typing import List, Optional
 from account import Account
-import logging
+from logs import start_logging, log_event
+from journal import Journal
+from history import HistoryStore
+from session import SessionManager
+from order_recovery import recover_orders
+import market_data
 import command_driver as Driver
-
-
-logging.basicConfig(filename='all.log', encoding='utf-8', level=logging.WARNING)
+import sys
 
 
 if __name__ == '__main__':
@@ -17,19 +21,92 @@ if __name__ == '__main__':
         entry:
             ENTRY <index> <strike> <expiry>
             ENTRY MIDCPNIFTY 10525CE 29JAN24
+            ENTRY NIFTY ATM-2PE NEAREST
+            ENTRY NIFTY D30PE NEXT
         exit:
             EXIT <index> <strike> <expiry>
             EXIT MIDCPNIFTY 10525CE 29JAN24
+        basket:
+            BASKET <index> <legs> <expiry> [<lots>]
+            BASKET NIFTY +21800PE,-22000PE,-22500CE,+22700CE 25APR24
+            EXIT NIFTY +21800PE,-22000PE,-22500CE,+22700CE 25APR24
+        exit everything:
+            EXITALL
+        place the orders suggested by the last reconciliation:
+            FIX
+        scheduled entry:
+            SCHEDULE <HH:MM:SS> ENTRY <index> <strike> <expiry>
+        margin:
+            MARGIN <index> <strike>,<strike> <expiry>
+            MARGIN WATCH <index> <strike> <expiry>
+            MARGIN UNWATCH <index> <strike> <expiry>
+        batch:
+            BATCH <file>
+            BATCH <command>; <command>
         details:
             DETAILS
         p&l:
             PNL
+        background jobs:
+            JOBS
+            STOP <job id>
+        close details or p&l:
+            STOP
+        trade history:
+            HISTORY PNL [<account id>] [<YYYY-MM-DD>]
+            HISTORY SLIPPAGE [<YYYY-MM-DD>]
+            HISTORY LATENCY [<days>]
+        metrics endpoint:
+            METRICS [port]
+            METRICS STOP
+        live quotes:
+            QUOTE <index> <strike>,<strike> <expiry>
+            QUOTE
+        autoexit:
+            AUTOEXIT SL=<stoploss> TGT=<target>
+        exit rules:
+            RULE TRAIL=<amount>
+            RULE MAXLOSS=<amount>
+            RULE TIME=<HH:MM>
+            RULE SPREADSL=<amount> <index> <strike> <expiry>
+            RULES
+            RULE DEL <id>
+
+    Start with --shards <count> to split the accounts over that many worker processes. ENTRY, EXIT, BASKET, EXITALL,
+    BATCH and FIX then run in every worker on its own accounts, SCHEDULE waits in the main process and runs in every
+    worker at its time, PNL prints the P&L gathered from all of them once, and HISTORY works as usual.
+
+    Start with --record-ticks <file> to keep the ticks received for QUOTE in a file, and with --replay-ticks <file>
+    to replay such a file instead of connecting to the broker's websocket.
+
+    Start with --profile-startup to print how long imports, credentials, logins, symbols and order recovery took
+    before the first prompt.
     """
+    StartupProfile.lap(phase="imports")
+    start_logging(path="all.log")
     print("\n")
-    accounts, my_account_id = Login.read_credentials_and_login()
+    shards: int = 1
+    if "--shards" in sys.argv[1:]:
+        # Only a sharded run needs multiprocessing and the worker code
+        from shards import ShardPool, shards_argument
+        shards = shards_argument(arguments=sys.argv[1:])
+    if shards > 1:
+        pool: ShardPool = ShardPool()
+        if not pool.start(count=shards) or pool.my_account_id is None:
+            exit(1)
+        print("------------------------------------------------------------\n")
+        while True:
+            print("Command: ")
+            command: str = input()
+            pool.driver(command=command)
+    # tokens.json is parsed while the logins wait on the broker
+    symbols: BackgroundStep = StartupProfile.background(phase="symbols", target=TradingSymbols.initialize)
+    credentials, my_account_id = Login.read_credentials()
+    StartupProfile.lap(phase="credentials")
+    accounts: List[Account] = Login.login_all(credentials=credentials)
+    StartupProfile.lap(phase="logins")
     if my_account_id is None:
         exit(1)
-    TradingSymbols.initialize()
     total_balance: float = 0.0
     my_account: Optional[Account] = None
     for account in accounts:
@@ -45,6 +122,18 @@ if __name__ == '__main__':
     # print("Total balance: Rs " + str(total_balance))
     print("Total valid clients: " + str(len(accounts)))
     print("------------------------------------------------------------\n")
+    SessionManager.start()
+    Journal.start()
+    HistoryStore.start()
+    recover_orders(accounts=accounts)
+    StartupProfile.lap(phase="order recovery")
+    market_data.replay_ticks = market_data.path_argument(arguments=sys.argv[1:], flag="--replay-ticks")
+    market_data.record_ticks = market_data.path_argument(arguments=sys.argv[1:], flag="--record-ticks")
+    symbols.join()
+    StartupProfile.lap(phase="waiting for symbols")
+    log_event(event="startup", accounts=len(accounts), seconds=StartupProfile.summary())
+    if "--profile-startup" in sys.argv[1:]:
+        StartupProfile.report()
     while True:
         print("Command: ")
         command: str = input()
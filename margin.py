@@ -0,0 +1,176 @@
+from account import Account
+from spread import Spread
+from metrics import Metrics
+from typing import Dict, List, Optional, Tuple
+from time import monotonic
+import constants as Const
+import threading
+
+# (buying token, selling token, quantity per lot) -> (margin per lot, monotonic time of the quote)
+quotes: Dict[Tuple[str, str, int], Tuple[float, float]] = {}
+# Spreads kept warm by the refresh job
+watched: Dict[Tuple[str, str, int], Spread] = {}
+quote_lock: threading.Lock = threading.Lock()
+
+
+class MarginService:
+    """
+    Cache of margin quotes shared by all commands
+
+    Quotes are keyed by the tokens of both legs and the quantity per lot and are reused for MARGIN_TTL seconds.
+    Watched spreads are quoted again in the background before their quote expires, so ENTRY on a watched strike
+    usually finds a quote without waiting on the broker.
+
+    ...
+
+    Methods
+    -------
+    get(spread: Spread = None, account: Account = None, max_age: float = Const.MARGIN_TTL) -> Optional[float]:
+        Returns the margin per lot of a spread, from the cache if recent enough
+    get_many(spreads: List[Spread] = None, account: Account = None, max_age: float = Const.MARGIN_TTL)
+             -> List[Optional[float]]:
+        Returns the margin per lot of several spreads, quoting the missing ones in parallel
+    watch(spread: Spread = None) -> None:
+        Keeps the quote of a spread warm
+    unwatch(spread: Spread = None) -> bool:
+        Stops keeping the quote of a spread warm
+    watching() -> List[Spread]:
+        Returns the watched spreads
+    refresh(account: Account = None, stop_event: threading.Event = None) -> None:
+        Quotes the watched spreads again until stopped
+    """
+
+    @staticmethod
+    def get(spread: Spread = None, account: Account = None, max_age: float = Const.MARGIN_TTL) -> Optional[float]:
+        """
+        Returns the margin per lot of a spread, from the cache if recent enough
+
+        The margin per lot of the spread is set either way
+
+        Parameters
+        ----------
+        spread: Spread, default: None
+            Spread to quote
+        account: Account, default: None
+            Account used to ask the broker
+        max_age: float, default: Const.MARGIN_TTL
+            Oldest quote in seconds that can be reused
+
+        Returns
+        -------
+        Optional[float]:
+            Margin required to place one lot of spread
+        """
+        key: Tuple[str, str, int] = _key(spread=spread)
+        with quote_lock:
+            quote: Optional[Tuple[float, float]] = quotes.get(key)
+        if quote is not None and monotonic() - quote[1] <= max_age:
+            Metrics.increment(name="margin_quotes_total", labels={"source": "cache"})
+            spread.margin_per_lot = quote[0]
+            return quote[0]
+        Metrics.increment(name="margin_quotes_total", labels={"source": "broker"})
+        margin_per_lot: Optional[float] = spread.get_margin_per_lot(smartapi=account.smartapi,
+                                                                    account_id=account.account_id)
+        if margin_per_lot is not None:
+            with quote_lock:
+                quotes[key] = (margin_per_lot, monotonic())
+        return margin_per_lot
+
+    @staticmethod
+    def get_many(spreads: List[Spread] = None, account: Account = None,
+                 max_age: float = Const.MARGIN_TTL) -> List[Optional[float]]:
+        """
+        Returns the margin per lot of several spreads, quoting the missing ones in parallel
+
+        Parameters
+        ----------
+        spreads: List[Spread], default: None
+            Spreads to quote
+        account: Account, default: None
+            Account used to ask the broker
+        max_age: float, default: Const.MARGIN_TTL
+            Oldest quote in seconds that can be reused
+
+        Returns
+        -------
+        List[Optional[float]]:
+            Margin per lot of every spread, in the same order
+        """
+        margins: List[Optional[float]] = [None] * len(spreads)
+
+        def quote(position: int) -> None:
+            margins[position] = MarginService.get(spread=spreads[position], account=account, max_age=max_age)
+
+        all_threads: List[threading.Thread] = []
+        for position in range(len(spreads)):
+            thread: threading.Thread = threading.Thread(target=quote, kwargs={"position": position}, name="")
+            all_threads.append(thread)
+        for thread in all_threads:
+            thread.daemon = False
+            thread.start()
+        for thread in all_threads:
+            thread.join()
+
+        return margins
+
+    @staticmethod
+    def watch(spread: Spread = None) -> None:
+        """
+        Keeps the quote of a spread warm
+
+        Parameters
+        ----------
+        spread: Spread, default: None
+            Spread to watch
+        """
+        with quote_lock:
+            watched[_key(spread=spread)] = spread
+
+    @staticmethod
+    def unwatch(spread: Spread = None) -> bool:
+        """
+        Stops keeping the quote of a spread warm
+
+        Parameters
+        ----------
+        spread: Spread, default: None
+            Spread to stop watching
+
+        Returns
+        -------
+        bool:
+            False if the spread was not watched
+        """
+        with quote_lock:
+            return watched.pop(_key(spread=spread), None) is not None
+
+    @staticmethod
+    def watching() -> List[Spread]:
+        """
+        Returns the watched spreads
+        """
+        with quote_lock:
+            return list(watched.values())
+
+    @staticmethod
+    def refresh(account: Account = None, stop_event: threading.Event = None) -> None:
+        """
+        Quotes the watched spreads again until stopped
+
+        Quotes are renewed every MARGIN_REFRESH_INTERVAL seconds, well before they expire
+
+        Parameters
+        ----------
+        account: Account, default: None
+            Account used to ask the broker
+        stop_event: threading.Event, default: None
+            Set to stop refreshing
+        """
+        while not stop_event.is_set():
+            MarginService.get_many(spreads=MarginService.watching(), account=account,
+                                   max_age=Const.MARGIN_REFRESH_INTERVAL)
+            stop_event.wait(timeout=Const.MARGIN_REFRESH_INTERVAL)
+
+
+def _key(spread: Spread = None) -> Tuple[str, str, int]:
+    return spread.buying_order.token, spread.selling_order.token, spread.buying_order.qty
@@ -0,0 +1,503 @@
+from SmartApi import SmartConnect
+from logs import log_event
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from array import array
+from abc import ABC, abstractmethod
+from time import time
+import threading
+import logging
+import codecs
+import json
+
+# Last traded price, best bid, best ask and epoch time of the last tick
+Quote = Tuple[float, float, float, float]
+Listener = Callable[[str, Quote], None]
+
+# Values kept per token in the cache, in the order of Quote
+QUOTE_FIELDS: int = 4
+# Exchange type of NFO and the subscription mode carrying the best bid and ask, in the broker's websocket protocol
+NFO_EXCHANGE_TYPE: int = 2
+SNAP_QUOTE_MODE: int = 3
+# Identifies the subscriptions of this program in errors sent back by the broker, 10 characters
+CORRELATION_ID: str = "copytrade0"
+# Seconds between a closed connection and the next one
+RECONNECT_DELAY: float = 2.0
+
+hub: Optional["MarketDataHub"] = None
+hub_lock: threading.Lock = threading.Lock()
+# Files of ticks replayed instead of the broker's websocket, and recorded for a later replay, None for neither
+replay_ticks: Optional[str] = None
+record_ticks: Optional[str] = None
+
+
+class QuoteCache:
+    """
+    Last trade, bid and ask of every token kept in one flat array
+
+    Every token gets a slot of QUOTE_FIELDS doubles the first time it ticks, so the cache holds a few hundred bytes
+    per token instead of a dictionary per quote, and a read is one slice of the array.
+
+    ...
+
+    Methods
+    -------
+    update(self, token: str = None, ltp: float = None, bid: float = None, ask: float = None, at: float = None) -> bool:
+        Stores a tick and tells whether the price, bid or ask changed
+    get(self, token: str = None) -> Optional[Quote]:
+        Latest quote of a token, None if it never ticked
+    """
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.values: array = array("d")
+        self.lock: threading.Lock = threading.Lock()
+
+    def update(self, token: str = None, ltp: float = None, bid: float = None, ask: float = None,
+               at: float = None) -> bool:
+        """
+        Stores a tick and tells whether the price, bid or ask changed
+
+        Parameters
+        ----------
+        token: str, default: None
+            Symbol token
+        ltp: float, default: None
+            Last traded price
+        bid: float, default: None
+            Best bid
+        ask: float, default: None
+            Best ask
+        at: float, default: None
+            Epoch time of the tick
+
+        Returns
+        -------
+        bool
+        """
+        with self.lock:
+            slot: Optional[int] = self.slots.get(token)
+            if slot is None:
+                slot = len(self.values)
+                self.slots[token] = slot
+                self.values.extend((ltp, bid, ask, at))
+                return True
+            changed: bool = (self.values[slot] != ltp or self.values[slot + 1] != bid
+                             or self.values[slot + 2] != ask)
+            self.values[slot:slot + QUOTE_FIELDS] = array("d", (ltp, bid, ask, at))
+        return changed
+
+    def get(self, token: str = None) -> Optional[Quote]:
+        """
+        Latest quote of a token, None if it never ticked
+
+        Parameters
+        ----------
+        token: str, default: None
+            Symbol token
+
+        Returns
+        -------
+        Optional[Quote]
+        """
+        with self.lock:
+            slot: Optional[int] = self.slots.get(token)
+            if slot is None:
+                return None
+            return tuple(self.values[slot:slot + QUOTE_FIELDS])
+
+
+class Feed(ABC):
+    """
+    Source of ticks for the market-data hub
+
+    ...
+
+    Methods
+    -------
+    start(self, on_tick: Callable[[str, float, float, float, float], None] = None) -> None:
+        Starts delivering ticks of the subscribed tokens
+    subscribe(self, tokens: List[str] = None) -> None:
+        Starts the ticks of tokens
+    unsubscribe(self, tokens: List[str] = None) -> None:
+        Stops the ticks of tokens
+    stop(self) -> None:
+        Stops delivering ticks
+    """
+
+    @abstractmethod
+    def start(self, on_tick: Callable[[str, float, float, float, float], None] = None) -> None:
+        pass
+
+    @abstractmethod
+    def subscribe(self, tokens: List[str] = None) -> None:
+        pass
+
+    @abstractmethod
+    def unsubscribe(self, tokens: List[str] = None) -> None:
+        pass
+
+    @abstractmethod
+    def stop(self) -> None:
+        pass
+
+
+class SmartFeed(Feed):
+    """
+    Ticks of NFO tokens from the broker's websocket, with the best bid and ask
+
+    The connection runs on its own thread. Every connection is made with the tokens the session holds at that moment,
+    so once the session is renewed a closed connection comes back with the new JWT and feed token instead of the ones
+    of the login. Tokens subscribed before the connection is open are subscribed as soon as it opens, and all of them
+    again after a reconnect.
+
+    ...
+
+    Attributes
+    ----------
+    smartapi: SmartConnect
+        Logged in SmartConnect object whose session the feed uses
+    account_id: str
+        Account ID of the session
+    uri: Optional[str]
+        Address of the websocket, the broker's if None
+    tokens: Set[str]
+        Subscribed tokens
+    """
+
+    def __init__(self, smartapi: SmartConnect = None, account_id: str = None, uri: Optional[str] = None):
+        self.smartapi: SmartConnect = smartapi
+        self.account_id: str = account_id
+        self.uri: Optional[str] = uri
+        self.tokens: Set[str] = set()
+        self.connected: bool = False
+        self.socket = None
+        self.on_tick: Optional[Callable[[str, float, float, float, float], None]] = None
+        self.stop_event: threading.Event = threading.Event()
+        self.lock: threading.Lock = threading.Lock()
+
+    def start(self, on_tick: Callable[[str, float, float, float, float], None] = None) -> None:
+        self.on_tick = on_tick
+        thread: threading.Thread = threading.Thread(target=self._connect, name="market-data", daemon=True)
+        thread.start()
+
+    def subscribe(self, tokens: List[str] = None) -> None:
+        with self.lock:
+            self.tokens.update(tokens)
+            if not self.connected:
+                return None
+        self.socket.subscribe(CORRELATION_ID, SNAP_QUOTE_MODE, [{"exchangeType": NFO_EXCHANGE_TYPE,
+                                                                "tokens": list(tokens)}])
+
+    def unsubscribe(self, tokens: List[str] = None) -> None:
+        with self.lock:
+            self.tokens.difference_update(tokens)
+            if not self.connected:
+                return None
+        self.socket.unsubscribe(CORRELATION_ID, SNAP_QUOTE_MODE, [{"exchangeType": NFO_EXCHANGE_TYPE,
+                                                                  "tokens": list(tokens)}])
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        with self.lock:
+            socket = self.socket
+        if socket is not None:
+            socket.close_connection()
+
+    def _connect(self) -> None:
+        # The websocket client is only loaded once live prices are first needed
+        from SmartApi.smartWebSocketV2 import SmartWebSocketV2
+        while not self.stop_event.is_set():
+            # The client does not retry by itself, a retry of its own would reuse the tokens it was built with
+            socket = SmartWebSocketV2("Bearer " + str(self.smartapi.access_token), self.smartapi.api_key,
+                                      self.account_id, self.smartapi.getfeedToken(), max_retry_attempt=0)
+            if self.uri is not None:
+                socket.ROOT_URI = self.uri
+            socket.on_open = self._opened
+            socket.on_data = self._data
+            socket.on_close = self._closed
+            socket.on_error = self._error
+            with self.lock:
+                self.socket = socket
+            try:
+                socket.connect()
+            except Exception as exp:
+                log_event(event="market_data_connect_failed", level=logging.WARNING, error=str(exp))
+            with self.lock:
+                self.connected = False
+            self.stop_event.wait(timeout=RECONNECT_DELAY)
+
+    def _opened(self, wsapp=None) -> None:
+        with self.lock:
+            self.connected = True
+            tokens: List[str] = list(self.tokens)
+        log_event(event="market_data_connected", tokens=len(tokens))
+        if tokens:
+            self.socket.subscribe(CORRELATION_ID, SNAP_QUOTE_MODE, [{"exchangeType": NFO_EXCHANGE_TYPE,
+                                                                    "tokens": tokens}])
+
+    def _data(self, wsapp=None, data: Dict = None) -> None:
+        # Prices are sent in paise
+        bids: List[Dict] = data.get("best_5_buy_data") or []
+        asks: List[Dict] = data.get("best_5_sell_data") or []
+        self.on_tick(str(data["token"]), data["last_traded_price"] / 100.0,
+                     bids[0]["price"] / 100.0 if bids else 0.0, asks[0]["price"] / 100.0 if asks else 0.0, time())
+
+    def _closed(self, wsapp=None) -> None:
+        with self.lock:
+            self.connected = False
+        log_event(event="market_data_closed", level=logging.WARNING)
+
+    def _error(self, *details) -> None:
+        log_event(event="market_data_error", level=logging.WARNING, error=" ".join(str(detail) for detail in details))
+
+
+class ReplayFeed(Feed):
+    """
+    Recorded ticks replayed through a local websocket server speaking the broker's protocol
+
+    A ReplayServer sends the ticks of the file and a SmartFeed connects to it, so a replay goes through the same
+    websocket client, subscriptions, packet parsing and reconnects as live prices.
+
+    ...
+
+    Attributes
+    ----------
+    server: ReplayServer
+        Local websocket server replaying the ticks
+    feed: SmartFeed
+        Feed connected to the server
+    finished: threading.Event
+        Set once every tick has been replayed
+    """
+
+    def __init__(self, path: str = None, speed: float = 1.0, smartapi: SmartConnect = None, account_id: str = None):
+        from replay_server import ReplayServer
+        self.server: ReplayServer = ReplayServer(path=path, speed=speed)
+        self.feed: SmartFeed = SmartFeed(smartapi=smartapi, account_id=account_id, uri=self.server.uri)
+        self.finished: threading.Event = self.server.finished
+
+    def start(self, on_tick: Callable[[str, float, float, float, float], None] = None) -> None:
+        self.server.start()
+        self.feed.start(on_tick=on_tick)
+
+    def subscribe(self, tokens: List[str] = None) -> None:
+        self.feed.subscribe(tokens=tokens)
+
+    def unsubscribe(self, tokens: List[str] = None) -> None:
+        self.feed.unsubscribe(tokens=tokens)
+
+    def stop(self) -> None:
+        self.feed.stop()
+        self.server.stop()
+
+
+class MarketDataHub:
+    """
+    Single source of live prices of option tokens for every feature
+
+    One feed subscription is kept per token, however many accounts or features want it, and is dropped when the last
+    of them unsubscribes. Ticks update the quote cache, which consumers read whenever they like, and the listeners of
+    a token are called when its price, bid or ask changes. Listeners run on the feed thread, so they should be quick.
+
+    ...
+
+    Methods
+    -------
+    start(self) -> None:
+        Starts the feed
+    subscribe(self, token: str = None, listener: Optional[Listener] = None) -> None:
+        Adds a consumer of a token, with a listener called on every change if given
+    unsubscribe(self, token: str = None, listener: Optional[Listener] = None) -> None:
+        Removes a consumer of a token
+    quote(self, token: str = None) -> Optional[Quote]:
+        Latest quote of a token, None if it never ticked
+    wait(self, token: str = None, timeout: float = None) -> Optional[Quote]:
+        Latest quote of a token, waiting for its first tick if needed
+    tokens(self) -> List[str]:
+        Subscribed tokens
+    stop(self) -> None:
+        Stops the feed and the recording
+    """
+
+    def __init__(self, feed: Feed = None, record_path: Optional[str] = None):
+        self.feed: Feed = feed
+        self.cache: QuoteCache = QuoteCache()
+        self.consumers: Dict[str, int] = {}
+        self.listeners: Dict[str, List[Listener]] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.ticked: threading.Condition = threading.Condition(self.lock)
+        self.record_file = codecs.open(record_path, "a", encoding="utf-8") if record_path is not None else None
+
+    def start(self) -> None:
+        """
+        Starts the feed
+        """
+        self.feed.start(on_tick=self._tick)
+
+    def subscribe(self, token: str = None, listener: Optional[Listener] = None) -> None:
+        """
+        Adds a consumer of a token, with a listener called on every change if given
+
+        Parameters
+        ----------
+        token: str, default: None
+            Symbol token
+        listener: Optional[Listener], default: None
+            Called with the token and its quote every time the quote changes
+        """
+        with self.lock:
+            self.consumers[token] = self.consumers.get(token, 0) + 1
+            if listener is not None:
+                self.listeners.setdefault(token, []).append(listener)
+            first: bool = self.consumers[token] == 1
+        if first:
+            self.feed.subscribe(tokens=[token])
+
+    def unsubscribe(self, token: str = None, listener: Optional[Listener] = None) -> None:
+        """
+        Removes a consumer of a token
+
+        Parameters
+        ----------
+        token: str, default: None
+            Symbol token
+        listener: Optional[Listener], default: None
+            Listener given when subscribing
+        """
+        with self.lock:
+            if listener is not None and listener in self.listeners.get(token, []):
+                self.listeners[token].remove(listener)
+            count: int = self.consumers.get(token, 0) - 1
+            if count > 0:
+                self.consumers[token] = count
+                return None
+            self.consumers.pop(token, None)
+            self.listeners.pop(token, None)
+        self.feed.unsubscribe(tokens=[token])
+
+    def quote(self, token: str = None) -> Optional[Quote]:
+        """
+        Latest quote of a token, None if it never ticked
+
+        Parameters
+        ----------
+        token: str, default: None
+            Symbol token
+
+        Returns
+        -------
+        Optional[Quote]
+        """
+        return self.cache.get(token=token)
+
+    def wait(self, token: str = None, timeout: float = None) -> Optional[Quote]:
+        """
+        Latest quote of a token, waiting for its first tick if needed
+
+        Parameters
+        ----------
+        token: str, default: None
+            Symbol token, already subscribed
+        timeout: float, default: None
+            Seconds to wait at most
+
+        Returns
+        -------
+        Optional[Quote]:
+            None if the token did not tick in time
+        """
+        deadline: float = time() + timeout
+        with self.ticked:
+            while True:
+                quote: Optional[Quote] = self.cache.get(token=token)
+                remaining: float = deadline - time()
+                if quote is not None or remaining <= 0:
+                    return quote
+                self.ticked.wait(timeout=remaining)
+
+    def tokens(self) -> List[str]:
+        """
+        Subscribed tokens
+        """
+        with self.lock:
+            return list(self.consumers)
+
+    def stop(self) -> None:
+        """
+        Stops the feed and the recording
+        """
+        self.feed.stop()
+        with self.lock:
+            if self.record_file is not None:
+                self.record_file.close()
+                self.record_file = None
+
+    def _tick(self, token: str = None, ltp: float = None, bid: float = None, ask: float = None,
+              at: float = None) -> None:
+        changed: bool = self.cache.update(token=token, ltp=ltp, bid=bid, ask=ask, at=at)
+        with self.lock:
+            listeners: List[Listener] = list(self.listeners.get(token, [])) if changed else []
+            if self.record_file is not None:
+                self.record_file.write(json.dumps({"at": at, "token": token, "ltp": ltp, "bid": bid, "ask": ask})
+                                       + "\n")
+            self.ticked.notify_all()
+        if not listeners:
+            return None
+        quote: Quote = (ltp, bid, ask, at)
+        for listener in listeners:
+            try:
+                listener(token, quote)
+            except Exception as exp:
+                log_event(event="market_data_listener_failed", level=logging.ERROR, exc_info=True, token=token,
+                          error=str(exp))
+
+
+def shared_hub(smartapi: SmartConnect = None, account_id: str = None) -> MarketDataHub:
+    """
+    Returns the market-data hub of the process, connecting it with the given session on first use
+
+    Parameters
+    ----------
+    smartapi: SmartConnect, default: None
+        Logged in SmartConnect object, usually of the primary account
+    account_id: str, default: None
+        Account ID of the session
+
+    Returns
+    -------
+    MarketDataHub
+    """
+    global hub
+    with hub_lock:
+        if hub is None:
+            if replay_ticks is not None:
+                feed: Feed = ReplayFeed(path=replay_ticks, smartapi=smartapi, account_id=account_id)
+            else:
+                feed = SmartFeed(smartapi=smartapi, account_id=account_id)
+            hub = MarketDataHub(feed=feed, record_path=record_ticks)
+            hub.start()
+        return hub
+
+
+def path_argument(arguments: List[str] = None, flag: str = None) -> Optional[str]:
+    """
+    File given after a flag on the command line, None if the flag is not given
+
+    Parameters
+    ----------
+    arguments: List[str], default: None
+        Command line arguments
+    flag: str, default: None
+        The flag, such as --replay-ticks
+
+    Returns
+    -------
+    Optional[str]
+    """
+    if flag not in arguments:
+        return None
+    position: int = arguments.index(flag)
+    if position + 1 >= len(arguments) or arguments[position + 1].startswith("--"):
+        print(flag + " takes a file, ignored\n")
+        return None
+    return arguments[position + 1]
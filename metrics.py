@@ -0,0 +1,171 @@
+from typing import Dict, List, Optional, Tuple
+import re
+import threading
+
+LATENCY_BUCKETS: List[float] = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# A 5xx status only where a status is written, such as "503 Server Error: ..." raised by requests, "HTTP/1.1 502" or
+# "status code: 500", never any other number of the message such as a quantity or a price
+SERVER_STATUS: re.Pattern = re.compile(r"\b5\d\d server error|http/\d(?:\.\d)? 5\d\d\b"
+                                       r"|status(?:[ _]?code)?[\"']?\s*[:=]?\s*[\"']?5\d\d\b")
+SERVER_PHRASES: Tuple[str, ...] = ("internal server error", "bad gateway", "service unavailable", "gateway timeout",
+                                   "gateway time-out", "timed out", "timeout")
+
+counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+metrics_lock: threading.Lock = threading.Lock()
+
+
+class Metrics:
+    """
+    In-memory counters, gauges and latency histograms of the running process
+
+    Recording is a dictionary update under a lock, cheap enough for the order path. Nothing is sent anywhere, the
+    values are only read by the metrics endpoint.
+
+    ...
+
+    Methods
+    -------
+    increment(name: str = None, labels: Dict[str, str] = None, value: float = 1.0) -> None:
+        Adds to a counter
+    set(name: str = None, labels: Dict[str, str] = None, value: float = None) -> None:
+        Sets a gauge
+    observe(name: str = None, labels: Dict[str, str] = None, seconds: float = None) -> None:
+        Records a latency
+    record_failure(endpoint: str = None, account_id: str = None, exp: Exception = None) -> None:
+        Counts a failed broker call and whether it was rate limited
+    collect() -> Dict:
+        Returns a copy of all values
+    """
+
+    @staticmethod
+    def increment(name: str = None, labels: Dict[str, str] = None, value: float = 1.0) -> None:
+        """
+        Adds to a counter
+
+        Parameters
+        ----------
+        name: str, default: None
+            Name of the counter
+        labels: Dict[str, str], default: None
+            Labels of the counter
+        value: float, default: 1.0
+            Value to add
+        """
+        key: Tuple[str, Tuple[Tuple[str, str], ...]] = (name, tuple(sorted((labels or {}).items())))
+        with metrics_lock:
+            counters[key] = counters.get(key, 0.0) + value
+
+    @staticmethod
+    def set(name: str = None, labels: Dict[str, str] = None, value: float = None) -> None:
+        """
+        Sets a gauge
+
+        Parameters
+        ----------
+        name: str, default: None
+            Name of the gauge
+        labels: Dict[str, str], default: None
+            Labels of the gauge
+        value: float, default: None
+            Current value
+        """
+        key: Tuple[str, Tuple[Tuple[str, str], ...]] = (name, tuple(sorted((labels or {}).items())))
+        with metrics_lock:
+            gauges[key] = value
+
+    @staticmethod
+    def observe(name: str = None, labels: Dict[str, str] = None, seconds: float = None) -> None:
+        """
+        Records a latency
+
+        Parameters
+        ----------
+        name: str, default: None
+            Name of the histogram
+        labels: Dict[str, str], default: None
+            Labels of the histogram
+        seconds: float, default: None
+            Observed latency in seconds
+        """
+        key: Tuple[str, Tuple[Tuple[str, str], ...]] = (name, tuple(sorted((labels or {}).items())))
+        with metrics_lock:
+            # bucket counts, then count, sum and max
+            values: List[float] = histograms.setdefault(key, [0.0] * (len(LATENCY_BUCKETS) + 3))
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    values[position] += 1
+            values[-3] += 1
+            values[-2] += seconds
+            values[-1] = max(values[-1], seconds)
+
+    @staticmethod
+    def record_failure(endpoint: str = None, account_id: str = None, exp: Exception = None) -> None:
+        """
+        Counts a failed broker call and whether it was rate limited
+
+        Parameters
+        ----------
+        endpoint: str, default: None
+            Name of the broker call
+        account_id: str, default: None
+            Account ID of the account, None if the call is not tied to one
+        exp: Exception, default: None
+            Exception raised by the call
+        """
+        labels: Dict[str, str] = {"endpoint": endpoint}
+        if account_id is not None:
+            labels["account"] = str(account_id)
+        Metrics.increment(name="api_retries_total", labels=labels)
+        if is_rate_limited(exp=exp):
+            Metrics.increment(name="rate_limit_hits_total", labels=labels)
+
+    @staticmethod
+    def collect() -> Dict:
+        """
+        Returns a copy of all values
+
+        Returns
+        -------
+        Dict:
+            { "counters": Dict, "gauges": Dict, "histograms": Dict }
+        """
+        with metrics_lock:
+            return {"counters": dict(counters),
+                    "gauges": dict(gauges),
+                    "histograms": {key: list(values) for key, values in histograms.items()}}
+
+
+def is_rate_limited(exp: Optional[Exception] = None) -> bool:
+    """
+    Tells whether a broker exception was caused by the rate limit
+
+    Parameters
+    ----------
+    exp: Optional[Exception], default: None
+        Exception raised by a broker call
+
+    Returns
+    -------
+    bool
+    """
+    message: str = str(exp).lower()
+    return "access rate" in message or "rate limit" in message or "429" in message or "too many" in message
+
+
+def is_server_error(exp: Optional[Exception] = None) -> bool:
+    """
+    Tells whether a broker exception was caused by the broker failing or timing out rather than by the request
+
+    Parameters
+    ----------
+    exp: Optional[Exception], default: None
+        Exception raised by a broker call
+
+    Returns
+    -------
+    bool
+    """
+    message: str = str(exp).lower()
+    return SERVER_STATUS.search(message) is not None or any(phrase in message for phrase in SERVER_PHRASES)
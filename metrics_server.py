@@ -0,0 +1,176 @@
+from book import Book, Snapshot
+from metrics import Metrics, LATENCY_BUCKETS
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import threading
+import json
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint exporting the book and the metrics
+
+    /metrics returns the Prometheus text format and /metrics.json returns the same data as json. Both are rendered
+    from memory, so any number of scrapers at any frequency cost no broker call.
+
+    ...
+
+    Methods
+    -------
+    start(self) -> None:
+        Starts serving on a background thread
+    stop(self) -> None:
+        Stops serving
+    render_json(self) -> Dict:
+        Returns all exported values as a dictionary
+    render_text(self) -> str:
+        Returns all exported values in Prometheus text format
+    """
+
+    def __init__(self, book: Book = None, account_ids: List[str] = None, host: str = "127.0.0.1",
+                 port: int = None):
+        self.book: Book = book
+        self.account_ids: List[str] = account_ids
+        self.host: str = host
+        self.port: int = port
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        """
+        Starts serving on a background thread
+        """
+        metrics_server: MetricsServer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == "/metrics":
+                    body: bytes = metrics_server.render_text().encode("utf-8")
+                    content_type: str = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body: bytes = json.dumps(metrics_server.render_json()).encode("utf-8")
+                    content_type: str = "application/json"
+                else:
+                    self.send_error(404)
+                    return None
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return None
+
+            def log_message(self, format, *args) -> None:
+                return None
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        thread: threading.Thread = threading.Thread(target=self.server.serve_forever, name="metrics")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops serving
+        """
+        if self.server is None:
+            return None
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        return None
+
+    def render_json(self) -> Dict:
+        """
+        Returns all exported values as a dictionary
+
+        Returns
+        -------
+        Dict:
+            { "accounts": Dict[str, Dict], "counters": List[Dict], "gauges": List[Dict], "latencies": List[Dict] }
+        """
+        accounts: Dict[str, Dict] = {}
+        for account_id in self.account_ids:
+            snapshot: Optional[Snapshot] = self.book.get(account_id=account_id)
+            if snapshot is None:
+                continue
+            accounts[account_id] = {"realised": snapshot.realised,
+                                    "unrealised": snapshot.unrealised,
+                                    "pnl": snapshot.total,
+                                    "age": snapshot.age(),
+                                    "errors": snapshot.error_count,
+                                    "positions": {symbol: position["quantity"]
+                                                  for symbol, position in snapshot.positions.items()}}
+        values: Dict = Metrics.collect()
+        latencies: List[Dict] = []
+        for (name, labels), histogram in values["histograms"].items():
+            latencies.append({"name": name, "labels": dict(labels), "count": histogram[-3],
+                              "sum": histogram[-2], "max": histogram[-1]})
+
+        return {"accounts": accounts,
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in values["counters"].items()],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in values["gauges"].items()],
+                "latencies": latencies}
+
+    def render_text(self) -> str:
+        """
+        Returns all exported values in Prometheus text format
+
+        Returns
+        -------
+        str
+        """
+        lines: List[str] = []
+        account_metrics: List[Tuple[str, str]] = [("realised_pnl", "gauge"), ("unrealised_pnl", "gauge"),
+                                                  ("pnl", "gauge"), ("data_age_seconds", "gauge"),
+                                                  ("position_errors_total", "counter"),
+                                                  ("position_quantity", "gauge")]
+        samples: Dict[str, List[str]] = {name: [] for name, _ in account_metrics}
+        for account_id in self.account_ids:
+            snapshot: Optional[Snapshot] = self.book.get(account_id=account_id)
+            if snapshot is None:
+                continue
+            label: str = _labels(labels=(("account", account_id),))
+            samples["position_errors_total"].append(label + " " + str(snapshot.error_count))
+            if snapshot.updated_at is None:
+                continue
+            samples["realised_pnl"].append(label + " " + str(snapshot.realised))
+            samples["unrealised_pnl"].append(label + " " + str(snapshot.unrealised))
+            samples["pnl"].append(label + " " + str(snapshot.total))
+            samples["data_age_seconds"].append(label + " " + str(round(snapshot.age(), 3)))
+            for symbol, position in snapshot.positions.items():
+                samples["position_quantity"].append(_labels(labels=(("account", account_id), ("symbol", symbol)))
+                                                    + " " + str(position["quantity"]))
+        for name, metric_type in account_metrics:
+            lines.append("# TYPE copytrade_" + name + " " + metric_type)
+            lines.extend("copytrade_" + name + sample for sample in samples[name])
+        values: Dict = Metrics.collect()
+        for kind, metric_type in (("counters", "counter"), ("gauges", "gauge")):
+            typed: set = set()
+            for (name, labels), value in sorted(values[kind].items()):
+                if name not in typed:
+                    lines.append("# TYPE copytrade_" + name + " " + metric_type)
+                    typed.add(name)
+                lines.append("copytrade_" + name + _labels(labels=labels) + " " + str(value))
+        typed: set = set()
+        for (name, labels), histogram in sorted(values["histograms"].items()):
+            if name not in typed:
+                lines.append("# TYPE copytrade_" + name + " histogram")
+                typed.add(name)
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                lines.append("copytrade_" + name + "_bucket" + _labels(labels=labels + (("le", str(bound)),))
+                             + " " + str(histogram[position]))
+            lines.append("copytrade_" + name + "_bucket" + _labels(labels=labels + (("le", "+Inf"),))
+                         + " " + str(histogram[-3]))
+            lines.append("copytrade_" + name + "_count" + _labels(labels=labels) + " " + str(histogram[-3]))
+            lines.append("copytrade_" + name + "_sum" + _labels(labels=labels) + " " + str(histogram[-2]))
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...] = None) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(key + "=\"" + str(value).replace("\\", "\\\\").replace("\"", "\\\"") + "\""
+                          for key, value in labels) + "}"
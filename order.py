@@ -1,56 +1,119 @@
+from typing import Dict, Optional, Tuple
+
+
 class Order:
     """
     Class to represent an order
 
+    An order is a template for one leg of a spread. The same template is shared by every slice of every account, so it
+    must never be changed once created. A slice of a leg is the pair (template, quantity), see Slice.
+
     ...
 
     Attributes
     ----------
     qty: int
-        Quantity in integer format
+        Quantity of one lot, or of the whole order when placed on its own
     symbol: str
         Trading symbol
-    tradingsymbol: str
-        Trading symbol
-    exchange: str
-        Exchange name
-    price: float
-        Price if limit order is placed, else 0
-    productType: str
-        Type of order, right now which is fixed at CARRYFORWARD
-    producttype: str
-        Type of order, right now which is fixed at CARRYFORWARD
-    duration: str
-        Duration of validity of the order
-    ordertype: str
-        Type of order, right now which is fixed at MARKET
-    quantity: str
-        Quantity in string format
     token: str
         Trading token
-    symboltoken: str
-        Trading token
-    tradeType: str
+    tradetype: str
         Type of trade, either can be BUY or SELL
-    transactiontype: str
-        Type of trade, either can be BUY or SELL
-    variety: str
-        Variety of trade, right now which is fixed at NORMAL
+    payload: Optional[Dict]
+        Request payload built on first use, without the quantity
+
+    Methods
+    -------
+    to_payload(self, quantity: Optional[int] = None, tag: Optional[str] = None) -> Dict:
+        Builds the request payload of the order
+    to_margin_position(self) -> Dict:
+        Builds the position of the order used by the margin calculator
+    with_tradetype(self, tradetype: str = None) -> Order:
+        Returns the same order on the other side
     """
 
+    __slots__ = ("qty", "symbol", "token", "tradetype", "payload")
+
+    exchange: str = "NFO"
+    price: float = 0
+    producttype: str = "CARRYFORWARD"
+    duration: str = "DAY"
+    ordertype: str = "MARKET"
+    variety: str = "NORMAL"
+
     def __init__(self, quantity: int = None, symbol: str = None, token: str = None, tradetype: str = None):
         self.qty: int = quantity
         self.symbol: str = symbol
-        self.tradingsymbol: str = symbol
-        self.exchange: str = "NFO"
-        self.price: float = 0
-        self.productType: str = "CARRYFORWARD"
-        self.producttype: str = "CARRYFORWARD"
-        self.duration: str = "DAY"
-        self.ordertype: str = "MARKET"
-        self.quantity: str = str(quantity)
         self.token: str = token
-        self.symboltoken: str = token
-        self.tradeType: str = tradetype
-        self.transactiontype: str = tradetype
-        self.variety: str = "NORMAL"
+        self.tradetype: str = tradetype
+        self.payload: Optional[Dict] = None
+
+    def to_payload(self, quantity: Optional[int] = None, tag: Optional[str] = None) -> Dict:
+        """
+        Builds the request payload of the order
+
+        The payload is built once per order and only the quantity and the tag are patched for every slice. Fields
+        without a value are left out, the broker library would otherwise delete them from the dictionary it is given.
+
+        Parameters
+        ----------
+        quantity: Optional[int], default: None
+            Quantity of the slice, quantity of the order if not given
+        tag: Optional[str], default: None
+            Client order tag of the slice
+
+        Returns
+        -------
+        Dict
+        """
+        if self.payload is None:
+            fields: Dict = {"variety": self.variety,
+                            "tradingsymbol": self.symbol,
+                            "symboltoken": self.token,
+                            "transactiontype": self.tradetype,
+                            "exchange": self.exchange,
+                            "ordertype": self.ordertype,
+                            "producttype": self.producttype,
+                            "duration": self.duration,
+                            "price": self.price}
+            self.payload = {key: value for key, value in fields.items() if value is not None}
+        payload: Dict = dict(self.payload)
+        payload["quantity"] = str(self.qty if quantity is None else quantity)
+        if tag is not None:
+            payload["ordertag"] = tag
+        return payload
+
+    def to_margin_position(self) -> Dict:
+        """
+        Builds the position of the order used by the margin calculator
+
+        Returns
+        -------
+        Dict
+        """
+        return {"exchange": self.exchange,
+                "qty": self.qty,
+                "price": self.price,
+                "productType": self.producttype,
+                "token": self.token,
+                "tradeType": self.tradetype}
+
+    def with_tradetype(self, tradetype: str = None) -> "Order":
+        """
+        Returns the same order on the other side
+
+        Parameters
+        ----------
+        tradetype: str, default: None
+            Either BUY or SELL
+
+        Returns
+        -------
+        Order
+        """
+        return Order(quantity=self.qty, symbol=self.symbol, token=self.token, tradetype=tradetype)
+
+
+# One slice of a leg, the order template and the quantity to send
+Slice = Tuple[Order, int]
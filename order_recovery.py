@@ -0,0 +1,113 @@
+from account import Account
+from execute import Execute, LEG_TAGS
+from journal import Journal, ORDER_JOURNAL_FILE, FINAL_KINDS
+from retry import Retry, RetryExhausted
+from typing import Dict, List, Optional, Tuple
+from datetime import date
+import re
+
+# Selling leg of a slice, the slice tag ends with its four digit position and a basket leg also has its own position
+SELL_TAG: re.Pattern = re.compile(r"^(.*\d{4})" + re.escape(LEG_TAGS["sell"]) + r"(\d?)$")
+
+
+def recover_orders(accounts: List[Account] = None, path: str = ORDER_JOURNAL_FILE) -> None:
+    """
+    Resolves the legs left in flight by the last run and finishes its reverts
+
+    The order book of every account with legs in flight is read once. Legs found there are recorded with their final
+    status, legs missing from it were never placed. A revert that was decided but never placed is placed now, one that
+    was placed is only recorded. Buying legs whose selling leg never reached the broker are listed for a manual check.
+    The order book only holds the orders of the day, so records of an earlier day are only listed. The journal is then
+    compacted to the legs of the day still open, so it does not grow from one run to the next.
+
+    Parameters
+    ----------
+    accounts: List[Account], default: None
+        Logged in accounts
+    path: str, default: ORDER_JOURNAL_FILE
+        Journal file
+    """
+    legs, reverts = Journal.replay(path=path)
+    open_legs: Dict[Tuple[str, str], Dict] = {key: leg for key, leg in legs.items()
+                                              if leg.get("kind") not in FINAL_KINDS}
+    open_reverts: Dict[Tuple[str, str], Dict] = {key: revert for key, revert in reverts.items()
+                                                 if legs.get(key, {}).get("kind") not in FINAL_KINDS}
+    if not open_legs and not open_reverts:
+        Journal.compact(path=path)
+        return None
+    print("Order journal: " + str(len(open_legs)) + " orders in flight and " + str(len(open_reverts))
+          + " reverts outstanding from the last run\n")
+    today: str = date.today().isoformat()
+    for key, record in list({**open_legs, **open_reverts}.items()):
+        if record["time"][:10] == today:
+            continue
+        open_legs.pop(key, None)
+        open_reverts.pop(key, None)
+        print("Order journal: " + key[1] + " of *****" + str(key[0])[-3:] + " is from " + record["time"][:10]
+              + ", check it manually\n")
+    accounts_by_id: Dict[str, Account] = {account.account_id: account for account in accounts}
+    for account_id in sorted({account_id for account_id, _ in list(open_legs) + list(open_reverts)}):
+        account: Optional[Account] = accounts_by_id.get(account_id)
+        masked: str = "*****" + str(account_id)[-3:]
+        if account is None:
+            print("Order journal: " + masked + " is not logged in, check its orders manually\n")
+            continue
+        try:
+            orders: Optional[List[Dict]] = Retry.call(fn=account.smartapi.orderBook, endpoint="order_book",
+                                                      account_id=account_id, label="Order book")["data"]
+        except RetryExhausted:
+            print("Order journal: order book of " + masked + " not read, check its orders manually\n")
+            continue
+        orders_by_tag: Dict[str, Dict] = {placed.get("ordertag"): placed for placed in orders or []}
+        for (leg_account_id, tag), leg in open_legs.items():
+            if leg_account_id != account_id or (account_id, tag) in open_reverts:
+                continue
+            placed: Optional[Dict] = orders_by_tag.get(tag)
+            if placed is not None:
+                leg["kind"] = _record_status(account_id=account_id, tag=tag, placed=placed)
+                continue
+            leg["kind"] = "reject"
+            Journal.record(kind="reject", account_id=account_id, tag=tag, reason="not placed")
+            if _filled_hedges(legs=legs, account_id=account_id, tag=tag):
+                print("Order journal: selling leg " + tag + " of " + masked + " was never placed but its buying leg "
+                      + "is filled, check the spread manually\n")
+        for (revert_account_id, tag), revert in open_reverts.items():
+            if revert_account_id != account_id:
+                continue
+            placed = orders_by_tag.get(tag)
+            if placed is not None:
+                _record_status(account_id=account_id, tag=tag, placed=placed)
+                continue
+            print("Order journal: reverting order " + str(revert["order_id"]) + " of " + masked + "\n")
+            if not Execute.revert_order(unique_orderid=revert["order_id"], account=account, tag=tag):
+                print("Order journal: revert " + tag + " of " + masked + " not completed, check it manually\n")
+    Journal.compact(path=path)
+
+    return None
+
+
+def _filled_hedges(legs: Dict[Tuple[str, str], Dict] = None, account_id: str = None, tag: str = None) -> List[str]:
+    # Filled buying legs of the slice of a selling leg, the one of a spread or those of a basket on the same option type
+    match: Optional[re.Match] = SELL_TAG.match(tag)
+    if match is None:
+        return []
+    slice_tag, position = match.groups()
+    b_tag: re.Pattern = re.compile(re.escape(slice_tag + LEG_TAGS["buy"]) + (r"\d$" if position else "$"))
+    option_type: str = str(legs.get((account_id, tag), {}).get("symbol", ""))[-2:]
+    return [leg_tag for (leg_account_id, leg_tag), leg in legs.items()
+            if leg_account_id == account_id and b_tag.match(leg_tag) and leg.get("kind") == "fill"
+            and (not position or not option_type or str(leg.get("symbol", ""))[-2:] == option_type)]
+
+
+def _record_status(account_id: str = None, tag: str = None, placed: Dict = None) -> str:
+    status: Optional[str] = placed.get("orderstatus")
+    kind: str = "ack"
+    if status == "complete":
+        kind = "fill"
+    elif status in ("rejected", "cancelled"):
+        kind = "reject"
+    else:
+        print("Order journal: order " + tag + " of *****" + str(account_id)[-3:] + " is still " + str(status)
+              + ", check it manually\n")
+    Journal.record(kind=kind, account_id=account_id, tag=tag, order_id=placed.get("uniqueorderid"))
+    return kind
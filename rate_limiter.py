@@ -0,0 +1,62 @@
+from typing import Dict, Tuple
+from time import monotonic, sleep
+import threading
+
+# Requests per second allowed by the broker for each account
+RATE_LIMITS: Dict[str, float] = {"place_order": 20.0,
+                                 "order_details": 10.0,
+                                 "margin": 10.0,
+                                 "rms": 2.0,
+                                 "order_book": 1.0,
+                                 "position": 1.0}
+
+buckets: Dict[Tuple[str, str], list] = {}
+bucket_lock: threading.Lock = threading.Lock()
+
+
+class RateLimiter:
+    """
+    Shared per-account rate budget of the broker API
+
+    One token bucket is kept per account and endpoint. Every thread calling that endpoint for that account, whatever
+    command it belongs to, takes its token from the same bucket, so commands running together can never exceed the
+    broker's limit between them.
+
+    ...
+
+    Methods
+    -------
+    acquire(account_id: str = None, endpoint: str = None) -> None:
+        Waits until a request can be sent
+    """
+
+    @staticmethod
+    def acquire(account_id: str = None, endpoint: str = None) -> None:
+        """
+        Waits until a request can be sent
+
+        Endpoints without a configured limit are not throttled
+
+        Parameters
+        ----------
+        account_id: str, default: None
+            Account ID of the account sending the request
+        endpoint: str, default: None
+            Name of the broker call
+        """
+        rate: float = RATE_LIMITS.get(endpoint, 0.0)
+        if rate <= 0:
+            return None
+        key: Tuple[str, str] = (account_id, endpoint)
+        while True:
+            with bucket_lock:
+                now: float = monotonic()
+                # tokens, time of last refill
+                bucket: list = buckets.setdefault(key, [rate, now])
+                bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] >= 1.0:
+                    bucket[0] -= 1.0
+                    return None
+                wait: float = (1.0 - bucket[0]) / rate
+            sleep(wait)
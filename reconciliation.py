@@ -0,0 +1,373 @@
+from account import Account
+from command_plan import CommandPlan
+from execute import Execute, LEG_TAGS, FINAL_STATUSES
+from order import Order, Slice
+from index import Index
+from retry import Retry, RetryExhausted
+from trading_symbols import TradingSymbols
+from metrics import Metrics
+from logs import log_event
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from time import perf_counter
+import threading
+import logging
+
+# Accounts whose order book and positions are read at the same time
+RECONCILE_WORKERS: int = 16
+
+last_reconciliation: Optional["Reconciliation"] = None
+reconciliation_lock: threading.Lock = threading.Lock()
+
+
+class Discrepancy:
+    """
+    Class to represent one difference between the plan of a command and what an account got
+
+    ...
+
+    Attributes
+    ----------
+    account_id: str
+        Account ID of the account
+    command: str
+        Command whose plan is not met
+    kind: str
+        unfilled, orphan hedge, naked short, over-fill, pending or unverified
+    detail: str
+        Slice and legs concerned, with their filled and planned quantities
+    corrections: List[Slice]
+        Orders bringing the account back to the plan, empty if nothing can be suggested
+    slices: Optional[Tuple[Slice, ...]]
+        Planned slice that differs, None for a difference found in the positions
+    fixes: List[Tuple[Slice, ...]]
+        Slices placing the corrections, once FIX planned them
+    """
+
+    def __init__(self, account_id: str = None, command: str = None, kind: str = None, detail: str = None,
+                 corrections: List[Slice] = None, slices: Optional[Tuple[Slice, ...]] = None):
+        self.account_id: str = account_id
+        self.command: str = command
+        self.kind: str = kind
+        self.detail: str = detail
+        self.corrections: List[Slice] = corrections or []
+        self.slices: Optional[Tuple[Slice, ...]] = slices
+        self.fixes: List[Tuple[Slice, ...]] = []
+
+
+class Reconciliation:
+    """
+    Class to represent the outcome of checking one or more commands against the broker
+
+    ...
+
+    Attributes
+    ----------
+    accounts: Dict[str, Account]
+        Checked accounts keyed by account ID
+    discrepancies: List[Discrepancy]
+        Differences found, in the order of the accounts
+    read_at: float
+        perf_counter time the order books and positions started to be read
+
+    Methods
+    -------
+    corrections(self) -> Dict[str, List[Slice]]:
+        Suggested orders of every account with a correction
+    is_stale(self) -> bool:
+        True if an order was sent since the accounts were read
+    report(self) -> None:
+        Prints the differences and the suggested orders
+    """
+
+    def __init__(self, accounts: Dict[str, Account] = None, discrepancies: List[Discrepancy] = None,
+                 read_at: float = None):
+        self.accounts: Dict[str, Account] = accounts
+        self.discrepancies: List[Discrepancy] = discrepancies
+        self.read_at: float = read_at
+
+    def corrections(self) -> Dict[str, List[Slice]]:
+        """
+        Suggested orders of every account with a correction
+        """
+        corrections: Dict[str, List[Slice]] = {}
+        for discrepancy in self.discrepancies:
+            if discrepancy.corrections:
+                corrections.setdefault(discrepancy.account_id, []).extend(discrepancy.corrections)
+        return corrections
+
+    def is_stale(self) -> bool:
+        """
+        True if an order was sent since the accounts were read
+
+        Any command trading after the reconciliation, such as EXITALL or an exit rule, may have changed what the
+        suggested orders were meant to correct.
+        """
+        return Execute.last_sent() >= self.read_at
+
+    def report(self) -> None:
+        """
+        Prints the differences and the suggested orders
+        """
+        affected: int = len({discrepancy.account_id for discrepancy in self.discrepancies})
+        print("Reconciliation: " + str(len(self.accounts) - affected) + " of " + str(len(self.accounts))
+              + " accounts match the plan")
+        for discrepancy in self.discrepancies:
+            print("*****" + str(discrepancy.account_id)[-3:] + "\t" + discrepancy.kind + "\t" + discrepancy.command
+                  + "\t" + discrepancy.detail)
+        corrections: Dict[str, List[Slice]] = self.corrections()
+        for account_id, legs in corrections.items():
+            print("*****" + str(account_id)[-3:] + "\tsuggested: "
+                  + ", ".join(order.tradetype + " " + str(quantity) + " " + order.symbol for order, quantity in legs))
+        if corrections:
+            print("Run FIX to place the " + str(sum(len(legs) for legs in corrections.values()))
+                  + " suggested orders in " + str(len(corrections)) + " accounts")
+        print("\n")
+
+
+class Reconciler:
+    """
+    Checks right after a command that every account got what its plan intended
+
+    The order book and positions of every account of the commands are read once, all accounts at the same time.
+    The orders of a command are found by its tag prefix, so each slice of the plan is matched with the legs filled
+    for it, reverts included. Slices are reported as unfilled, orphan hedges (longs without their shorts), naked
+    shorts (shorts without their hedges) or over-fills, each with the orders that would bring the account back to the
+    plan. Positions are also checked for shorts with no long at all of the same underlying, expiry and type. The last
+    reconciliation is kept for FIX.
+
+    ...
+
+    Methods
+    -------
+    reconcile(plans: List[CommandPlan] = None) -> Reconciliation:
+        Checks the accounts of the commands against their plans and prints the differences
+    last() -> Optional[Reconciliation]:
+        The last reconciliation done
+    fix_plan(reconciliation: Reconciliation = None, on_fill: Optional[Callable[..., None]] = None
+             ) -> Optional[CommandPlan]:
+        Plans the suggested orders of a reconciliation
+    """
+
+    @staticmethod
+    def reconcile(plans: List[CommandPlan] = None) -> Reconciliation:
+        """
+        Checks the accounts of the commands against their plans and prints the differences
+
+        Parameters
+        ----------
+        plans: List[CommandPlan], default: None
+            Executed commands
+
+        Returns
+        -------
+        Reconciliation
+        """
+        global last_reconciliation
+        accounts: Dict[str, Account] = {}
+        for plan in plans:
+            for account in plan.accounts:
+                if plan.order_lists.get(account.account_id):
+                    accounts[account.account_id] = account
+        read_at: float = perf_counter()
+        with ThreadPoolExecutor(max_workers=RECONCILE_WORKERS) as pool:
+            books: Dict[str, Tuple[Optional[List[Dict]], Optional[List[Dict]]]] = dict(
+                zip(accounts, pool.map(_read, accounts.values())))
+        discrepancies: List[Discrepancy] = []
+        for account_id in accounts:
+            orders, positions = books[account_id]
+            found: List[Discrepancy] = []
+            for plan in plans:
+                order_list: List[Tuple[Slice, ...]] = plan.order_lists.get(account_id) or []
+                if not order_list:
+                    continue
+                if orders is None:
+                    found.append(Discrepancy(account_id=account_id, command=plan.command, kind="unverified",
+                                             detail="order book not read, check the account manually"))
+                    continue
+                found.extend(_check_plan(account_id=account_id, plan=plan, order_list=order_list, orders=orders))
+            if positions is not None and not any(discrepancy.kind == "naked short" for discrepancy in found):
+                found.extend(_check_positions(account_id=account_id, positions=positions,
+                                              command=plans[-1].command))
+            discrepancies.extend(found)
+        for discrepancy in discrepancies:
+            Metrics.increment(name="reconciliation_exceptions_total", labels={"kind": discrepancy.kind})
+            log_event(event="reconciliation_exception", level=logging.WARNING, account=discrepancy.account_id,
+                      command=discrepancy.command, kind=discrepancy.kind, detail=discrepancy.detail)
+        reconciliation: Reconciliation = Reconciliation(accounts=accounts, discrepancies=discrepancies,
+                                                        read_at=read_at)
+        with reconciliation_lock:
+            last_reconciliation = reconciliation
+        reconciliation.report()
+        return reconciliation
+
+    @staticmethod
+    def last() -> Optional[Reconciliation]:
+        """
+        The last reconciliation done
+        """
+        with reconciliation_lock:
+            return last_reconciliation
+
+    @staticmethod
+    def fix_plan(reconciliation: Reconciliation = None, on_fill: Optional[Callable[..., None]] = None
+                 ) -> Optional[CommandPlan]:
+        """
+        Plans the suggested orders of a reconciliation
+
+        The legs of every difference are sliced by the freeze quantity of their index and grouped hedge first, so each
+        group is placed like the slice it corrects: the buying legs first, the selling legs once they are filled. Legs
+        of different differences are never grouped, and the legs undoing an over-fill are placed one by one, so no
+        leg is reverted because an unrelated one was rejected. The slices of every difference are kept in its fixes.
+
+        Parameters
+        ----------
+        reconciliation: Reconciliation, default: None
+            Reconciliation whose suggested orders are placed
+        on_fill: Optional[Callable[..., None]], default: None
+            Called every time a slice of the fix gets completed
+
+        Returns
+        -------
+        Optional[CommandPlan]:
+            None if there is nothing to place
+        """
+        order_lists: Dict[str, List[Tuple[Slice, ...]]] = {}
+        freeze_quantities: Dict[str, Optional[int]] = {}
+        for discrepancy in reconciliation.discrepancies:
+            if not discrepancy.corrections:
+                continue
+            groups: List[List[Slice]] = [[leg] for leg in discrepancy.corrections]
+            if discrepancy.kind != "over-fill":
+                groups = [sorted(discrepancy.corrections, key=lambda leg: leg[0].tradetype != "BUY")]
+            discrepancy.fixes = [fix for group in groups
+                                 for fix in _freeze_slices(legs=group, freeze_quantities=freeze_quantities)]
+            order_lists.setdefault(discrepancy.account_id, []).extend(discrepancy.fixes)
+        if not order_lists:
+            return None
+        plan: CommandPlan = CommandPlan(command="FIX", on_fill=on_fill)
+        for account_id, order_list in order_lists.items():
+            plan.add_slices(account=reconciliation.accounts[account_id], order_list=order_list)
+        return plan
+
+
+def _read(account: Account = None) -> Tuple[Optional[List[Dict]], Optional[List[Dict]]]:
+    try:
+        orders: Optional[List[Dict]] = Retry.call(fn=account.smartapi.orderBook, endpoint="order_book",
+                                                  account_id=account.account_id, label="Order book")["data"] or []
+    except RetryExhausted:
+        orders = None
+    try:
+        positions: Optional[List[Dict]] = Retry.call(fn=account.smartapi.position, endpoint="position",
+                                                     account_id=account.account_id, label="Position")["data"] or []
+    except RetryExhausted:
+        positions = None
+    return orders, positions
+
+
+def _check_plan(account_id: str = None, plan: CommandPlan = None, order_list: List[Tuple[Slice, ...]] = None,
+                orders: List[Dict] = None) -> List[Discrepancy]:
+    orders_by_tag: Dict[str, List[Dict]] = {}
+    for placed in orders:
+        tag: str = str(placed.get("ordertag") or "")
+        if tag.startswith(plan.tag_prefix):
+            orders_by_tag.setdefault(tag, []).append(placed)
+    discrepancies: List[Discrepancy] = []
+    for position, slices in enumerate(order_list):
+        tag: str = Execute.order_tag(tag_prefix=plan.tag_prefix, position=position)
+        leg_tags: List[str] = Execute.leg_tags(tag=tag, slices=slices)
+        spread: bool = Execute.is_spread(slices=slices)
+        filled: List[int] = []
+        pending: bool = False
+        for leg_position, leg_tag in enumerate(leg_tags):
+            # Only buying legs are reverted, the revert of a spread carries the tag of the slice and the letter alone
+            revert_tag: Optional[str] = None
+            if slices[leg_position][0].tradetype == "BUY":
+                revert_tag = tag + LEG_TAGS["revert"] + ("" if spread else str(leg_position))
+            placed: List[Dict] = orders_by_tag.get(leg_tag, []) + orders_by_tag.get(revert_tag, [])
+            pending = pending or any(single.get("orderstatus") not in FINAL_STATUSES for single in placed)
+            filled.append(_filled(orders=orders_by_tag.get(leg_tag, []))
+                          - _filled(orders=orders_by_tag.get(revert_tag, [])))
+        missing: List[int] = [quantity - leg_filled for (_, quantity), leg_filled in zip(slices, filled)]
+        if not any(missing):
+            continue
+        detail: str = "slice " + str(position) + ": " + ", ".join(
+            order.tradetype + " " + order.symbol + " " + str(leg_filled) + "/" + str(quantity)
+            for (order, quantity), leg_filled in zip(slices, filled))
+        if pending:
+            discrepancies.append(Discrepancy(account_id=account_id, command=plan.command, kind="pending",
+                                             detail=detail + ", orders still open", slices=slices))
+            continue
+        corrections: List[Slice] = []
+        for (order, _), leg_missing in zip(slices, missing):
+            if leg_missing > 0:
+                corrections.append((order, leg_missing))
+            elif leg_missing < 0:
+                corrections.append((order.with_tradetype(tradetype="SELL" if order.tradetype == "BUY" else "BUY"),
+                                    -leg_missing))
+        discrepancies.append(Discrepancy(account_id=account_id, command=plan.command,
+                                         kind=_kind(slices=slices, filled=filled, missing=missing), detail=detail,
+                                         corrections=corrections, slices=slices))
+    return discrepancies
+
+
+def _kind(slices: Tuple[Slice, ...] = None, filled: List[int] = None, missing: List[int] = None) -> str:
+    if any(leg_missing < 0 for leg_missing in missing):
+        return "over-fill"
+    if not any(filled):
+        return "unfilled"
+    buys_short: bool = any(leg_missing > 0 for (order, _), leg_missing in zip(slices, missing)
+                           if order.tradetype == "BUY")
+    sells_short: bool = any(leg_missing > 0 for (order, _), leg_missing in zip(slices, missing)
+                            if order.tradetype == "SELL")
+    sells_filled: bool = any(leg_filled > 0 for (order, _), leg_filled in zip(slices, filled)
+                             if order.tradetype == "SELL")
+    if buys_short and sells_filled:
+        return "naked short"
+    if sells_short and not buys_short:
+        return "orphan hedge"
+    return "unfilled"
+
+
+def _check_positions(account_id: str = None, positions: List[Dict] = None, command: str = None
+                     ) -> List[Discrepancy]:
+    # Net short and long quantities of every underlying, expiry and option type
+    sides: Dict[Tuple[str, str, str], List[int]] = {}
+    for single_position in positions:
+        quantity: int = int(single_position.get("netqty") or 0)
+        option_type: str = str(single_position.get("optiontype") or "")
+        if quantity == 0 or option_type not in ("CE", "PE"):
+            continue
+        key: Tuple[str, str, str] = (str(single_position.get("symbolname", "")),
+                                     str(single_position.get("expirydate", "")), option_type)
+        side: List[int] = sides.setdefault(key, [0, 0])
+        side[0 if quantity < 0 else 1] += abs(quantity)
+    return [Discrepancy(account_id=account_id, command=command, kind="naked short",
+                        detail=name + " " + expiry + " " + option_type + ": short " + str(short)
+                        + " without any long in positions, check the account manually")
+            for (name, expiry, option_type), (short, long) in sides.items() if short > 0 and long == 0]
+
+
+def _filled(orders: List[Dict] = None) -> int:
+    return sum(int(float(placed.get("filledshares") or 0)) for placed in orders)
+
+
+def _freeze_slices(legs: List[Slice] = None, freeze_quantities: Dict[str, Optional[int]] = None
+                   ) -> List[Tuple[Slice, ...]]:
+    # Each leg cut by its freeze quantity, the n-th piece of every leg placed together
+    pieces: List[List[Slice]] = []
+    for order, quantity in legs:
+        freeze_quantity: int = _freeze_quantity(order=order, freeze_quantities=freeze_quantities) or quantity
+        pieces.append([(order, min(freeze_quantity, quantity - start))
+                       for start in range(0, quantity, freeze_quantity)])
+    return [tuple(leg[position] for leg in pieces if position < len(leg))
+            for position in range(max(len(leg) for leg in pieces))]
+
+
+def _freeze_quantity(order: Order = None, freeze_quantities: Dict[str, Optional[int]] = None) -> Optional[int]:
+    instrument: Optional[Tuple[str, str]] = TradingSymbols.get_instrument(token=order.token)
+    if instrument is None:
+        return None
+    if instrument[1] not in freeze_quantities:
+        freeze_quantities[instrument[1]] = Index.get_details(index=instrument[1]).get("freeze_quantity")
+    return freeze_quantities[instrument[1]]
@@ -0,0 +1,293 @@
+from logs import log_event
+from typing import Dict, List, Optional, Set, Tuple
+from time import time
+import threading
+import logging
+import hashlib
+import base64
+import socket
+import struct
+import codecs
+import json
+
+# Exchange type of NFO and the subscription mode carrying the best bid and ask, in the broker's websocket protocol
+NFO_EXCHANGE_TYPE: int = 2
+SNAP_QUOTE_MODE: int = 3
+# Subscribe and unsubscribe actions sent by the client
+SUBSCRIBE_ACTION: int = 1
+UNSUBSCRIBE_ACTION: int = 0
+# Added to the key of the client to accept a websocket connection
+WEBSOCKET_GUID: str = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+TEXT_FRAME: int = 0x1
+BINARY_FRAME: int = 0x2
+CLOSE_FRAME: int = 0x8
+PING_FRAME: int = 0x9
+PONG_FRAME: int = 0xA
+# Depth entries of a snap quote, the best five bids followed by the best five asks
+DEPTH_ENTRIES: int = 5
+
+
+class ReplayServer:
+    """
+    Local websocket server speaking the broker's market data protocol, replaying recorded ticks
+
+    SmartFeed connects to it as it would to the broker, so a replay goes through the same websocket client, binary
+    parsing and reconnects as live prices. Ticks are read from a file with one json object per line, {"at": epoch,
+    "token": str, "ltp": float, "bid": float, "ask": float}, as written by MarketDataHub when recording. Replay starts
+    with the first connection and keeps the gaps the ticks were recorded with, divided by speed. Every tick is sent as
+    a snap quote packet to the connections that subscribed its token.
+
+    ...
+
+    Attributes
+    ----------
+    path: str
+        File of recorded ticks
+    speed: float
+        How many times faster than recorded the ticks are replayed, 0 for no gaps at all
+    uri: str
+        Address to connect to
+    finished: threading.Event
+        Set once every tick has been replayed
+
+    Methods
+    -------
+    start(self) -> None:
+        Starts accepting connections
+    stop(self) -> None:
+        Stops the replay and closes all connections
+    """
+
+    def __init__(self, path: str = None, speed: float = 1.0):
+        self.path: str = path
+        self.speed: float = speed
+        self.listener: socket.socket = socket.create_server(("127.0.0.1", 0))
+        self.uri: str = "ws://127.0.0.1:" + str(self.listener.getsockname()[1])
+        self.finished: threading.Event = threading.Event()
+        self.stop_event: threading.Event = threading.Event()
+        self.connected: threading.Event = threading.Event()
+        # Tokens subscribed by every open connection, and a lock per connection so frames are not interleaved
+        self.subscriptions: Dict[socket.socket, Set[str]] = {}
+        self.send_locks: Dict[socket.socket, threading.Lock] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Starts accepting connections
+        """
+        threading.Thread(target=self._accept, name="replay-server", daemon=True).start()
+        threading.Thread(target=self._replay, name="market-data-replay", daemon=True).start()
+
+    def stop(self) -> None:
+        """
+        Stops the replay and closes all connections
+        """
+        self.stop_event.set()
+        self.connected.set()
+        self.listener.close()
+        with self.lock:
+            connections: List[socket.socket] = list(self.subscriptions)
+        for connection in connections:
+            try:
+                self._send(connection=connection, opcode=CLOSE_FRAME, payload=b"")
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                continue
+
+    def _accept(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                connection, _ = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, kwargs={"connection": connection}, name="replay-connection",
+                             daemon=True).start()
+
+    def _serve(self, connection: socket.socket = None) -> None:
+        try:
+            if not _handshake(connection=connection):
+                connection.close()
+                return None
+            with self.lock:
+                self.subscriptions[connection] = set()
+                self.send_locks[connection] = threading.Lock()
+            self.connected.set()
+            while not self.stop_event.is_set():
+                frame: Optional[Tuple[int, bytes]] = _read_frame(connection=connection)
+                if frame is None or frame[0] == CLOSE_FRAME:
+                    break
+                opcode, payload = frame
+                if opcode == PING_FRAME:
+                    self._send(connection=connection, opcode=PONG_FRAME, payload=payload)
+                elif opcode == TEXT_FRAME and payload == b"ping":
+                    self._send(connection=connection, opcode=TEXT_FRAME, payload=b"pong")
+                elif opcode == TEXT_FRAME:
+                    self._request(connection=connection, request=json.loads(payload.decode("utf-8")))
+        except (OSError, ValueError) as exp:
+            log_event(event="replay_connection_failed", level=logging.WARNING, error=str(exp))
+        finally:
+            with self.lock:
+                self.subscriptions.pop(connection, None)
+                self.send_locks.pop(connection, None)
+            connection.close()
+
+    def _request(self, connection: socket.socket = None, request: Dict = None) -> None:
+        tokens: Set[str] = {str(token) for token_list in request.get("params", {}).get("tokenList", [])
+                            for token in token_list.get("tokens", [])}
+        with self.lock:
+            subscribed: Optional[Set[str]] = self.subscriptions.get(connection)
+            if subscribed is None:
+                return None
+            if request.get("action") == SUBSCRIBE_ACTION:
+                subscribed.update(tokens)
+            elif request.get("action") == UNSUBSCRIBE_ACTION:
+                subscribed.difference_update(tokens)
+
+    def _replay(self) -> None:
+        self.connected.wait()
+        tick_file = codecs.open(self.path, "r", encoding="utf-8")
+        first_at: Optional[float] = None
+        started_at: float = time()
+        sequence: int = 0
+        for lin in tick_file:
+            if self.stop_event.is_set():
+                break
+            if len(lin.strip()) == 0:
+                continue
+            tick: Dict = json.loads(lin)
+            if first_at is None:
+                first_at = tick["at"]
+            if self.speed > 0:
+                delay: float = (tick["at"] - first_at) / self.speed - (time() - started_at)
+                if delay > 0 and self.stop_event.wait(timeout=delay):
+                    break
+            token: str = str(tick["token"])
+            with self.lock:
+                connections: List[socket.socket] = [connection for connection, tokens in self.subscriptions.items()
+                                                    if token in tokens]
+            if not connections:
+                continue
+            sequence += 1
+            packet: bytes = snap_quote(token=token, ltp=float(tick["ltp"]), bid=float(tick.get("bid", 0.0)),
+                                       ask=float(tick.get("ask", 0.0)), at=float(tick["at"]), sequence=sequence)
+            for connection in connections:
+                try:
+                    self._send(connection=connection, opcode=BINARY_FRAME, payload=packet)
+                except OSError:
+                    continue
+        tick_file.close()
+        self.finished.set()
+
+    def _send(self, connection: socket.socket = None, opcode: int = None, payload: bytes = None) -> None:
+        with self.lock:
+            send_lock: Optional[threading.Lock] = self.send_locks.get(connection)
+        if send_lock is None:
+            return None
+        with send_lock:
+            connection.sendall(_frame(opcode=opcode, payload=payload))
+
+
+def snap_quote(token: str = None, ltp: float = None, bid: float = None, ask: float = None, at: float = None,
+               sequence: int = 0) -> bytes:
+    """
+    Snap quote packet of one tick, laid out as the broker sends it
+
+    Little endian, 379 bytes: mode and exchange type, the token in 25 bytes, sequence number, exchange time, last
+    traded price, last traded quantity, average price, volume, total buy and sell quantity, open, high, low and close,
+    last traded time, open interest and its change, five bids and five asks of 20 bytes each (flag 0 for a bid, 1 for
+    an ask, quantity, price, number of orders), upper and lower circuit and 52 week high and low. Prices are in paise.
+
+    Parameters
+    ----------
+    token: str, default: None
+        Symbol token
+    ltp: float, default: None
+        Last traded price
+    bid: float, default: None
+        Best bid
+    ask: float, default: None
+        Best ask
+    at: float, default: None
+        Epoch time of the tick
+    sequence: int, default: 0
+        Sequence number of the packet
+
+    Returns
+    -------
+    bytes
+    """
+    paise: int = int(round(ltp * 100))
+    millis: int = int(at * 1000)
+    packet: bytes = struct.pack("<BB25sqqq", SNAP_QUOTE_MODE, NFO_EXCHANGE_TYPE, token.encode("utf-8"), sequence,
+                                millis, paise)
+    packet += struct.pack("<qqqddqqqq", 0, paise, 0, 0.0, 0.0, paise, paise, paise, paise)
+    packet += struct.pack("<qqd", millis, 0, 0.0)
+    for flag, price in ((0, bid), (1, ask)):
+        packet += struct.pack("<HqqH", flag, 1 if price else 0, int(round(price * 100)), 1 if price else 0)
+        packet += struct.pack("<HqqH", flag, 0, 0, 0) * (DEPTH_ENTRIES - 1)
+    packet += struct.pack("<qqqq", 0, 0, 0, 0)
+    return packet
+
+
+def _handshake(connection: socket.socket = None) -> bool:
+    request: bytes = b""
+    while b"\r\n\r\n" not in request:
+        chunk: bytes = connection.recv(4096)
+        if not chunk or len(request) > 65536:
+            return False
+        request += chunk
+    key: Optional[str] = None
+    for lin in request.decode("latin-1").split("\r\n")[1:]:
+        name, _, value = lin.partition(":")
+        if name.strip().lower() == "sec-websocket-key":
+            key = value.strip()
+    if key is None:
+        return False
+    accept: str = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+    connection.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                        "Sec-WebSocket-Accept: " + accept + "\r\n\r\n").encode("ascii"))
+    return True
+
+
+def _read_frame(connection: socket.socket = None) -> Optional[Tuple[int, bytes]]:
+    head: Optional[bytes] = _read_exact(connection=connection, size=2)
+    if head is None:
+        return None
+    opcode: int = head[0] & 0x0F
+    length: int = head[1] & 0x7F
+    if length == 126:
+        extended: Optional[bytes] = _read_exact(connection=connection, size=2)
+        length = struct.unpack("!H", extended)[0] if extended is not None else 0
+    elif length == 127:
+        extended = _read_exact(connection=connection, size=8)
+        length = struct.unpack("!Q", extended)[0] if extended is not None else 0
+    # Frames of a client are always masked
+    mask: Optional[bytes] = _read_exact(connection=connection, size=4) if head[1] & 0x80 else b""
+    payload: Optional[bytes] = _read_exact(connection=connection, size=length)
+    if mask is None or payload is None:
+        return None
+    if mask:
+        payload = bytes(byte ^ mask[position % 4] for position, byte in enumerate(payload))
+    return opcode, payload
+
+
+def _read_exact(connection: socket.socket = None, size: int = None) -> Optional[bytes]:
+    data: bytes = b""
+    while len(data) < size:
+        chunk: bytes = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _frame(opcode: int = None, payload: bytes = None) -> bytes:
+    # Frames of the server are never masked
+    header: bytes = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    elif len(payload) < 65536:
+        header += bytes([126]) + struct.pack("!H", len(payload))
+    else:
+        header += bytes([127]) + struct.pack("!Q", len(payload))
+    return header + payload
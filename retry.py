@@ -0,0 +1,253 @@
+from metrics import Metrics, is_rate_limited
+from rate_limiter import RateLimiter
+from concurrency import ConcurrencyControl
+from session import SessionManager
+from typing import Any, Callable, Dict, Optional
+from time import monotonic, sleep
+from console import Console
+from logs import log_event
+import threading
+import logging
+import random
+
+
+class RetryPolicy:
+    """
+    Class to represent how failed calls of one endpoint are retried
+
+    The delay between attempts doubles from base_delay up to max_delay, half of it being random so that threads
+    failing together do not retry together.
+
+    ...
+
+    Attributes
+    ----------
+    base_delay: float
+        Delay in seconds after the first failure
+    max_delay: float
+        Longest delay in seconds between two attempts
+    deadline: float
+        Seconds after which no new attempt is made
+    max_attempts: int
+        Attempts allowed for one call
+
+    Methods
+    -------
+    delay(self, attempt: int = None) -> float:
+        Seconds to wait after a failed attempt
+    """
+
+    def __init__(self, base_delay: float = None, max_delay: float = None, deadline: float = None,
+                 max_attempts: int = None):
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.deadline: float = deadline
+        self.max_attempts: int = max_attempts
+
+    def delay(self, attempt: int = None) -> float:
+        """
+        Seconds to wait after a failed attempt
+
+        Parameters
+        ----------
+        attempt: int, default: None
+            Number of the failed attempt, starting at 1
+
+        Returns
+        -------
+        float
+        """
+        delay: float = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    "position": RetryPolicy(base_delay=0.5, max_delay=8.0, deadline=60.0, max_attempts=20),
+    "margin": RetryPolicy(base_delay=0.5, max_delay=8.0, deadline=30.0, max_attempts=10),
+    "rms": RetryPolicy(base_delay=0.5, max_delay=8.0, deadline=60.0, max_attempts=20),
+    "place_order": RetryPolicy(base_delay=0.2, max_delay=2.0, deadline=15.0, max_attempts=10),
+    "order_details": RetryPolicy(base_delay=0.25, max_delay=4.0, deadline=120.0, max_attempts=60),
+    "session": RetryPolicy(base_delay=1.0, max_delay=30.0, deadline=300.0, max_attempts=30),
+}
+DEFAULT_POLICY: RetryPolicy = RetryPolicy(base_delay=0.5, max_delay=8.0, deadline=60.0, max_attempts=20)
+
+# Consecutive failures of an account that open its circuit, and seconds it stays open
+BREAKER_THRESHOLD: int = 5
+BREAKER_COOLDOWN: float = 5.0
+
+breakers: Dict[Optional[str], "CircuitBreaker"] = {}
+breaker_lock: threading.Lock = threading.Lock()
+
+
+class RetryExhausted(Exception):
+    """
+    Raised when a broker call still fails once its deadline or attempts are used up
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Class to represent the health of the broker API for one account
+
+    After BREAKER_THRESHOLD failures in a row, of any endpoint, the circuit opens and no call of that account is sent
+    for BREAKER_COOLDOWN seconds. Then a single call is let through, and its outcome closes the circuit or opens it
+    again. While the broker is rate limiting or down, the threads of the account wait instead of adding to the load.
+
+    ...
+
+    Methods
+    -------
+    wait_time(self) -> float:
+        Seconds to wait before a call can be sent, 0 if it can be sent now
+    success(self) -> None:
+        Records a successful call
+    failure(self) -> None:
+        Records a failed call
+    """
+
+    def __init__(self, account_id: Optional[str] = None):
+        self.account_id: Optional[str] = account_id
+        self.failures: int = 0
+        self.open_until: Optional[float] = None
+        self.probing: bool = False
+        self.lock: threading.Lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """
+        Seconds to wait before a call can be sent, 0 if it can be sent now
+        """
+        with self.lock:
+            if self.open_until is None:
+                return 0.0
+            remaining: float = self.open_until - monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return 0.1
+            self.probing = True
+            return 0.0
+
+    def success(self) -> None:
+        """
+        Records a successful call
+        """
+        with self.lock:
+            was_open: bool = self.open_until is not None
+            self.failures = 0
+            self.open_until = None
+            self.probing = False
+        if was_open:
+            Metrics.set(name="circuit_open", labels={"account": str(self.account_id)}, value=0)
+
+    def failure(self) -> None:
+        """
+        Records a failed call
+        """
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures < BREAKER_THRESHOLD:
+                return None
+            self.open_until = monotonic() + BREAKER_COOLDOWN
+        Metrics.set(name="circuit_open", labels={"account": str(self.account_id)}, value=1)
+
+
+class Retry:
+    """
+    Single retry layer of all broker calls
+
+    Every attempt is taken from the rate budget of the account, waits for a slot of its adaptive concurrency window
+    and is checked against its circuit breaker. Failures are counted in the metrics and logged as one structured event
+    each. The console shows the calls being retried on a single status line, and the calls that are given up.
+
+    ...
+
+    Methods
+    -------
+    call(fn: Callable[[], Any] = None, endpoint: str = None, account_id: Optional[str] = None,
+         label: str = None) -> Any:
+        Calls fn until it succeeds, raises RetryExhausted once the policy of the endpoint is used up
+    """
+
+    @staticmethod
+    def call(fn: Callable[[], Any] = None, endpoint: str = None, account_id: Optional[str] = None,
+             label: str = None) -> Any:
+        """
+        Calls fn until it succeeds, raises RetryExhausted once the policy of the endpoint is used up
+
+        Parameters
+        ----------
+        fn: Callable[[], Any], default: None
+            Broker call
+        endpoint: str, default: None
+            Name of the broker call, selects the retry policy and the rate budget
+        account_id: Optional[str], default: None
+            Account ID of the account, None if the call is not tied to one
+        label: str, default: None
+            Name of the call shown on the console
+
+        Returns
+        -------
+        Any:
+            Result of fn
+        """
+        policy: RetryPolicy = RETRY_POLICIES.get(endpoint, DEFAULT_POLICY)
+        breaker: CircuitBreaker = _breaker(account_id=account_id)
+        started_at: float = monotonic()
+        attempt: int = 0
+        while True:
+            wait: float = breaker.wait_time()
+            if wait > 0:
+                if monotonic() + wait - started_at > policy.deadline:
+                    break
+                sleep(wait)
+                continue
+            attempt += 1
+            RateLimiter.acquire(account_id=account_id, endpoint=endpoint)
+            ConcurrencyControl.acquire(account_id=account_id, endpoint=endpoint)
+            sent_at: float = monotonic()
+            try:
+                result: Any = fn()
+            except Exception as exp:
+                ConcurrencyControl.release(account_id=account_id, endpoint=endpoint, latency=monotonic() - sent_at,
+                                           exp=exp)
+                breaker.failure()
+                Metrics.record_failure(endpoint=endpoint, account_id=account_id, exp=exp)
+                SessionManager.report(account_id=account_id, exp=exp)
+                delay: float = policy.delay(attempt=attempt)
+                log_event(event="broker_call_failed", level=logging.WARNING, exc_info=True, endpoint=endpoint,
+                          account=account_id, attempt=attempt, elapsed=round(monotonic() - started_at, 3),
+                          next_delay=round(delay, 3), rate_limited=is_rate_limited(exp=exp), error=str(exp))
+                Console.status(what=str(label), account_id=account_id, attempt=attempt)
+                if attempt >= policy.max_attempts or monotonic() + delay - started_at > policy.deadline:
+                    break
+                sleep(delay)
+                continue
+            ConcurrencyControl.release(account_id=account_id, endpoint=endpoint, latency=monotonic() - sent_at)
+            breaker.success()
+            if attempt > 1:
+                Console.clear(what=str(label), account_id=account_id)
+            return result
+        Metrics.increment(name="retries_exhausted_total", labels={"endpoint": endpoint})
+        log_event(event="broker_call_given_up", level=logging.ERROR, endpoint=endpoint, account=account_id,
+                  attempts=attempt, elapsed=round(monotonic() - started_at, 3))
+        Console.clear(what=str(label), account_id=account_id)
+        Console.message(text=str(label) + " failed after " + str(attempt) + " attempts" + _for(account_id=account_id)
+                        + ", giving up.\n")
+        raise RetryExhausted(endpoint)
+
+
+def _breaker(account_id: Optional[str] = None) -> CircuitBreaker:
+    with breaker_lock:
+        breaker: Optional[CircuitBreaker] = breakers.get(account_id)
+        if breaker is None:
+            breaker = CircuitBreaker(account_id=account_id)
+            breakers[account_id] = breaker
+        return breaker
+
+
+def _for(account_id: Optional[str] = None) -> str:
+    if account_id is None:
+        return ""
+    return " for *****" + str(account_id)[-3:]
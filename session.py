@@ -0,0 +1,263 @@
+from SmartApi import SmartConnect
+from metrics import Metrics
+from console import Console
+from logs import log_event
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from time import time
+import threading
+import logging
+import base64
+import pyotp
+import json
+import re
+
+# Seconds before the expiry of a token when it is renewed
+RENEW_BEFORE: float = 1800.0
+# Lifetime assumed for a token whose expiry cannot be read from it
+DEFAULT_LIFETIME: float = 6 * 3600.0
+# Seconds between two checks of all sessions when nothing fails
+CHECK_INTERVAL: float = 60.0
+# Seconds between two renewals of the same account triggered by failures
+MIN_RENEW_GAP: float = 30.0
+# Accounts renewed at the same time
+RENEW_WORKERS: int = 8
+
+sessions: Dict[str, "Session"] = {}
+session_lock: threading.Lock = threading.Lock()
+wake: threading.Event = threading.Event()
+keeper: Optional[threading.Thread] = None
+
+
+class Session:
+    """
+    Class to represent the broker session of one account
+
+    ...
+
+    Attributes
+    ----------
+    account_id: str
+        Account ID of the account
+    smartapi: SmartConnect
+        SmartConnect object of the account, shared with every caller
+    refresh_token: str
+        Refresh token of the session
+    totp_qr: str
+        QR code to generate TOTP, kept to log in again
+    pin: str
+        PIN of the account, kept to log in again
+    expires_at: float
+        Epoch time when the access token expires
+    stale: bool
+        True once a call failed because of the session
+    renewed_at: float
+        Epoch time of the last renewal, 0 if never renewed
+    failures: int
+        Renewals failed in a row
+    """
+
+    def __init__(self, account_id: str = None, smartapi: SmartConnect = None, refresh_token: str = None,
+                 totp_qr: str = None, pin: str = None):
+        self.account_id: str = account_id
+        self.smartapi: SmartConnect = smartapi
+        self.refresh_token: str = refresh_token
+        self.totp_qr: str = totp_qr
+        self.pin: str = pin
+        self.expires_at: float = token_expiry(smartapi=smartapi)
+        self.stale: bool = False
+        self.renewed_at: float = 0.0
+        self.failures: int = 0
+
+    def due(self, now: float = None) -> bool:
+        """
+        True if the session has to be renewed now
+        """
+        if self.stale:
+            return now - self.renewed_at >= MIN_RENEW_GAP
+        return self.expires_at - now <= RENEW_BEFORE
+
+
+class SessionManager:
+    """
+    Keeps the broker sessions of all accounts alive
+
+    One background thread renews every access token with the refresh token before it expires, and logs the account
+    in again if that fails. A call failing because of the session only marks it stale and wakes the thread, so
+    orders never wait for a login: their retries go on and pick up the new token, which is set on the same SmartConnect
+    object every caller already holds.
+
+    ...
+
+    Methods
+    -------
+    register(account_id: str = None, smartapi: SmartConnect = None, refresh_token: str = None, totp_qr: str = None,
+             pin: str = None) -> None:
+        Starts tracking the session of a logged in account
+    start() -> None:
+        Starts the background thread
+    report(account_id: Optional[str] = None, exp: Optional[Exception] = None) -> None:
+        Marks the session of an account stale if a call failed because of it
+    """
+
+    @staticmethod
+    def register(account_id: str = None, smartapi: SmartConnect = None, refresh_token: str = None, totp_qr: str = None,
+                 pin: str = None) -> None:
+        """
+        Starts tracking the session of a logged in account
+
+        Parameters
+        ----------
+        account_id: str, default: None
+            Account ID of the account
+        smartapi: SmartConnect, default: None
+            Logged in SmartConnect object of the account
+        refresh_token: str, default: None
+            Refresh token of the session
+        totp_qr: str, default: None
+            QR code to generate TOTP
+        pin: str, default: None
+            PIN of the account
+        """
+        with session_lock:
+            sessions[account_id] = Session(account_id=account_id, smartapi=smartapi, refresh_token=refresh_token,
+                                           totp_qr=totp_qr, pin=pin)
+
+    @staticmethod
+    def start() -> None:
+        """
+        Starts the background thread
+        """
+        global keeper
+        if keeper is not None:
+            return None
+        keeper = threading.Thread(target=_run, name="session-keeper", daemon=True)
+        keeper.start()
+
+    @staticmethod
+    def report(account_id: Optional[str] = None, exp: Optional[Exception] = None) -> None:
+        """
+        Marks the session of an account stale if a call failed because of it
+
+        Parameters
+        ----------
+        account_id: Optional[str], default: None
+            Account ID of the account whose call failed
+        exp: Optional[Exception], default: None
+            Exception raised by the call
+        """
+        if account_id is None or not is_auth_error(exp=exp):
+            return None
+        with session_lock:
+            session: Optional[Session] = sessions.get(account_id)
+            if session is None or session.stale:
+                return None
+            session.stale = True
+        log_event(event="session_stale", level=logging.WARNING, account=account_id, error=str(exp))
+        wake.set()
+
+
+def is_auth_error(exp: Optional[Exception] = None) -> bool:
+    """
+    Tells whether a broker exception was caused by an expired or invalid session
+
+    Parameters
+    ----------
+    exp: Optional[Exception], default: None
+        Exception raised by a broker call
+
+    Returns
+    -------
+    bool
+    """
+    if exp is None:
+        return False
+    if type(exp).__name__ == "TokenException":
+        return True
+    message: str = str(exp).lower()
+    return ("invalid token" in message or "token expired" in message or "unauthorized" in message
+            or re.search(r"\bag800[123]\b|\b401\b", message) is not None)
+
+
+def token_expiry(smartapi: SmartConnect = None) -> float:
+    """
+    Epoch time when the access token of a session expires
+
+    Read from the exp claim of the token, or assumed to be DEFAULT_LIFETIME from now if it cannot be read
+
+    Parameters
+    ----------
+    smartapi: SmartConnect, default: None
+        Logged in SmartConnect object
+
+    Returns
+    -------
+    float
+    """
+    token: str = str(getattr(smartapi, "access_token", None) or "")
+    if token.startswith("Bearer "):
+        token = token[len("Bearer "):]
+    try:
+        claims: str = token.split(".")[1]
+        return float(json.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4)))["exp"])
+    except (IndexError, ValueError, KeyError, TypeError):
+        return time() + DEFAULT_LIFETIME
+
+
+def _run() -> None:
+    timeout: float = CHECK_INTERVAL
+    with ThreadPoolExecutor(max_workers=RENEW_WORKERS, thread_name_prefix="session") as pool:
+        while True:
+            wake.wait(timeout=timeout)
+            wake.clear()
+            now: float = time()
+            with session_lock:
+                due: List[Session] = [session for session in sessions.values() if session.due(now=now)]
+            list(pool.map(_renew, due))
+            with session_lock:
+                # A stale session not renewed yet is looked at again as soon as MIN_RENEW_GAP is over
+                waits: List[float] = [session.renewed_at + MIN_RENEW_GAP - time() for session in sessions.values()
+                                      if session.stale]
+            timeout = max(1.0, min(waits + [CHECK_INTERVAL]))
+
+
+def _renew(session: Session = None) -> None:
+    try:
+        data: Optional[Dict] = session.smartapi.generateToken(session.refresh_token)["data"]
+        if data is None:
+            raise Exception("No data in token response")
+        kind: str = "token"
+    except Exception as exp:
+        Metrics.increment(name="session_renewals_total", labels={"kind": "token", "status": "failed"})
+        log_event(event="session_renewal_failed", level=logging.WARNING, account=session.account_id,
+                  kind="token", error=str(exp))
+        try:
+            data = session.smartapi.generateSession(session.account_id, session.pin,
+                                                    pyotp.TOTP(session.totp_qr).now())["data"]
+            if data is None:
+                raise Exception("No data in session response")
+            kind = "login"
+        except Exception as login_exp:
+            Metrics.increment(name="session_renewals_total", labels={"kind": "login", "status": "failed"})
+            log_event(event="session_renewal_failed", level=logging.ERROR, exc_info=True, account=session.account_id,
+                      kind="login", error=str(login_exp))
+            with session_lock:
+                session.renewed_at = time()
+                session.stale = True
+                session.failures += 1
+            Console.status(what="Session renewal", account_id=session.account_id, attempt=session.failures)
+            return None
+    if data.get("refreshToken"):
+        session.refresh_token = data["refreshToken"]
+    with session_lock:
+        session.expires_at = token_expiry(smartapi=session.smartapi)
+        session.renewed_at = time()
+        session.stale = False
+        failures: int = session.failures
+        session.failures = 0
+    if failures > 0:
+        Console.clear(what="Session renewal", account_id=session.account_id,
+                      message="Session of *****" + str(session.account_id)[-3:] + " renewed\n")
+    Metrics.increment(name="session_renewals_total", labels={"kind": kind, "status": "ok"})
+    log_event(event="session_renewed", account=session.account_id, kind=kind,
+              expires_in=round(session.expires_at - time()))
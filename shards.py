@@ -0,0 +1,539 @@
+from account import Account
+from login import Login
+from trading_symbols import TradingSymbols
+from startup import BackgroundStep
+from execute import Execute
+from exit_plan import ExitPlanStore, ExitFile, EXIT_PLAN_FILE, EXIT_FILE
+from journal import Journal, ORDER_JOURNAL_FILE
+from history import HistoryStore
+from session import SessionManager
+from order_recovery import recover_orders
+from book import Book, Snapshot
+from trade_entry import resolve_entry
+from trade_schedule import PLAN_LEAD
+from jobs import Job, JobManager, today_at
+import command_driver as Driver
+import trade_history
+from logs import start_logging, log_event
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from time import perf_counter, time
+import multiprocessing
+import threading
+import logging
+import signal
+import atexit
+import uuid
+import os
+
+# Commands every shard runs on its own accounts
+SHARDED_COMMANDS: Tuple[str, ...] = ("ENTRY", "EXIT", "BASKET", "EXITALL", "BATCH", "FIX")
+# Commands watching accounts in the background, which need all accounts in one process
+SINGLE_PROCESS_COMMANDS: Tuple[str, ...] = ("DETAILS", "MARGIN", "AUTOEXIT", "RULE", "RULES", "METRICS", "QUOTE")
+# Seconds between two checks that a shard is still alive while waiting for its answer
+POLL_INTERVAL: float = 0.5
+# Accounts refreshed at the same time by one shard for PNL
+PNL_WORKERS: int = 16
+# Seconds a scheduled entry is handed to the shards before they plan it, enough to resolve its strike
+HANDOFF_LEAD: float = 2.0
+
+
+class Shard:
+    """
+    Class to represent one worker process as seen by the coordinator
+
+    ...
+
+    Attributes
+    ----------
+    shard: int
+        Number of the shard
+    process: multiprocessing.Process
+        Worker process
+    connection: Connection
+        Coordinator end of the pipe to the worker
+    account_ids: List[str]
+        Accounts logged in by the worker
+    """
+
+    def __init__(self, shard: int = None, process: multiprocessing.Process = None, connection: Connection = None):
+        self.shard: int = shard
+        self.process: multiprocessing.Process = process
+        self.connection: Connection = connection
+        self.account_ids: List[str] = []
+
+    def receive(self) -> Optional[Tuple]:
+        """
+        Waits for the next message of the worker, None if the worker died
+        """
+        try:
+            while not self.connection.poll(POLL_INTERVAL):
+                if not self.process.is_alive():
+                    return None
+            return self.connection.recv()
+        except (EOFError, OSError):
+            return None
+
+
+class ShardPool:
+    """
+    Coordinator of worker processes which each own a shard of the accounts
+
+    Accounts are split round robin over the credentials file. Every worker logs in its own accounts and keeps their
+    sessions, rate budgets, order journal, exit plans and log, so hundreds of accounts are not placing orders under
+    one interpreter lock. The coordinator only reads commands, sends them to all workers over a pipe each and
+    gathers how every shard did. All workers write to the same trade history. Scheduled entries wait in the
+    coordinator and are handed to the workers just before their time, once their strike is resolved.
+
+    ...
+
+    Attributes
+    ----------
+    shards: List[Shard]
+        Running workers
+    my_account_id: Optional[str]
+        Account ID of the primary account
+    jobs: JobManager
+        Scheduled entries, each job lasts until its entry is sent
+    handed: Dict[threading.Event, str]
+        Command handed to the workers for every scheduled entry already handed, by the stop event of its job
+    lock: threading.Lock
+        Held while talking to the workers, so a scheduled entry and a typed command do not mix their messages
+
+    Methods
+    -------
+    start(self, count: int = None) -> bool:
+        Starts the workers and waits until all of them are logged in
+    driver(self, command: str = None) -> None:
+        Processes a command of a sharded run
+    broadcast(self, command: str = None) -> None:
+        Runs a command in all shards at the same time and prints how each of them did
+    schedule(self, command: str = None) -> None:
+        Waits for the time of a scheduled entry in the coordinator and then hands it to all shards
+    list_jobs(self) -> None:
+        Prints the scheduled entries and how many shards hold each one already handed
+    stop_job(self, command: str = None) -> None:
+        Cancels a scheduled entry, in the shards too if it is already handed to them
+    resolve(self, command: str = None) -> Optional[str]:
+        Resolves a relative strike or expiry of an entry once, in the shard of the primary account
+    pnl(self) -> None:
+        Gathers the P&L of every account from all shards and prints it once
+    stop(self) -> None:
+        Asks all workers to finish and waits for them
+    """
+
+    def __init__(self):
+        self.shards: List[Shard] = []
+        self.my_account_id: Optional[str] = None
+        self.jobs: JobManager = JobManager()
+        self.handed: Dict[threading.Event, str] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def start(self, count: int = None) -> bool:
+        """
+        Starts the workers and waits until all of them are logged in
+
+        Parameters
+        ----------
+        count: int, default: None
+            Number of worker processes
+
+        Returns
+        -------
+        bool:
+            True if at least one account is logged in
+        """
+        # Workers start from a fresh interpreter instead of a copy of this one and its threads
+        context = multiprocessing.get_context("spawn")
+        for shard in range(count):
+            connection, worker_connection = context.Pipe()
+            process: multiprocessing.Process = context.Process(target=run_shard, name="shard-" + str(shard),
+                                                              kwargs={"shard": shard, "shards": count,
+                                                                      "connection": worker_connection})
+            process.start()
+            worker_connection.close()
+            self.shards.append(Shard(shard=shard, process=process, connection=connection))
+        atexit.register(self.stop)
+        for shard in list(self.shards):
+            message: Optional[Tuple] = shard.receive()
+            if message is None or message[0] != "ready":
+                print("Shard " + str(shard.shard) + " did not start\n")
+                self.shards.remove(shard)
+                continue
+            _, shard.account_ids, my_account_id = message
+            self.my_account_id = self.my_account_id or my_account_id
+        print("Total valid clients: " + str(sum(len(shard.account_ids) for shard in self.shards)) + " in "
+              + str(len(self.shards)) + " shards")
+        return any(shard.account_ids for shard in self.shards)
+
+    def driver(self, command: str = None) -> None:
+        """
+        Processes a command of a sharded run
+
+        Trading commands run in every shard, PNL is gathered from all shards and HISTORY is read here. SCHEDULE waits
+        here and runs in every shard at its time. Commands watching accounts in the background are only available in
+        one process. A relative strike or expiry of ENTRY is resolved before the command is sent, and the one of
+        SCHEDULE when it fires, so every shard trades the same strike.
+
+        Parameters
+        ----------
+        command: str, default: None
+            The command
+        """
+        command = command.strip()
+        command_type: str = command.split(' ')[0]
+        if command_type == "ENTRY":
+            command = self.resolve(command=command)
+            if command is None:
+                return None
+        if command_type in SHARDED_COMMANDS:
+            self.broadcast(command=command)
+        elif command_type == "SCHEDULE":
+            self.schedule(command=command)
+        elif command_type == "JOBS":
+            self.list_jobs()
+        elif command_type == "STOP":
+            self.stop_job(command=command)
+        elif command_type == "PNL":
+            self.pnl()
+        elif command_type == "HISTORY":
+            trade_history.trade_history(command=command, my_account=Account(account_id=self.my_account_id))
+        elif command_type in SINGLE_PROCESS_COMMANDS:
+            print(command_type + " is not available with --shards\n")
+        else:
+            print("Wrong command\n")
+        return None
+
+    def broadcast(self, command: str = None) -> None:
+        """
+        Runs a command in all shards at the same time and prints how each of them did
+
+        All shards get the same seed, so the orders of the command carry the same tag prefix in every shard
+
+        Parameters
+        ----------
+        command: str, default: None
+            The command
+        """
+        seed: str = uuid.uuid4().hex
+        started_at: float = perf_counter()
+        results: List[str] = []
+        with self.lock:
+            for shard in self.shards:
+                shard.connection.send(("run", command, seed))
+            for shard in list(self.shards):
+                message: Optional[Tuple] = shard.receive()
+                if message is None:
+                    results.append("Shard " + str(shard.shard) + ": worker died, check its accounts manually")
+                    self.shards.remove(shard)
+                    continue
+                _, elapsed, error = message
+                results.append("Shard " + str(shard.shard) + ": " + str(len(shard.account_ids)) + " accounts\t"
+                               + str(round(elapsed, 2)) + "s" + ("\t" + error if error is not None else ""))
+        print("\n".join(results))
+        print(command.split(' ')[0] + " done in " + str(round(perf_counter() - started_at, 2)) + "s\n")
+
+    def schedule(self, command: str = None) -> None:
+        """
+        Waits for the time of a scheduled entry in the coordinator and then hands it to all shards
+
+        The entry is resolved HANDOFF_LEAD seconds before the shards plan it, so a relative strike is picked from the
+        prices of that moment and every shard trades the same one. The shards then plan and send it at its time. The
+        job lasts until then, so JOBS lists it and STOP cancels it in every shard.
+
+        Parameters
+        ----------
+        command: str, default: None
+            The command
+        """
+        parts: List[str] = command.split(' ', 2)
+        if len(parts) != 3 or parts[2].split(' ')[0] != "ENTRY":
+            print("Wrong command\n")
+            return None
+        at: Optional[datetime] = today_at(value=parts[1])
+        if at is None:
+            print("Time should be HH:MM, HH:MM:SS or HH:MM:SS.ffffff\n")
+            return None
+        target: float = at.timestamp()
+        if target <= time():
+            print("Scheduled time has already passed\n")
+            return None
+
+        def run(stop_event: threading.Event = None) -> None:
+            if stop_event.wait(timeout=max(0.0, target - time() - PLAN_LEAD - HANDOFF_LEAD)):
+                print("Scheduled entry cancelled: " + parts[2] + "\n")
+                return None
+            entry: Optional[str] = self.resolve(command=parts[2])
+            if entry is None:
+                print("Scheduled entry not placed, strike not resolved: " + parts[2] + "\n")
+                return None
+            scheduled: str = parts[0] + " " + parts[1] + " " + entry
+            self.handed[stop_event] = scheduled
+            self.broadcast(command=scheduled)
+            if stop_event.wait(timeout=max(0.0, target - time())):
+                print("Scheduled entry cancelled in " + str(self._ask(message=("stop_job", scheduled)).count(1))
+                      + " shards: " + entry + "\n")
+            return None
+
+        def finished(job: Job) -> None:
+            self.handed.pop(job.stop_event, None)
+
+        job: Job = self.jobs.start(name=command, target=run, on_exit=finished)
+        print("Entry scheduled as job " + str(job.job_id) + ", handed to the shards "
+              + str(PLAN_LEAD + HANDOFF_LEAD) + "s before " + parts[1] + "\n")
+        return None
+
+    def list_jobs(self) -> None:
+        """
+        Prints the scheduled entries and how many shards hold each one already handed
+        """
+        running: List[Job] = self.jobs.jobs()
+        if not running:
+            print("No running jobs\n")
+            return None
+        held: List[Optional[List[str]]] = self._ask(message=("jobs",))
+        for job in running:
+            description: str = job.name
+            scheduled: Optional[str] = self.handed.get(job.stop_event)
+            if scheduled is not None:
+                description = (description + " (in " + str(sum(1 for names in held if names and scheduled in names))
+                               + " of " + str(len(held)) + " shards)")
+            print(str(job.job_id) + "\t" + description + "\t" + str(int(time() - job.started_at)) + "s")
+        print("\n")
+        return None
+
+    def stop_job(self, command: str = None) -> None:
+        """
+        Cancels a scheduled entry, in the shards too if it is already handed to them
+
+        Parameters
+        ----------
+        command: str, default: None
+            The command
+        """
+        parts: List[str] = command.split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            print("STOP takes the ID of a scheduled entry with --shards\n")
+            return None
+        if not self.jobs.stop(job_id=int(parts[1])):
+            print("No job " + parts[1] + "\n")
+            return None
+        print("Job " + parts[1] + " stopped\n")
+        return None
+
+    def resolve(self, command: str = None) -> Optional[str]:
+        """
+        Resolves a relative strike or expiry of an entry once, in the shard of the primary account
+
+        Parameters
+        ----------
+        command: str, default: None
+            ENTRY command
+
+        Returns
+        -------
+        Optional[str]:
+            The command with the exact strike and expiry, None if it cannot be resolved
+        """
+        shard: Optional[Shard] = next((shard for shard in self.shards if self.my_account_id in shard.account_ids),
+                                      self.shards[0] if self.shards else None)
+        if shard is None:
+            return None
+        with self.lock:
+            shard.connection.send(("resolve", command))
+            message: Optional[Tuple] = shard.receive()
+            if message is None:
+                print("Shard " + str(shard.shard) + ": worker died, check its accounts manually\n")
+                self.shards.remove(shard)
+                return None
+        return message[1]
+
+    def _ask(self, message: Tuple = None) -> List[Optional[object]]:
+        # Sends a message to every shard and returns what each answered, None for a shard that died
+        answers: List[Optional[object]] = []
+        with self.lock:
+            for shard in self.shards:
+                shard.connection.send(message)
+            for shard in list(self.shards):
+                answer: Optional[Tuple] = shard.receive()
+                if answer is None:
+                    print("Shard " + str(shard.shard) + ": worker died, check its accounts manually")
+                    self.shards.remove(shard)
+                answers.append(answer[1] if answer is not None else None)
+        return answers
+
+    def pnl(self) -> None:
+        """
+        Gathers the P&L of every account from all shards and prints it once
+        """
+        rows: List[Tuple[str, float, float, float, bool]] = []
+        with self.lock:
+            for shard in self.shards:
+                shard.connection.send(("pnl",))
+            for shard in list(self.shards):
+                message: Optional[Tuple] = shard.receive()
+                if message is None:
+                    print("Shard " + str(shard.shard) + ": worker died, check its accounts manually")
+                    self.shards.remove(shard)
+                    continue
+                rows.extend(message[1])
+        print("Account\t\tRealised\tUnrealised\tTotal")
+        for account_id, realised, unrealised, total, fresh in rows:
+            print("*****" + str(account_id)[-3:] + "\t" + str(round(realised, 2)) + "\t\t" + str(round(unrealised, 2))
+                  + "\t\t" + str(round(total, 2)) + ("" if fresh else "\tstale"))
+        print("Total\t\t" + str(round(sum(row[1] for row in rows), 2)) + "\t\t"
+              + str(round(sum(row[2] for row in rows), 2)) + "\t\t" + str(round(sum(row[3] for row in rows), 2)))
+        print("\n")
+
+    def stop(self) -> None:
+        """
+        Asks all workers to finish and waits for them
+        """
+        for shard in self.shards:
+            try:
+                shard.connection.send(("stop",))
+            except OSError:
+                pass
+        for shard in self.shards:
+            shard.process.join(timeout=10)
+            if shard.process.is_alive():
+                shard.process.terminate()
+        self.shards = []
+
+
+def run_shard(shard: int = None, shards: int = None, connection: Connection = None) -> None:
+    """
+    Worker process owning one shard of the accounts
+
+    Logs in its accounts, recovers their orders left in flight and then runs what the coordinator sends until it is
+    told to stop.
+
+    Parameters
+    ----------
+    shard: int, default: None
+        Number of the shard
+    shards: int, default: None
+        Number of shards
+    connection: Connection, default: None
+        Worker end of the pipe to the coordinator
+    """
+    # Ctrl+C reaches the whole process group, the coordinator stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start_logging(path=shard_path(path="all.log", shard=shard))
+    # tokens.json is parsed while the logins wait on the broker
+    symbols: BackgroundStep = BackgroundStep(phase="symbols", target=TradingSymbols.initialize)
+    symbols.start()
+    accounts, my_account_id = Login.read_credentials_and_login(shard=shard, shards=shards)
+    SessionManager.start()
+    symbols.join()
+    ExitPlanStore.use(path=shard_path(path=EXIT_PLAN_FILE, shard=shard))
+    ExitFile.use(path=shard_path(path=EXIT_FILE, shard=shard))
+    journal_path: str = shard_path(path=ORDER_JOURNAL_FILE, shard=shard)
+    Journal.start(path=journal_path)
+    HistoryStore.start()
+    recover_orders(accounts=accounts, path=journal_path)
+    # Margin is quoted with the primary account if this shard has it, any account quotes the same margin
+    my_account: Optional[Account] = next((account for account in accounts if account.account_id == my_account_id),
+                                         accounts[0] if accounts else None)
+    print("Shard " + str(shard) + ": " + str(len(accounts)) + " accounts logged in, balance Rs "
+          + str(sum(account.balance for account in accounts)))
+    connection.send(("ready", [account.account_id for account in accounts], my_account_id))
+    while True:
+        try:
+            message: Tuple = connection.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+        if message[0] == "run":
+            _, command, seed = message
+            Execute.seed_tag_prefixes(seed=seed)
+            started_at: float = perf_counter()
+            error: Optional[str] = None
+            try:
+                if accounts:
+                    Driver.driver(command=command, accounts=accounts, my_account=my_account)
+            except Exception as exp:
+                log_event(event="shard_command_failed", level=logging.ERROR, exc_info=True, shard=shard,
+                          command=command, error=str(exp))
+                error = str(exp)
+            connection.send(("done", perf_counter() - started_at, error))
+        elif message[0] == "resolve":
+            connection.send(("resolved", _resolve(command=message[1], my_account=my_account)))
+        elif message[0] == "pnl":
+            connection.send(("pnl", _pnl_rows(book=Driver.book, accounts=accounts)))
+        elif message[0] == "jobs":
+            connection.send(("jobs", [job.name for job in Driver.jobs.jobs()]))
+        elif message[0] == "stop_job":
+            # 1 if the shard still held the entry, 0 if it had already run
+            connection.send(("stopped", int(any([Driver.jobs.stop(job_id=job.job_id) for job in Driver.jobs.jobs()
+                                                 if job.name == message[1]]))))
+    connection.close()
+
+
+def shard_path(path: str = None, shard: int = None) -> str:
+    """
+    File of a shard, next to the file of an unsharded run
+
+    Parameters
+    ----------
+    path: str, default: None
+        File of an unsharded run
+    shard: int, default: None
+        Number of the shard
+
+    Returns
+    -------
+    str
+    """
+    root, extension = os.path.splitext(path)
+    return root + ".shard" + str(shard) + extension
+
+
+def shards_argument(arguments: List[str] = None) -> int:
+    """
+    Number of shards given with --shards, 1 if not given or wrong
+
+    Parameters
+    ----------
+    arguments: List[str], default: None
+        Command line arguments
+
+    Returns
+    -------
+    int
+    """
+    if "--shards" not in arguments:
+        return 1
+    position: int = arguments.index("--shards")
+    if position + 1 >= len(arguments) or not arguments[position + 1].isdigit() or int(arguments[position + 1]) < 1:
+        print("--shards takes a number of worker processes, running in one process\n")
+        return 1
+    return int(arguments[position + 1])
+
+
+def _resolve(command: str = None, my_account: Optional[Account] = None) -> Optional[str]:
+    if my_account is None:
+        return None
+    try:
+        return resolve_entry(command=command, my_account=my_account)
+    except Exception as exp:
+        log_event(event="shard_resolve_failed", level=logging.ERROR, exc_info=True, command=command, error=str(exp))
+        return None
+
+
+def _pnl_rows(book: Book = None, accounts: List[Account] = None) -> List[Tuple[str, float, float, float, bool]]:
+    with ThreadPoolExecutor(max_workers=PNL_WORKERS) as pool:
+        refreshed: Dict[str, bool] = dict(zip([account.account_id for account in accounts],
+                                              pool.map(book.refresh, accounts)))
+    rows: List[Tuple[str, float, float, float, bool]] = []
+    for account in accounts:
+        snapshot: Optional[Snapshot] = book.get(account_id=account.account_id)
+        if snapshot is None:
+            rows.append((account.account_id, 0.0, 0.0, 0.0, False))
+            continue
+        rows.append((account.account_id, snapshot.realised, snapshot.unrealised, snapshot.total,
+                     refreshed[account.account_id]))
+    return rows
@@ -0,0 +1,212 @@
+from order import Slice
+from spread import Spread
+from basket import Basket
+from typing import List, Optional, Tuple
+
+
+class PositionSizes:
+    """
+    Class to represent the size of one spread, or basket, in every account
+
+    All accounts are sized together. Every value is kept as a column with one entry per account, and each column is
+    computed in a single pass over the previous ones.
+
+    ...
+
+    Attributes
+    ----------
+    account_ids: List[str]
+        Account IDs in the order of the columns
+    capitals: List[float]
+        Capital used for sizing, the capital to use capped by the balance
+    lots: List[int]
+        Number of spreads of every account
+    full_slices: List[int]
+        Number of slices of the freeze quantity
+    remaining_lots: List[int]
+        Lots in the last, smaller slice
+    exposures: List[float]
+        Margin blocked by the spreads of every account
+    margin_per_lot: float
+        Margin required to place one lot of the spread
+    lots_per_slice: int
+        Number of spreads in a full slice
+
+    Methods
+    -------
+    compute(account_ids: List[str] = None, capitals: List[float] = None, balances: List[Optional[float]] = None,
+            margin_per_lot: float = None, quantity_per_lot: int = None, freeze_quantity: int = None) -> PositionSizes:
+        Sizes the spread for all accounts
+    slices(self, position: int = None, spread: Spread = None) -> List[Tuple[Slice, Slice]]:
+        Buy-sell slices of one account
+    slice_spread(spread: Spread = None, lots: int = None, lots_per_slice: int = None) -> List[Tuple[Slice, Slice]]:
+        Splits a number of spreads into buy-sell slices
+    basket_slices(self, position: int = None, basket: Basket = None) -> List[Tuple[Slice, ...]]:
+        Slices of all legs of a basket for one account
+    slice_basket(basket: Basket = None, lots: int = None, lots_per_slice: int = None) -> List[Tuple[Slice, ...]]:
+        Splits a number of baskets into slices of all legs
+    report(self) -> None:
+        Prints the planned exposure of all accounts
+    """
+
+    def __init__(self, account_ids: List[str] = None, capitals: List[float] = None, lots: List[int] = None,
+                 full_slices: List[int] = None, remaining_lots: List[int] = None, exposures: List[float] = None,
+                 margin_per_lot: float = None, lots_per_slice: int = None):
+        self.account_ids: List[str] = account_ids
+        self.capitals: List[float] = capitals
+        self.lots: List[int] = lots
+        self.full_slices: List[int] = full_slices
+        self.remaining_lots: List[int] = remaining_lots
+        self.exposures: List[float] = exposures
+        self.margin_per_lot: float = margin_per_lot
+        self.lots_per_slice: int = lots_per_slice
+
+    @staticmethod
+    def compute(account_ids: List[str] = None, capitals: List[float] = None, balances: List[Optional[float]] = None,
+                margin_per_lot: float = None, quantity_per_lot: int = None,
+                freeze_quantity: int = None) -> "PositionSizes":
+        """
+        Sizes the spread for all accounts
+
+        Parameters
+        ----------
+        account_ids: List[str], default: None
+            Account IDs
+        capitals: List[float], default: None
+            Capital to use of every account
+        balances: List[Optional[float]], default: None
+            Available balance of every account, not used to cap the capital if None
+        margin_per_lot: float, default: None
+            Margin required to place one lot of the spread
+        quantity_per_lot: int, default: None
+            Quantity per lot of the index
+        freeze_quantity: int, default: None
+            Freeze quantity of the index
+
+        Returns
+        -------
+        PositionSizes
+        """
+        lots_per_slice: int = freeze_quantity // quantity_per_lot
+        capitals = [capital if balance is None else min(capital, balance)
+                    for capital, balance in zip(capitals, balances)]
+        lots: List[int] = [max(0, int(capital / margin_per_lot)) for capital in capitals]
+        full_slices: List[int] = [lot // lots_per_slice for lot in lots]
+        remaining_lots: List[int] = [lot % lots_per_slice for lot in lots]
+        exposures: List[float] = [lot * margin_per_lot for lot in lots]
+
+        return PositionSizes(account_ids=account_ids, capitals=capitals, lots=lots, full_slices=full_slices,
+                             remaining_lots=remaining_lots, exposures=exposures, margin_per_lot=margin_per_lot,
+                             lots_per_slice=lots_per_slice)
+
+    def slices(self, position: int = None, spread: Spread = None) -> List[Tuple[Slice, Slice]]:
+        """
+        Buy-sell slices of one account
+
+        Parameters
+        ----------
+        position: int, default: None
+            Position of the account in the columns
+        spread: Spread, default: None
+            Spread being placed
+
+        Returns
+        -------
+        List[Tuple[Slice, Slice]]
+        """
+        return PositionSizes.slice_spread(spread=spread, lots=self.lots[position], lots_per_slice=self.lots_per_slice)
+
+    @staticmethod
+    def slice_spread(spread: Spread = None, lots: int = None, lots_per_slice: int = None) -> List[Tuple[Slice, Slice]]:
+        """
+        Splits a number of spreads into buy-sell slices
+
+        Every slice shares the orders of the spread as templates, only the quantity differs, and all full slices are
+        the same pair.
+
+        Parameters
+        ----------
+        spread: Spread, default: None
+            Spread being placed
+        lots: int, default: None
+            Number of spreads
+        lots_per_slice: int, default: None
+            Number of spreads in a full slice
+
+        Returns
+        -------
+        List[Tuple[Slice, Slice]]
+        """
+        if lots <= 0:
+            return []
+        full_slices, remaining_lots = divmod(lots, lots_per_slice)
+        full_slice: Tuple[Slice, Slice] = ((spread.buying_order, spread.buying_order.qty * lots_per_slice),
+                                           (spread.selling_order, spread.selling_order.qty * lots_per_slice))
+        order_list: List[Tuple[Slice, Slice]] = [full_slice] * full_slices
+        if remaining_lots:
+            order_list.append(((spread.buying_order, spread.buying_order.qty * remaining_lots),
+                               (spread.selling_order, spread.selling_order.qty * remaining_lots)))
+        return order_list
+
+    def basket_slices(self, position: int = None, basket: Basket = None) -> List[Tuple[Slice, ...]]:
+        """
+        Slices of all legs of a basket for one account
+
+        Parameters
+        ----------
+        position: int, default: None
+            Position of the account in the columns
+        basket: Basket, default: None
+            Basket being placed
+
+        Returns
+        -------
+        List[Tuple[Slice, ...]]
+        """
+        return PositionSizes.slice_basket(basket=basket, lots=self.lots[position], lots_per_slice=self.lots_per_slice)
+
+    @staticmethod
+    def slice_basket(basket: Basket = None, lots: int = None, lots_per_slice: int = None) -> List[Tuple[Slice, ...]]:
+        """
+        Splits a number of baskets into slices of all legs
+
+        Sizes are computed with the largest leg as the quantity per lot, so no leg of a slice exceeds the freeze
+        quantity
+
+        Parameters
+        ----------
+        basket: Basket, default: None
+            Basket being placed
+        lots: int, default: None
+            Number of baskets
+        lots_per_slice: int, default: None
+            Number of baskets in a full slice
+
+        Returns
+        -------
+        List[Tuple[Slice, ...]]
+        """
+        if lots <= 0:
+            return []
+        full_slices, remaining_lots = divmod(lots, lots_per_slice)
+        full_slice: Tuple[Slice, ...] = tuple((order, order.qty * lots_per_slice) for order in basket.legs)
+        order_list: List[Tuple[Slice, ...]] = [full_slice] * full_slices
+        if remaining_lots:
+            order_list.append(tuple((order, order.qty * remaining_lots) for order in basket.legs))
+        return order_list
+
+    def report(self) -> None:
+        """
+        Prints the planned exposure of all accounts
+
+        Accounts too small for a single spread are listed, all others are only counted
+        """
+        total_slices: int = sum(self.full_slices) + sum(1 for lot in self.remaining_lots if lot)
+        empty: List[str] = ["*****" + str(account_id)[-3:]
+                            for account_id, lot in zip(self.account_ids, self.lots) if lot == 0]
+        print("Accounts sized: " + str(len(self.account_ids)))
+        print("Total number of spreads: " + str(sum(self.lots)))
+        print("Total number of slices: " + str(total_slices))
+        print("Total capital used: Rs " + str(sum(self.exposures)) + " of Rs " + str(sum(self.capitals)))
+        if empty:
+            print("Not enough capital for one spread: " + ", ".join(empty))
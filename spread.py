@@ -1,13 +1,9 @@
 from trading_symbols import TradingSymbols
 from index import Index
 from order import Order
+from retry import Retry, RetryExhausted
 from typing import Dict, Optional
 from SmartApi import SmartConnect
-import logging
-import sys
-from time import sleep
-
-log = logging.getLogger()
 
 
 class Spread:
@@ -35,7 +31,7 @@ class Spread:
     get_buying_symbol_and_token(index: str = None, expiry: str = None, selling_strike: str = None,
                                 option_type: str = None, spreadwidth: int = None) -> (Optional[str], Optional[str]):
         Gets the buying symbol and buying token for the buying leg of the spread
-    get_margin_per_lot(self, smartapi: SmartConnect = None) -> Optional[float]:
+    get_margin_per_lot(self, smartapi: SmartConnect = None, account_id: Optional[str] = None) -> Optional[float]:
         Gets the margin required to place one lot of the spread
     reverse(self) -> None:
         Swaps the buying leg and the selling leg of the spread
@@ -161,7 +157,7 @@ class Spread:
 
         return buying_symbol, buying_token
 
-    def get_margin_per_lot(self, smartapi: SmartConnect = None) -> Optional[float]:
+    def get_margin_per_lot(self, smartapi: SmartConnect = None, account_id: Optional[str] = None) -> Optional[float]:
         """
         Gets the margin required to place one lot of the spread
 
@@ -169,6 +165,8 @@ class Spread:
         ----------
         smartapi: SmartConnect, default: None
             SmartConnect object to connect to Angel One
+        account_id: Optional[str], default: None
+            Account ID of the account asking, used for its rate budget and circuit breaker
         Returns
         -------
         Optional[float]:
@@ -177,26 +175,15 @@ class Spread:
         if smartapi is None:
             return None
         params: Dict = {"positions": []}
-        params["positions"].append(self.buying_order.__dict__)
-        params["positions"].append(self.selling_order.__dict__)
-        margin_exception_present: bool = False
-        while True:
-            try:
-                data: Dict = smartapi.getMarginApi(params=params)["data"]
-                if data is None:
-                    return None
-                if margin_exception_present:
-                    print("Margin exception solved.\n")
-                    margin_exception_present = False
-                break
-            except Exception as e:
-                log.exception("Margin exception: " + str(e))
-                if margin_exception_present:
-                    sys.stdout.write("\033[F")
-                    sys.stdout.write("\033[K")
-                margin_exception_present = True
-                print("Margin exception occurring.")
-            sleep(1)
+        params["positions"].append(self.buying_order.to_margin_position())
+        params["positions"].append(self.selling_order.to_margin_position())
+        try:
+            data: Optional[Dict] = Retry.call(fn=lambda: smartapi.getMarginApi(params=params)["data"],
+                                              endpoint="margin", account_id=account_id, label="Margin")
+        except RetryExhausted:
+            return None
+        if data is None:
+            return None
 
         margin_per_lot: float = float(data["totalMarginRequired"])
         self.margin_per_lot = margin_per_lot
@@ -208,14 +195,10 @@ class Spread:
         Swaps the buying leg and the selling leg of the spread
 
         This is done while exiting any spread. Swapping the legs will allow to place the opposite orders that were
-        placed during entry.
+        placed during entry. Orders are shared templates, so new orders are created instead of changing them.
         """
         temp_order: Order = self.selling_order
-        self.selling_order = self.buying_order
-        self.selling_order.transactiontype = "SELL"
-        self.selling_order.tradeType = "SELL"
-        self.buying_order = temp_order
-        self.buying_order.transactiontype = "BUY"
-        self.buying_order.tradeType = "BUY"
+        self.selling_order = self.buying_order.with_tradetype(tradetype="SELL")
+        self.buying_order = temp_order.with_tradetype(tradetype="BUY")
 
         return None
@@ -0,0 +1,128 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from time import perf_counter
+import threading
+
+# Imported first by main.py, so the time of every other import counts in the first lap
+started_at: float = perf_counter()
+lap_at: float = started_at
+phases: List[Tuple[str, float]] = []
+phase_lock: threading.Lock = threading.Lock()
+
+
+class BackgroundStep(threading.Thread):
+    """
+    Thread running one startup step, whose error is raised again by join
+
+    ...
+
+    Attributes
+    ----------
+    error: Optional[BaseException]
+        Error raised by the step, None if it finished
+    """
+
+    def __init__(self, phase: str = None, target: Callable[[], None] = None):
+        super().__init__(name="startup-" + phase.lower(), daemon=True)
+        self.phase: str = phase
+        self.step: Callable[[], None] = target
+        self.error: Optional[BaseException] = None
+
+    def run(self) -> None:
+        phase_started_at: float = perf_counter()
+        try:
+            self.step()
+        except BaseException as exp:
+            self.error = exp
+            return None
+        with phase_lock:
+            phases.append((self.phase + " (background)", perf_counter() - phase_started_at))
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits for the step and raises its error, if any
+        """
+        super().join(timeout=timeout)
+        if self.error is not None:
+            raise self.error
+
+
+class StartupProfile:
+    """
+    Times the steps between starting the program and the first prompt
+
+    Steps run one after the other are timed with lap, steps run in a thread meanwhile with background. Everything
+    is printed by report with --profile-startup, and logged as one startup event on every start.
+
+    ...
+
+    Methods
+    -------
+    lap(phase: str = None) -> None:
+        Records the time since the previous lap as a step
+    background(phase: str = None, target: Callable[[], None] = None) -> BackgroundStep:
+        Runs a step in a thread and records its time once done
+    summary() -> Dict[str, float]:
+        Seconds of every step and up to the first prompt
+    report() -> None:
+        Prints the seconds of every step and up to the first prompt
+    """
+
+    @staticmethod
+    def lap(phase: str = None) -> None:
+        """
+        Records the time since the previous lap as a step
+
+        Parameters
+        ----------
+        phase: str, default: None
+            Name of the step that just finished
+        """
+        global lap_at
+        now: float = perf_counter()
+        with phase_lock:
+            phases.append((phase, now - lap_at))
+            lap_at = now
+
+    @staticmethod
+    def background(phase: str = None, target: Callable[[], None] = None) -> BackgroundStep:
+        """
+        Runs a step in a thread and records its time once done
+
+        An error of the step is kept and raised in the thread that joins it, so a failed step stops the start up
+        instead of leaving its results missing
+
+        Parameters
+        ----------
+        phase: str, default: None
+            Name of the step
+        target: Callable[[], None], default: None
+            The step
+
+        Returns
+        -------
+        BackgroundStep:
+            Thread running the step, joined by whoever needs its result
+        """
+        thread: BackgroundStep = BackgroundStep(phase=phase, target=target)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def summary() -> Dict[str, float]:
+        """
+        Seconds of every step and up to the first prompt
+        """
+        with phase_lock:
+            seconds: Dict[str, float] = {phase: round(elapsed, 4) for phase, elapsed in phases}
+        seconds["first prompt"] = round(perf_counter() - started_at, 4)
+        return seconds
+
+    @staticmethod
+    def report() -> None:
+        """
+        Prints the seconds of every step and up to the first prompt
+        """
+        print("Startup profile")
+        for phase, elapsed in StartupProfile.summary().items():
+            print(phase.capitalize().ljust(28) + str(round(elapsed, 3)) + "s")
+        print("\n")
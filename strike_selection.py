@@ -0,0 +1,295 @@
+from trading_symbols import TradingSymbols
+from market_data import MarketDataHub, Quote
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import datetime
+from time import time
+import threading
+import math
+import re
+
+# Selling strike relative to the at-the-money strike, ATM-2PE is two strikes below it
+ATM_SPEC = re.compile(r"^ATM(?:([+-]\d+))?(CE|PE)$")
+# Selling strike trading closest to a premium, P100PE is the put closest to Rs 100
+PREMIUM_SPEC = re.compile(r"^P(\d+(?:\.\d+)?)(CE|PE)$")
+# Selling strike with a delta closest to a target, D30PE is the put closest to 0.30 delta
+DELTA_SPEC = re.compile(r"^D(\d{1,2})(CE|PE)$")
+STRIKE_SPEC = re.compile(r"^\d+(CE|PE)$")
+# Expiries by their position among the expiries not over yet
+EXPIRY_SPECS: Dict[str, int] = {"NEAREST": 0, "NEXT": 1}
+# Strikes kept subscribed on each side of the future's price
+CHAIN_WIDTH: int = 20
+# Seconds to wait for the first ticks of strikes just subscribed
+CHAIN_WAIT: float = 2.0
+# Options expire at the close of the market on their expiry date
+EXPIRY_HOUR: int = 15
+EXPIRY_MINUTE: int = 30
+YEAR_SECONDS: float = 365 * 24 * 3600.0
+
+subscribed: Set[str] = set()
+subscribe_lock: threading.Lock = threading.Lock()
+
+
+class StrikeSelector:
+    """
+    Resolves relative strikes and expiries from the option chain in memory and live quotes
+
+    The chain comes from tokens.json. Prices come from the market-data hub: the nearest future of the index and
+    CHAIN_WIDTH strikes of each type on each side of it stay subscribed once used, so after the first command on an
+    expiry the strikes are picked from the quote cache without waiting for the broker. The at-the-money strike is the
+    one closest to the forward price implied by put-call parity, and deltas are worked out with Black-76 from the
+    implied volatility of every strike, with no interest rate.
+
+    ...
+
+    Methods
+    -------
+    is_relative(strike: str = None, expiry: str = None) -> bool:
+        True if the strike or expiry has to be resolved
+    resolve(index: str = None, strike: str = None, expiry: str = None, hub: MarketDataHub = None
+            ) -> Optional[Tuple[str, str]]:
+        Picks the strike and expiry and prints the choice
+    """
+
+    @staticmethod
+    def is_relative(strike: str = None, expiry: str = None) -> bool:
+        """
+        True if the strike or expiry has to be resolved
+
+        Parameters
+        ----------
+        strike: str, default: None
+            Strike as given in the command, such as 22000PE or ATM-2PE
+        expiry: str, default: None
+            Expiry as given in the command, such as 25APR24 or NEAREST
+
+        Returns
+        -------
+        bool
+        """
+        return STRIKE_SPEC.match(strike.upper()) is None or expiry.upper() in EXPIRY_SPECS
+
+    @staticmethod
+    def resolve(index: str = None, strike: str = None, expiry: str = None, hub: MarketDataHub = None
+                ) -> Optional[Tuple[str, str]]:
+        """
+        Picks the strike and expiry and prints the choice
+
+        Sample strikes and expiries:
+            ATMPE, ATM-2PE, ATM+1CE
+            P100PE, P42.5CE
+            D30PE, D15CE
+            NEAREST, NEXT
+
+        Parameters
+        ----------
+        index: str, default: None
+            Index, such as NIFTY
+        strike: str, default: None
+            Strike as given in the command
+        expiry: str, default: None
+            Expiry as given in the command
+        hub: MarketDataHub, default: None
+            Market-data hub giving the prices, only used for relative strikes
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]:
+            Strike, such as 22000PE, and expiry, such as 25APR24, None if they cannot be resolved
+        """
+        strike = strike.upper()
+        given_expiry: str = expiry
+        if expiry.upper() in EXPIRY_SPECS:
+            expiries: List[str] = TradingSymbols.expiries(index=index)
+            position: int = EXPIRY_SPECS[expiry.upper()]
+            if position >= len(expiries):
+                print("No " + expiry.upper() + " expiry of " + index + " in tokens.json\n")
+                return None
+            expiry = expiries[position]
+        if STRIKE_SPEC.match(strike) is not None:
+            print(strike + " " + given_expiry + " -> " + strike + " " + expiry)
+            return strike, expiry
+        chain: Dict[int, Dict[str, str]] = TradingSymbols.option_chain(index=index, expiry=expiry)
+        if not chain:
+            print("No option chain of " + index + " " + expiry + " in tokens.json\n")
+            return None
+        atm: Optional[re.Match] = ATM_SPEC.match(strike)
+        premium: Optional[re.Match] = PREMIUM_SPEC.match(strike)
+        delta: Optional[re.Match] = DELTA_SPEC.match(strike)
+        if atm is None and premium is None and delta is None:
+            print("Wrong strike " + strike + "\n")
+            return None
+        strikes: List[int] = _subscribe_chain(index=index, chain=chain, hub=hub)
+        if not strikes:
+            print("No price of the " + index + " future yet\n")
+            return None
+        forward: Optional[float] = _forward(strikes=strikes, chain=chain, hub=hub)
+        if forward is None:
+            print("No quotes of " + index + " " + expiry + " yet\n")
+            return None
+        years: float = _years_to_expiry(expiry=expiry)
+        chosen: Optional[int] = None
+        if atm is not None:
+            option_type: str = atm.group(2)
+            ordered: List[int] = sorted(chain)
+            at_the_money: int = min(ordered, key=lambda value: abs(value - forward))
+            chosen_position: int = ordered.index(at_the_money) + int(atm.group(1) or 0)
+            if 0 <= chosen_position < len(ordered):
+                chosen = ordered[chosen_position]
+        elif premium is not None:
+            option_type = premium.group(2)
+            target: float = float(premium.group(1))
+            priced: List[Tuple[float, int]] = [(abs(price - target), value) for value, price in
+                                               _prices(strikes=strikes, chain=chain, option_type=option_type,
+                                                       hub=hub)]
+            chosen = min(priced)[1] if priced else None
+        else:
+            option_type = delta.group(2)
+            target = int(delta.group(1)) / 100.0
+            deltas: List[Tuple[float, int]] = []
+            for value, price in _prices(strikes=strikes, chain=chain, option_type=option_type, hub=hub):
+                strike_delta: Optional[float] = option_delta(forward=forward, strike=value, years=years, price=price,
+                                                             option_type=option_type)
+                if strike_delta is not None:
+                    deltas.append((abs(abs(strike_delta) - target), value))
+            chosen = min(deltas)[1] if deltas else None
+        if chosen is None or option_type not in chain.get(chosen, {}):
+            print("No strike of " + index + " " + expiry + " matches " + strike + "\n")
+            return None
+        quote: Optional[Quote] = hub.quote(token=chain[chosen][option_type])
+        price: Optional[float] = _price(quote=quote)
+        details: str = "forward " + str(round(forward, 2))
+        if price is not None:
+            details += ", price " + str(round(price, 2))
+            chosen_delta: Optional[float] = option_delta(forward=forward, strike=chosen, years=years, price=price,
+                                                         option_type=option_type)
+            if chosen_delta is not None:
+                details += ", delta " + str(round(chosen_delta, 2))
+        print(strike + " " + given_expiry + " -> " + str(chosen) + option_type + " " + expiry + " (" + details + ")")
+        return str(chosen) + option_type, expiry
+
+
+def option_delta(forward: float = None, strike: float = None, years: float = None, price: float = None,
+                 option_type: str = None) -> Optional[float]:
+    """
+    Black-76 delta of an option at the volatility implied by its price
+
+    Parameters
+    ----------
+    forward: float, default: None
+        Forward price of the index for the expiry
+    strike: float, default: None
+        Strike of the option
+    years: float, default: None
+        Time to expiry in years
+    price: float, default: None
+        Price of the option
+    option_type: str, default: None
+        CE or PE
+
+    Returns
+    -------
+    Optional[float]:
+        Negative for puts, None if no volatility gives the price
+    """
+    intrinsic: float = max(0.0, forward - strike) if option_type == "CE" else max(0.0, strike - forward)
+    if price <= intrinsic or price >= (forward if option_type == "CE" else strike):
+        return None
+    low: float = 0.001
+    high: float = 5.0
+    for _ in range(60):
+        volatility: float = (low + high) / 2
+        if _black(forward=forward, strike=strike, years=years, volatility=volatility,
+                  option_type=option_type) > price:
+            high = volatility
+        else:
+            low = volatility
+    d1: float = _d1(forward=forward, strike=strike, years=years, volatility=(low + high) / 2)
+    return _cdf(d1) if option_type == "CE" else _cdf(d1) - 1.0
+
+
+def _subscribe_chain(index: str = None, chain: Dict[int, Dict[str, str]] = None, hub: MarketDataHub = None
+                     ) -> List[int]:
+    future: Optional[str] = TradingSymbols.future_token(index=index)
+    if future is None:
+        return []
+    _subscribe(tokens=[future], hub=hub)
+    future_quote: Optional[Quote] = hub.quote(token=future)
+    if future_quote is None:
+        return []
+    ordered: List[int] = sorted(chain)
+    centre: int = ordered.index(min(ordered, key=lambda value: abs(value - future_quote[0])))
+    strikes: List[int] = ordered[max(0, centre - CHAIN_WIDTH):centre + CHAIN_WIDTH + 1]
+    _subscribe(tokens=[token for value in strikes for token in chain[value].values()], hub=hub)
+    return strikes
+
+
+def _subscribe(tokens: List[str] = None, hub: MarketDataHub = None) -> None:
+    with subscribe_lock:
+        new_tokens: List[str] = [token for token in tokens if token not in subscribed]
+        subscribed.update(new_tokens)
+    for token in new_tokens:
+        hub.subscribe(token=token)
+    deadline: float = time() + CHAIN_WAIT
+    for token in new_tokens:
+        hub.wait(token=token, timeout=max(0.0, deadline - time()))
+
+
+def _forward(strikes: List[int] = None, chain: Dict[int, Dict[str, str]] = None, hub: MarketDataHub = None
+             ) -> Optional[float]:
+    # Put-call parity at the strike where the call and the put are closest in price
+    best: Optional[Tuple[float, float]] = None
+    for value in strikes:
+        if "CE" not in chain[value] or "PE" not in chain[value]:
+            continue
+        call: Optional[float] = _price(quote=hub.quote(token=chain[value]["CE"]))
+        put: Optional[float] = _price(quote=hub.quote(token=chain[value]["PE"]))
+        if call is None or put is None:
+            continue
+        if best is None or abs(call - put) < best[0]:
+            best = (abs(call - put), value + call - put)
+    return best[1] if best is not None else None
+
+
+def _prices(strikes: List[int] = None, chain: Dict[int, Dict[str, str]] = None, option_type: str = None,
+            hub: MarketDataHub = None) -> List[Tuple[int, float]]:
+    prices: List[Tuple[int, float]] = []
+    for value in strikes:
+        if option_type not in chain[value]:
+            continue
+        price: Optional[float] = _price(quote=hub.quote(token=chain[value][option_type]))
+        if price is not None:
+            prices.append((value, price))
+    return prices
+
+
+def _price(quote: Optional[Quote] = None) -> Optional[float]:
+    # Middle of the best bid and ask when both are there, the last traded price otherwise
+    if quote is None:
+        return None
+    ltp, bid, ask, _ = quote
+    if bid > 0 and ask > 0:
+        return (bid + ask) / 2
+    return ltp if ltp > 0 else None
+
+
+def _years_to_expiry(expiry: str = None) -> float:
+    expires_at: datetime = datetime.strptime(expiry, "%d%b%y").replace(hour=EXPIRY_HOUR, minute=EXPIRY_MINUTE)
+    # An option expiring within the minute is treated as a minute away, so its delta stays defined
+    return max(60.0, (expires_at - datetime.now()).total_seconds()) / YEAR_SECONDS
+
+
+def _black(forward: float = None, strike: float = None, years: float = None, volatility: float = None,
+           option_type: str = None) -> float:
+    d1: float = _d1(forward=forward, strike=strike, years=years, volatility=volatility)
+    d2: float = d1 - volatility * math.sqrt(years)
+    if option_type == "CE":
+        return forward * _cdf(d1) - strike * _cdf(d2)
+    return strike * _cdf(-d2) - forward * _cdf(-d1)
+
+
+def _d1(forward: float = None, strike: float = None, years: float = None, volatility: float = None) -> float:
+    return (math.log(forward / strike) + volatility * volatility * years / 2) / (volatility * math.sqrt(years))
+
+
+def _cdf(value: float = None) -> float:
+    return (1.0 + math.erf(value / math.sqrt(2.0))) / 2
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules of the program are imported by their names, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
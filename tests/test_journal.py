@@ -0,0 +1,155 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+import json
+import pytest
+from execute import Execute
+from journal import Journal
+import order_recovery
+
+TODAY: str = date.today().isoformat() + "T09:15:00.000"
+
+
+class FakeSmartApi:
+    """
+    Order book of one account, as the broker would return it
+    """
+
+    def __init__(self, orders: List[Dict] = None):
+        self.orders: List[Dict] = orders
+        self.reads: int = 0
+
+    def orderBook(self) -> Dict:
+        self.reads += 1
+        return {"status": True, "data": self.orders}
+
+
+def write_journal(path: str = None, records: List[Dict] = None) -> str:
+    with open(path, "w", encoding="utf-8") as journal_file:
+        for record in records:
+            journal_file.write(json.dumps(dict({"time": TODAY}, **record)) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def recorded(monkeypatch) -> List[Dict]:
+    records: List[Dict] = []
+    monkeypatch.setattr(Journal, "record", staticmethod(
+        lambda kind=None, account_id=None, tag=None, durable=False, **fields: records.append(
+            dict({"kind": kind, "account_id": account_id, "tag": tag}, **fields))))
+    return records
+
+
+@pytest.fixture
+def reverted(monkeypatch) -> List[Tuple[str, str]]:
+    reverts: List[Tuple[str, str]] = []
+    monkeypatch.setattr(Execute, "revert_order", staticmethod(
+        lambda unique_orderid=None, account=None, tag=None: reverts.append((unique_orderid, tag)) or True))
+    return reverts
+
+
+def test_replay_merges_the_records_of_every_leg(tmp_path):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "intent", "account_id": "A1", "tag": "T0000B", "symbol": "NIFTY25APR2421800PE"},
+        {"kind": "ack", "account_id": "A1", "tag": "T0000B", "order_id": "1"},
+        {"kind": "intent", "account_id": "A2", "tag": "T0000B"}])
+    legs, reverts = Journal.replay(path=path)
+    assert legs[("A1", "T0000B")]["kind"] == "ack"
+    assert legs[("A1", "T0000B")]["symbol"] == "NIFTY25APR2421800PE"
+    assert legs[("A1", "T0000B")]["order_id"] == "1"
+    assert legs[("A2", "T0000B")]["kind"] == "intent"
+    assert reverts == {}
+
+
+def test_replay_keeps_the_final_state_and_the_reverts(tmp_path):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "fill", "account_id": "A1", "tag": "T0000B"},
+        {"kind": "unknown", "account_id": "A1", "tag": "T0000B"},
+        {"kind": "revert", "account_id": "A1", "tag": "T0000R", "order_id": "7"}])
+    legs, reverts = Journal.replay(path=path)
+    assert legs[("A1", "T0000B")]["kind"] == "fill"
+    assert reverts[("A1", "T0000R")]["order_id"] == "7"
+    assert ("A1", "T0000R") not in legs
+
+
+def test_replay_skips_a_partial_last_line(tmp_path):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "intent", "account_id": "A1", "tag": "T0000B"}])
+    with open(path, "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"time": "' + TODAY + '", "kind": "ack", "acc')
+    legs, _ = Journal.replay(path=path)
+    assert legs[("A1", "T0000B")]["kind"] == "intent"
+
+
+def test_replay_of_a_missing_journal_is_empty(tmp_path):
+    assert Journal.replay(path=str(tmp_path / "missing.jsonl")) == ({}, {})
+
+
+def test_recovery_records_the_status_found_in_the_order_book(tmp_path, recorded, reverted):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "submit", "account_id": "A1", "tag": "T0000B"},
+        {"kind": "submit", "account_id": "A1", "tag": "T0000S"}])
+    smartapi: FakeSmartApi = FakeSmartApi(orders=[
+        {"ordertag": "T0000B", "orderstatus": "complete", "uniqueorderid": "1"},
+        {"ordertag": "T0000S", "orderstatus": "rejected", "uniqueorderid": "2"}])
+    order_recovery.recover_orders(accounts=[SimpleNamespace(account_id="A1", smartapi=smartapi)], path=path)
+    assert smartapi.reads == 1
+    assert {(record["tag"], record["kind"]) for record in recorded} == {("T0000B", "fill"), ("T0000S", "reject")}
+    assert reverted == []
+
+
+def test_recovery_flags_a_selling_leg_never_placed(tmp_path, recorded, reverted, capsys):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "fill", "account_id": "A1", "tag": "T0000B", "symbol": "NIFTY25APR2421800PE"},
+        {"kind": "intent", "account_id": "A1", "tag": "T0000S", "symbol": "NIFTY25APR2422000PE"}])
+    order_recovery.recover_orders(accounts=[SimpleNamespace(account_id="A1", smartapi=FakeSmartApi(orders=[]))],
+                                  path=path)
+    assert recorded == [{"kind": "reject", "account_id": "A1", "tag": "T0000S", "reason": "not placed"}]
+    assert "selling leg T0000S" in capsys.readouterr().out
+
+
+def test_recovery_places_a_revert_decided_but_not_placed(tmp_path, recorded, reverted):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "fill", "account_id": "A1", "tag": "T0000B"},
+        {"kind": "revert", "account_id": "A1", "tag": "T0000R", "order_id": "7"}])
+    order_recovery.recover_orders(accounts=[SimpleNamespace(account_id="A1", smartapi=FakeSmartApi(orders=[]))],
+                                  path=path)
+    assert reverted == [("7", "T0000R")]
+
+
+def test_recovery_closes_records_of_an_earlier_day(tmp_path, recorded, reverted):
+    path: str = str(tmp_path / "journal.jsonl")
+    yesterday: str = (date.today() - timedelta(days=1)).isoformat() + "T15:00:00.000"
+    with open(path, "w", encoding="utf-8") as journal_file:
+        journal_file.write(json.dumps({"time": yesterday, "kind": "submit", "account_id": "A1", "tag": "T0000B"})
+                           + "\n")
+    smartapi: FakeSmartApi = FakeSmartApi(orders=[])
+    order_recovery.recover_orders(accounts=[SimpleNamespace(account_id="A1", smartapi=smartapi)], path=path)
+    assert recorded == []
+    assert smartapi.reads == 0
+    assert Journal.replay(path=path) == ({}, {})
+
+
+def test_compact_keeps_only_the_open_legs_of_the_day(tmp_path):
+    path: str = write_journal(path=tmp_path / "journal.jsonl", records=[
+        {"kind": "intent", "account_id": "A1", "tag": "T0000B", "symbol": "NIFTY25APR2421800PE"},
+        {"kind": "fill", "account_id": "A1", "tag": "T0000B"},
+        {"kind": "intent", "account_id": "A1", "tag": "T0000S", "symbol": "NIFTY25APR2422000PE"},
+        {"kind": "submit", "account_id": "A1", "tag": "T0000S"},
+        {"kind": "revert", "account_id": "A1", "tag": "T0000R", "order_id": "7"}])
+    with open(path, "a", encoding="utf-8") as journal_file:
+        journal_file.write(json.dumps({"time": "2020-01-01T09:15:00.000", "kind": "submit", "account_id": "A2",
+                                       "tag": "T0000B"}) + "\n")
+    legs, reverts = Journal.replay(path=path)
+    Journal.compact(path=path)
+    with open(path, encoding="utf-8") as journal_file:
+        assert len(journal_file.readlines()) == 2
+    assert Journal.replay(path=path) == ({("A1", "T0000S"): legs[("A1", "T0000S")]}, reverts)
+
+
+def test_basket_hedges_are_matched_by_option_type():
+    legs: Dict[Tuple[str, str], Dict] = {
+        ("A1", "T0000B0"): {"kind": "fill", "symbol": "NIFTY25APR2421800PE"},
+        ("A1", "T0000B3"): {"kind": "fill", "symbol": "NIFTY25APR2422700CE"},
+        ("A1", "T0000S1"): {"kind": "intent", "symbol": "NIFTY25APR2422000PE"}}
+    assert order_recovery._filled_hedges(legs=legs, account_id="A1", tag="T0000S1") == ["T0000B0"]
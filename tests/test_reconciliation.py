@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from typing import Dict, List
+from execute import Execute
+from order import Order
+from reconciliation import _check_plan, _kind
+
+BUY: Order = Order(quantity=50, symbol="NIFTY25APR2421800PE", token="101", tradetype="BUY")
+SELL: Order = Order(quantity=50, symbol="NIFTY25APR2422000PE", token="102", tradetype="SELL")
+PLAN = SimpleNamespace(command="ENTRY NIFTY 22000PE 25APR24", tag_prefix="T1A")
+
+
+def placed(tag: str = None, filled: int = None, status: str = "complete") -> Dict:
+    return {"ordertag": tag, "filledshares": str(filled), "orderstatus": status}
+
+
+def slice_tag(position: int = 0, leg: str = None) -> str:
+    return Execute.order_tag(tag_prefix=PLAN.tag_prefix, position=position, leg=leg)
+
+
+def test_kind_over_fill():
+    assert _kind(slices=((BUY, 100), (SELL, 100)), filled=[150, 100], missing=[-50, 0]) == "over-fill"
+
+
+def test_kind_unfilled():
+    assert _kind(slices=((BUY, 100), (SELL, 100)), filled=[0, 0], missing=[100, 100]) == "unfilled"
+
+
+def test_kind_naked_short():
+    assert _kind(slices=((BUY, 100), (SELL, 100)), filled=[50, 100], missing=[50, 0]) == "naked short"
+
+
+def test_kind_orphan_hedge():
+    assert _kind(slices=((BUY, 100), (SELL, 100)), filled=[100, 0], missing=[0, 100]) == "orphan hedge"
+
+
+def test_check_plan_complete_slice():
+    orders: List[Dict] = [placed(tag=slice_tag(leg="buy"), filled=100), placed(tag=slice_tag(leg="sell"), filled=100)]
+    assert _check_plan(account_id="A1", plan=PLAN, order_list=[((BUY, 100), (SELL, 100))], orders=orders) == []
+
+
+def test_check_plan_orphan_hedge_sells_the_missing_quantity():
+    orders: List[Dict] = [placed(tag=slice_tag(leg="buy"), filled=100),
+                          placed(tag=slice_tag(leg="sell"), filled=0, status="rejected")]
+    discrepancies = _check_plan(account_id="A1", plan=PLAN, order_list=[((BUY, 100), (SELL, 100))], orders=orders)
+    assert len(discrepancies) == 1
+    assert discrepancies[0].kind == "orphan hedge"
+    assert [(order.tradetype, order.symbol, quantity) for order, quantity in discrepancies[0].corrections] == [
+        ("SELL", SELL.symbol, 100)]
+
+
+def test_check_plan_reverted_buy_is_not_filled():
+    orders: List[Dict] = [placed(tag=slice_tag(leg="buy"), filled=100),
+                          placed(tag=slice_tag(leg="sell"), filled=0, status="rejected"),
+                          placed(tag=slice_tag(leg="revert"), filled=100)]
+    discrepancies = _check_plan(account_id="A1", plan=PLAN, order_list=[((BUY, 100), (SELL, 100))], orders=orders)
+    assert [discrepancy.kind for discrepancy in discrepancies] == ["unfilled"]
+
+
+def test_check_plan_pending_orders_are_not_corrected():
+    orders: List[Dict] = [placed(tag=slice_tag(leg="buy"), filled=100),
+                          placed(tag=slice_tag(leg="sell"), filled=0, status="open")]
+    discrepancies = _check_plan(account_id="A1", plan=PLAN, order_list=[((BUY, 100), (SELL, 100))], orders=orders)
+    assert [discrepancy.kind for discrepancy in discrepancies] == ["pending"]
+    assert not discrepancies[0].corrections
+
+
+def test_check_plan_over_fill_is_corrected_on_the_other_side():
+    orders: List[Dict] = [placed(tag=slice_tag(leg="buy"), filled=150), placed(tag=slice_tag(leg="sell"), filled=100)]
+    discrepancies = _check_plan(account_id="A1", plan=PLAN, order_list=[((BUY, 100), (SELL, 100))], orders=orders)
+    assert discrepancies[0].kind == "over-fill"
+    assert [(order.tradetype, quantity) for order, quantity in discrepancies[0].corrections] == [("SELL", 50)]
+
+
+def test_check_plan_ignores_other_commands():
+    orders: List[Dict] = [placed(tag=slice_tag(leg="buy"), filled=100), placed(tag=slice_tag(leg="sell"), filled=100),
+                          placed(tag="T2B0000B", filled=0, status="open")]
+    assert _check_plan(account_id="A1", plan=PLAN, order_list=[((BUY, 100), (SELL, 100))], orders=orders) == []
@@ -0,0 +1,70 @@
+from typing import Dict, Optional
+from market_data import Quote
+from strike_selection import _black, _cdf, _d1, _forward, option_delta
+
+FORWARD: float = 22000.0
+YEARS: float = 7 / 365
+VOLATILITY: float = 0.15
+
+
+class FakeHub:
+    """
+    Quotes of a few tokens, as the market-data hub would return them
+    """
+
+    def __init__(self, quotes: Dict[str, Quote] = None):
+        self.quotes: Dict[str, Quote] = quotes
+
+    def quote(self, token: str = None) -> Optional[Quote]:
+        return self.quotes.get(token)
+
+
+def price(strike: float = None, option_type: str = None) -> float:
+    return _black(forward=FORWARD, strike=strike, years=YEARS, volatility=VOLATILITY, option_type=option_type)
+
+
+def test_option_delta_matches_the_volatility_of_the_price():
+    delta: Optional[float] = option_delta(forward=FORWARD, strike=22200, years=YEARS,
+                                          price=price(strike=22200, option_type="CE"), option_type="CE")
+    expected: float = _cdf(_d1(forward=FORWARD, strike=22200, years=YEARS, volatility=VOLATILITY))
+    assert abs(delta - expected) < 1e-6
+    assert 0 < delta < 0.5
+
+
+def test_option_delta_of_a_put_is_negative_and_follows_parity():
+    call: Optional[float] = option_delta(forward=FORWARD, strike=21800, years=YEARS,
+                                         price=price(strike=21800, option_type="CE"), option_type="CE")
+    put: Optional[float] = option_delta(forward=FORWARD, strike=21800, years=YEARS,
+                                        price=price(strike=21800, option_type="PE"), option_type="PE")
+    assert -0.5 < put < 0
+    assert abs(call - put - 1.0) < 1e-6
+
+
+def test_option_delta_without_time_value_is_none():
+    assert option_delta(forward=FORWARD, strike=21800, years=YEARS, price=200.0, option_type="CE") is None
+    assert option_delta(forward=FORWARD, strike=22200, years=YEARS, price=150.0, option_type="PE") is None
+
+
+def test_option_delta_above_the_underlying_is_none():
+    assert option_delta(forward=FORWARD, strike=21800, years=YEARS, price=FORWARD, option_type="CE") is None
+
+
+def test_forward_uses_the_strike_where_call_and_put_are_closest():
+    chain: Dict[int, Dict[str, str]] = {22000: {"CE": "1", "PE": "2"}, 22100: {"CE": "3", "PE": "4"}}
+    hub: FakeHub = FakeHub(quotes={"1": (150.0, 0.0, 0.0, 0.0), "2": (100.0, 0.0, 0.0, 0.0),
+                                   "3": (96.0, 94.0, 96.0, 0.0), "4": (109.0, 109.0, 111.0, 0.0)})
+    # Mid prices at 22100 are 95 and 110, closer than 150 and 100 at 22000
+    assert _forward(strikes=[22000, 22100], chain=chain, hub=hub) == 22100 + 95.0 - 110.0
+
+
+def test_forward_skips_strikes_without_both_prices():
+    chain: Dict[int, Dict[str, str]] = {22000: {"CE": "1", "PE": "2"}, 22100: {"CE": "3"},
+                                        22200: {"CE": "5", "PE": "6"}}
+    hub: FakeHub = FakeHub(quotes={"1": (150.0, 0.0, 0.0, 0.0), "2": (100.0, 0.0, 0.0, 0.0),
+                                   "3": (100.0, 0.0, 0.0, 0.0), "5": (80.0, 0.0, 0.0, 0.0)})
+    assert _forward(strikes=[22000, 22100, 22200], chain=chain, hub=hub) == 22050.0
+
+
+def test_forward_without_prices_is_none():
+    chain: Dict[int, Dict[str, str]] = {22000: {"CE": "1", "PE": "2"}}
+    assert _forward(strikes=[22000], chain=chain, hub=FakeHub(quotes={})) is None
@@ -1,14 +1,18 @@
 from account import Account
+from exit_rules import ExitScheduler, ThresholdRule
+from exit_plan import ExitFile
 from typing import Optional, List
-import codecs
-from time import sleep
-import trade_exit
 
 
-def trade_auto_exit(command: str = None, accounts: List[Account] = None, my_account: Account = None) -> None:
+def trade_auto_exit(command: str = None, accounts: List[Account] = None, my_account: Account = None,
+                    scheduler: ExitScheduler = None) -> None:
     """
     Auto exits a trade based on SL and target
 
+    The SL and target are registered as a rule on the primary account's unrealised P&L, exiting every trade in
+    exit_file.txt. The rule is evaluated by the exit scheduler in the background, so other commands can be run while
+    it is active.
+
     Parameters
     ----------
     command: str, default: None
@@ -17,6 +21,8 @@ def trade_auto_exit(command: str = None, accounts: List[Account] = None, my_acco
         List of accounts to trade
     my_account: Account, default: None
         My primary trading account
+    scheduler: ExitScheduler, default: None
+        Exit scheduler evaluating the rule
     """
     parts: List[str] = command.split(' ')
     if len(parts) != 3:
@@ -34,30 +40,15 @@ def trade_auto_exit(command: str = None, accounts: List[Account] = None, my_acco
         print("Wrong SL or target")
         print("\n")
         return None
-    exit_command: str = ""
-    exit_file = codecs.open("exit_file.txt", "r")
-    for lin in exit_file:
-        exit_command = lin.strip()
-    exit_file.close()
-    if len(exit_command) == 0:
+    exit_commands: List[str] = ExitFile.commands()
+    if not exit_commands:
         print("No exit command specified")
         print("\n")
         return None
-    while True:
-        realised, unrealised, pnl = my_account.get_pnl()
-        if unrealised > tgt:
-            sleep(1)
-            print("Target reached")
-            print("\n")
-            trade_exit.trade_exit(command=exit_command, accounts=accounts)
-            break
-        if unrealised < sl:
-            print("SL hit")
-            print("\n")
-            trade_exit.trade_exit(command=exit_command, accounts=accounts)
-            break
-        sleep(1)
-    exit_file = codecs.open("exit_file.txt", "w")
-    exit_file.write("")
-    exit_file.close()
+    rule_id: int = scheduler.add(rule=ThresholdRule(sl=sl, tgt=tgt,
+                                                    watch_account_id=my_account.account_id,
+                                                    exit_commands=exit_commands))
+    print("Auto exit added as rule " + str(rule_id))
+    print("\n")
     return None
+
@@ -0,0 +1,250 @@
+from basket import Basket
+from account import Account
+from index import Index
+from command_plan import CommandPlan
+from reconciliation import Reconciler
+from sizing import PositionSizes
+from funds import refresh_funds
+from exit_plan import ExitPlanStore, ExitFile
+from order import Slice
+from typing import List, Dict, Optional, Tuple
+import threading
+
+
+def trade_basket(command: str = None, accounts: List[Account] = None, my_account: Account = None) -> None:
+    """
+    Places a basket of legs, such as an iron condor or a ratio spread, in all accounts
+
+    Sample commands:
+        BASKET <index> <legs> <expiry> [<lots>]
+        BASKET NIFTY +21800PE,-22000PE,-22500CE,+22700CE 25APR24
+        BASKET NIFTY -21800PE,+22000PE,+22500CE,-22700CE 25APR24 40
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Account, default: None
+        My primary trading account
+    """
+    plan: Optional[CommandPlan] = plan_basket(command=command, accounts=accounts, my_account=my_account)
+    if plan is None:
+        return None
+    plan.execute()
+    Reconciler.reconcile(plans=[plan])
+    return None
+
+
+def plan_basket(command: str = None, accounts: List[Account] = None, my_account: Account = None
+                ) -> Optional[CommandPlan]:
+    """
+    Validates a basket command and plans its orders without placing them
+
+    Without a number of lots, every account is sized from the margin of the whole basket, quoted in one call. With a
+    number of lots, every account places that many. Every completed slice adds its baskets to the exit plan of the
+    account, and the EXIT command of the basket is added to exit_file.txt once the orders are done. A basket with the
+    signs of an open basket flipped closes it instead: an account places at most the baskets it still holds, none if
+    it holds none, and its slices are taken off that basket's exit plan.
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Account, default: None
+        My primary trading account
+
+    Returns
+    -------
+    Optional[CommandPlan]:
+        Planned orders, None if the command is wrong
+    """
+    parts: List[str] = command.split()
+    if len(parts) not in (4, 5) or (len(parts) == 5 and not parts[4].isdigit()):
+        print("Incomplete command\n")
+        return None
+    index: str = parts[1].strip()
+    index_details: Dict = Index.get_details(index=index)
+    if index_details == {}:
+        print("Index is wrong or not provided\n")
+        return None
+    basket: Basket = Basket()
+    basket.create_basket(index=index, legs=parts[2], expiry=parts[3].strip())
+    if not basket.legs:
+        print("Wrong basket command\n")
+        return None
+    if basket.largest_leg() > index_details["freeze_quantity"]:
+        print("A leg of one lot is above the freeze quantity\n")
+        return None
+    lots: Optional[int] = int(parts[4]) if len(parts) == 5 else None
+    if lots is None:
+        basket.get_margin_per_lot(smartapi=my_account.smartapi, account_id=my_account.account_id)
+        if basket.margin_per_lot is None:
+            print("Margin per lot not available\n")
+            return None
+    print("\n")
+    print("Basket details")
+    for order in basket.legs:
+        print(order.tradetype + " " + str(order.qty // basket.quantity_per_lot) + "x " + str(order.symbol))
+    if basket.margin_per_lot is not None:
+        print("Margin per lot: Rs " + str(basket.margin_per_lot))
+    print("\n")
+
+    closed: Optional[str] = closed_basket(basket=basket)
+    plan: CommandPlan = _tracked_plan(command=command, basket=basket, exit_command=closed or basket.exit_command(),
+                                      closing=closed is not None)
+    # A closing basket never places more baskets in an account than it still holds, so it cannot open a reverse one
+    open_lots: Optional[Dict[str, int]] = ExitPlanStore.load_lots(exit_command=closed) if closed is not None else None
+    lots_per_slice: int = index_details["freeze_quantity"] // basket.largest_leg()
+    account_lots: List[int] = [lots] * len(accounts) if lots is not None else []
+    if lots is None:
+        refresh_funds(accounts=accounts)
+        sizes: PositionSizes = PositionSizes.compute(account_ids=[account.account_id for account in accounts],
+                                                     capitals=[account.capital_to_use for account in accounts],
+                                                     balances=[account.balance for account in accounts],
+                                                     margin_per_lot=basket.margin_per_lot,
+                                                     quantity_per_lot=basket.largest_leg(),
+                                                     freeze_quantity=index_details["freeze_quantity"])
+        sizes.report()
+        print("\n")
+        if open_lots is None:
+            for position, account in enumerate(accounts):
+                plan.add_slices(account=account, order_list=sizes.basket_slices(position=position, basket=basket))
+            return plan
+        account_lots = list(sizes.lots)
+    else:
+        print("Baskets per account: " + str(lots) + "\n")
+    for account, planned_lots in zip(accounts, account_lots):
+        if open_lots is not None:
+            held: int = max(0, open_lots.get(account.account_id, 0))
+            if held == 0:
+                print("No open basket to close for *****" + str(account.account_id)[-3:] + "\n")
+                continue
+            if planned_lots > held:
+                print("Account ID: *****" + str(account.account_id)[-3:] + "\tBaskets capped at the " + str(held)
+                      + " still open")
+                planned_lots = held
+        plan.add_slices(account=account, order_list=PositionSizes.slice_basket(basket=basket, lots=planned_lots,
+                                                                               lots_per_slice=lots_per_slice))
+    return plan
+
+
+def plan_basket_exit(command: str = None, accounts: List[Account] = None, clear_exit_file: bool = True
+                     ) -> Optional[CommandPlan]:
+    """
+    Plans the exit of a basket from the baskets recorded in the exit plan of every account
+
+    The legs are flipped, so the short legs are bought back before the hedges are sold. The plan of an account is
+    dropped once all its baskets are exited, and the basket is removed from exit_file.txt once every account is.
+
+    Sample commands:
+        EXIT <index> <legs> <expiry>
+        EXIT NIFTY +21800PE,-22000PE,-22500CE,+22700CE 25APR24
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command, with the legs as they were entered
+    accounts: List[Account], default: None
+        List of accounts to trade
+    clear_exit_file: bool, default: True
+        Removes the basket from exit_file.txt once all accounts are exited. Set to False when only some of the
+        accounts are exited
+
+    Returns
+    -------
+    Optional[CommandPlan]:
+        Planned orders, None if the command is wrong
+    """
+    parts: List[str] = command.split()
+    index_details: Dict = Index.get_details(index=parts[1])
+    basket: Basket = Basket()
+    basket.create_basket(index=parts[1], legs=parts[2], expiry=parts[3])
+    if not basket.legs:
+        print("Wrong basket command\n")
+        return None
+    exit_command: str = basket.exit_command()
+    open_lots: Dict[str, int] = ExitPlanStore.load_lots(exit_command=exit_command)
+    basket.reverse()
+    print("\n")
+    print("Basket exit details")
+    for order in basket.legs:
+        print(order.tradetype + " " + str(order.qty // basket.quantity_per_lot) + "x " + str(order.symbol))
+    print("\n")
+    plan: CommandPlan = _tracked_plan(command=command, basket=basket, exit_command=exit_command, closing=True,
+                                      clear_exit_file=clear_exit_file)
+    lots_per_slice: int = index_details["freeze_quantity"] // basket.largest_leg()
+    for account in accounts:
+        lots: int = open_lots.get(account.account_id, 0)
+        if lots <= 0:
+            if account.account_id not in open_lots:
+                print("No exit plan of the basket for *****" + str(account.account_id)[-3:]
+                      + ", exit it with EXITALL if it holds one\n")
+            continue
+        print("Account ID: *****" + str(account.account_id)[-3:] + "\tBaskets: " + str(lots))
+        plan.add_slices(account=account, order_list=PositionSizes.slice_basket(basket=basket, lots=lots,
+                                                                               lots_per_slice=lots_per_slice))
+    print("\n")
+    return plan
+
+
+def closed_basket(basket: Basket = None) -> Optional[str]:
+    """
+    EXIT command of the open basket whose legs the basket flips, None if it opens a new one
+
+    Parameters
+    ----------
+    basket: Basket, default: None
+        Basket of a BASKET command
+
+    Returns
+    -------
+    Optional[str]
+    """
+    flipped: List[str] = sorted(leg.translate(str.maketrans("+-", "-+")) for leg in basket.describe().split(','))
+    for exit_command in ExitFile.commands():
+        parts: List[str] = exit_command.split(' ')
+        if (len(parts) == 4 and parts[1] == basket.index and parts[3] == basket.expiry
+                and sorted(parts[2].split(',')) == flipped):
+            return exit_command
+    return None
+
+
+def _tracked_plan(command: str = None, basket: Basket = None, exit_command: str = None, closing: bool = False,
+                  clear_exit_file: bool = True) -> CommandPlan:
+    """
+    Plan of a basket whose completed slices are recorded in the exit plan of the basket
+
+    Baskets opened are added to the plan and their EXIT command to exit_file.txt, baskets closed are taken off the
+    plan, which is dropped for every account with none left
+    """
+    filled: List[int] = [0]
+    lock: threading.Lock = threading.Lock()
+
+    def record_fill(account: Account, *slices: Slice) -> None:
+        lots: int = basket.lots(slices=slices)
+        with lock:
+            filled[0] += lots
+        ExitPlanStore.record_lots(exit_command=exit_command, account_id=account.account_id,
+                                  lots=-lots if closing else lots)
+
+    def finish() -> None:
+        if not closing:
+            if filled[0] > 0:
+                ExitFile.add(exit_command=exit_command)
+            return None
+        open_lots: List[Tuple[str, int]] = list(ExitPlanStore.load_lots(exit_command=exit_command).items())
+        exited: List[str] = [account_id for account_id, lots in open_lots if lots <= 0]
+        for account_id, lots in open_lots:
+            if lots > 0:
+                print("Basket exit not completed for *****" + str(account_id)[-3:] + ", " + str(lots)
+                      + " baskets left in its exit plan\n")
+        ExitPlanStore.clear(exit_command=exit_command, account_ids=exited)
+        if clear_exit_file and len(exited) == len(open_lots):
+            ExitFile.remove(exit_command=exit_command)
+        return None
+
+    return CommandPlan(command=command, on_fill=record_fill, finish=finish)
@@ -0,0 +1,109 @@
+from account import Account
+from command_plan import CommandPlan
+from reconciliation import Reconciler
+from trade_entry import plan_entry
+from trade_exit import plan_exit
+from typing import List, Optional
+from time import perf_counter
+import threading
+import codecs
+import os
+
+
+def trade_batch(command: str = None, accounts: List[Account] = None, my_account: Account = None) -> None:
+    """
+    Runs several ENTRY and EXIT commands together
+
+    Every command is validated and planned first. If any of them is wrong, nothing is placed and nothing is written.
+    The capital to use and the balance of every account are split evenly over the entries of the batch, so entries
+    placed together never commit more than the account has. Then all commands are executed at the same time, each
+    account's requests being taken from its shared rate budget, and a summary of the wall time and of every command
+    is printed.
+
+    Sample commands:
+        BATCH <file>
+        BATCH ENTRY NIFTY 22000PE 25APR24; ENTRY BANKNIFTY 48000PE 24APR24
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Account, default: None
+        My primary trading account
+    """
+    commands: Optional[List[str]] = read_batch(argument=command[len("BATCH"):].strip())
+    if not commands:
+        print("No commands in batch\n")
+        return None
+    for single_command in commands:
+        if single_command.split(' ')[0] not in ("ENTRY", "EXIT"):
+            print("Only ENTRY and EXIT can be batched: " + single_command + "\n")
+            return None
+    entries: int = len([single_command for single_command in commands if single_command.split(' ')[0] == "ENTRY"])
+    if entries > 1:
+        print("Capital of every account split over " + str(entries) + " entries\n")
+    plans: List[CommandPlan] = []
+    for single_command in commands:
+        plan: Optional[CommandPlan] = None
+        if single_command.split(' ')[0] == "ENTRY":
+            plan = plan_entry(command=single_command, accounts=accounts, my_account=my_account,
+                              capital_share=1.0 / entries)
+        else:
+            plan = plan_exit(command=single_command, accounts=accounts)
+        if plan is None:
+            print("Batch aborted, nothing was placed: " + single_command + "\n")
+            return None
+        plans.append(plan)
+    started_at: float = perf_counter()
+    all_threads: List[threading.Thread] = []
+    for plan in plans:
+        thread: threading.Thread = threading.Thread(target=plan.execute, name="")
+        all_threads.append(thread)
+    for thread in all_threads:
+        thread.daemon = False
+        thread.start()
+    for thread in all_threads:
+        thread.join()
+    wall_time: float = perf_counter() - started_at
+    print("Batch summary")
+    for plan in plans:
+        print(plan.command + "\t" + str(len(plan.accounts)) + " accounts\t"
+              + str(plan.filled) + "/" + str(plan.total_orders()) + " slices filled\t"
+              + str(round(plan.elapsed, 2)) + "s")
+    print("Wall time: " + str(round(wall_time, 2)) + "s")
+    print("\n")
+    Reconciler.reconcile(plans=plans)
+    return None
+
+
+def read_batch(argument: str = None) -> Optional[List[str]]:
+    """
+    Reads the commands of a batch
+
+    The argument is either a file with one command per line, or commands separated by semicolons
+
+    Parameters
+    ----------
+    argument: str, default: None
+        Everything after BATCH
+
+    Returns
+    -------
+    Optional[List[str]]:
+        Commands of the batch
+    """
+    if len(argument) == 0:
+        return None
+    if ';' not in argument and os.path.isfile(argument):
+        commands: List[str] = []
+        batch_file = codecs.open(argument, "r")
+        for lin in batch_file:
+            if len(lin.strip()) == 0 or lin[0] == "#":
+                continue
+            commands.append(" ".join(lin.split()))
+        batch_file.close()
+        return commands
+    return [" ".join(single_command.split()) for single_command in argument.split(';')
+            if len(single_command.strip()) != 0]
@@ -1,9 +1,17 @@
 from spread import Spread
 from account import Account
-from execute import Execute
 from index import Index
-from typing import List, Dict
-import codecs
+from order import Slice
+from exit_plan import ExitPlanStore, ExitFile
+from command_plan import CommandPlan
+from reconciliation import Reconciler
+from sizing import PositionSizes
+from margin import MarginService
+from funds import refresh_funds
+from strike_selection import StrikeSelector
+from market_data import shared_hub
+from typing import List, Dict, Optional, Set, Tuple
+import threading
 
 
 def trade_entry(command: str = None, accounts: List[Account] = None, my_account: Account = None) -> None:
@@ -19,10 +27,44 @@ def trade_entry(command: str = None, accounts: List[Account] = None, my_account:
     my_account: Account, default: None
         My primary trading account
     """
-    parts: List[str] = command.split(' ')
-    if len(parts) != 4:
-        print("Incomplete command")
+    plan: Optional[CommandPlan] = plan_entry(command=command, accounts=accounts, my_account=my_account)
+    if plan is None:
         return None
+    plan.execute()
+    Reconciler.reconcile(plans=[plan])
+    return None
+
+
+def plan_entry(command: str = None, accounts: List[Account] = None, my_account: Account = None,
+               capital_share: float = 1.0) -> Optional[CommandPlan]:
+    """
+    Validates an entry command and plans its orders without placing them
+
+    A relative strike or expiry, such as ATM-2PE or NEAREST, is resolved first and the orders, the exit command and the
+    history use the strike it resolved to. Nothing is written before the plan is executed: the exit plan of an account
+    starts with its first completed spread, and the exit command is added to exit_file.txt once all orders are done.
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Account, default: None
+        My primary trading account
+    capital_share: float, default: 1.0
+        Part of the capital to use and of the balance of every account given to this entry, less than 1 when
+        several entries are placed together
+
+    Returns
+    -------
+    Optional[CommandPlan]:
+        Planned orders, None if the command is wrong
+    """
+    command = resolve_entry(command=command, my_account=my_account)
+    if command is None:
+        return None
+    parts: List[str] = command.split(' ')
     index: str = parts[1].strip()
     strike: str = parts[2].strip()
     index_details: Dict = Index.get_details(index=index)
@@ -34,25 +76,90 @@ def trade_entry(command: str = None, accounts: List[Account] = None, my_account:
     exit_command: str = "EXIT" + " " + index + " " + strike + " " + expiry
     spread: Spread = Spread()
     spread.create_spread(command=index + " " + strike, expiry=expiry)
-    spread.get_margin_per_lot(smartapi=my_account.smartapi)
     if spread.buying_order is None or spread.selling_order is None:
         print("Wrong trade command\n")
         return None
+    MarginService.get(spread=spread, account=my_account)
+    if spread.margin_per_lot is None:
+        print("Margin per lot not available\n")
+        return None
     print("\n")
     print("Entry spread details")
     print("Buying symbol: " + str(spread.buying_order.symbol))
     print("Selling symbol: " + str(spread.selling_order.symbol))
     print("Margin per lot: Rs " + str(spread.margin_per_lot))
     print("\n")
-    freeze_quantity: int = index_details["freeze_quantity"]
-    for account in accounts:
-        account_id: str = account.account_id
-        account_id = "*****" + account_id[-3:]
-        print("Account ID: " + account_id)
-        account.create_list_of_orders(spread=spread, freeze_quantity=freeze_quantity)
+
+    started: Set[str] = set()
+    started_lock: threading.Lock = threading.Lock()
+
+    def record_fill(account: Account, b_slice: Slice, s_slice: Slice) -> None:
+        with started_lock:
+            if account.account_id not in started:
+                started.add(account.account_id)
+                ExitPlanStore.start(exit_command=exit_command, account_id=account.account_id, spread=spread)
+        ExitPlanStore.record_fill(exit_command=exit_command, account_id=account.account_id,
+                                  buying_quantity=b_slice[1], selling_quantity=s_slice[1])
+
+    def finish() -> None:
+        ExitFile.add(exit_command=exit_command)
+
+    plan: CommandPlan = CommandPlan(command=command, on_fill=record_fill, finish=finish)
+    refresh_funds(accounts=accounts)
+    sizes: PositionSizes = PositionSizes.compute(account_ids=[account.account_id for account in accounts],
+                                                 capitals=[account.capital_to_use * capital_share
+                                                           for account in accounts],
+                                                 balances=[None if account.balance is None
+                                                           else account.balance * capital_share
+                                                           for account in accounts],
+                                                 margin_per_lot=spread.margin_per_lot,
+                                                 quantity_per_lot=spread.buying_order.qty,
+                                                 freeze_quantity=index_details["freeze_quantity"])
+    sizes.report()
+    print("\n")
+    for position, account in enumerate(accounts):
+        plan.add_slices(account=account, order_list=sizes.slices(position=position, spread=spread))
+    return plan
+
+
+def resolve_entry(command: str = None, my_account: Account = None) -> Optional[str]:
+    """
+    Validates an entry command and resolves a relative strike or expiry in it
+
+    Sample commands:
+        ENTRY NIFTY 22000PE 25APR24
+        ENTRY NIFTY ATM-2PE NEAREST
+        ENTRY NIFTY P100CE 25APR24
+        ENTRY NIFTY D30PE NEXT
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    my_account: Account, default: None
+        My primary trading account, whose session streams the prices
+
+    Returns
+    -------
+    Optional[str]:
+        The command with the exact strike and expiry, None if the command is wrong or cannot be resolved
+    """
+    parts: List[str] = command.split(' ')
+    if len(parts) != 4:
+        print("Incomplete command")
+        return None
+    index: str = parts[1].strip()
+    strike: str = parts[2].strip()
+    expiry: str = parts[3].strip()
+    if not StrikeSelector.is_relative(strike=strike, expiry=expiry):
+        return command
+    if Index.get_details(index=index) == {}:
+        print("Index is wrong or not provided")
         print("\n")
-    Execute.place_order(accounts=accounts)
-    exit_file = codecs.open("exit_file.txt", "w")
-    exit_file.write(exit_command)
-    exit_file.close()
-    return None
+        return None
+    selection: Optional[Tuple[str, str]] = StrikeSelector.resolve(
+        index=index, strike=strike, expiry=expiry,
+        hub=shared_hub(smartapi=my_account.smartapi, account_id=my_account.account_id))
+    if selection is None:
+        return None
+    return parts[0] + " " + index + " " + selection[0] + " " + selection[1]
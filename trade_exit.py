@@ -1,12 +1,15 @@
 from spread import Spread
 from account import Account
-from execute import Execute
+from command_plan import CommandPlan
+from reconciliation import Reconciler
 from index import Index
-from typing import List, Dict
-import codecs
+from exit_plan import ExitPlan, ExitPlanStore, ExitFile
+from order import Slice
+from typing import List, Dict, Optional
+import threading
 
 
-def trade_exit(command: str = None, accounts: List[Account] = None) -> None:
+def trade_exit(command: str = None, accounts: List[Account] = None, clear_exit_file: bool = True) -> None:
     """
     Exits a trade
 
@@ -16,6 +19,43 @@ def trade_exit(command: str = None, accounts: List[Account] = None) -> None:
         The command
     accounts: List[Account], default: None
         List of accounts to trade
+    clear_exit_file: bool, default: True
+        Removes the trade from exit_file.txt once all accounts are exited. Set to False when only some of the accounts
+        are exited
+    """
+    plan: Optional[CommandPlan] = plan_exit(command=command, accounts=accounts, clear_exit_file=clear_exit_file)
+    if plan is None:
+        return None
+    plan.execute()
+    Reconciler.reconcile(plans=[plan])
+    return None
+
+
+def plan_exit(command: str = None, accounts: List[Account] = None, clear_exit_file: bool = True
+              ) -> Optional[CommandPlan]:
+    """
+    Validates an exit command and plans its orders without placing them
+
+    If ENTRY left an exit plan with fills for an account, orders are built from the plan right away, and positions are
+    verified for all such accounts in parallel once the orders are done. Accounts without a plan, or whose plan has no
+    fill, fall back to fetching their positions before the orders are built. Every exited slice is taken off the plan
+    as it fills, the plan of an account is dropped only once all its slices are exited, and the trade is removed from
+    exit_file.txt only once every account is exited.
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    clear_exit_file: bool, default: True
+        Removes the trade from exit_file.txt once all accounts are exited. Set to False when only some of the accounts
+        are exited
+
+    Returns
+    -------
+    Optional[CommandPlan]:
+        Planned orders, None if the command is wrong
     """
     parts: List[str] = command.split(' ')
     if len(parts) != 4:
@@ -27,36 +67,100 @@ def trade_exit(command: str = None, accounts: List[Account] = None) -> None:
     if index_details == {}:
         print("Index is wrong or not provided\n")
         return None
+    if strike[:1] in ("+", "-"):
+        # Legs of a basket, exited from the baskets recorded when it was placed
+        import trade_basket
+        return trade_basket.plan_basket_exit(command=command, accounts=accounts, clear_exit_file=clear_exit_file)
     expiry: str = parts[3].strip()
+    exit_command: str = "EXIT" + " " + index + " " + strike + " " + expiry
     spread: Spread = Spread()
     spread.create_spread(command=index + " " + strike, expiry=expiry)
-    spread.reverse()
     if spread.buying_order is None or spread.selling_order is None:
         print("Wrong trade command")
         return None
+    spread.reverse()
     print("\n")
     print("Exit spread details")
     print("Selling symbol: " + str(spread.selling_order.symbol))
     print("Buying symbol: " + str(spread.buying_order.symbol))
     print("\n")
     freeze_quantity: int = index_details["freeze_quantity"]
+    plans: Dict[str, ExitPlan] = ExitPlanStore.load(exit_command=exit_command)
+    planned_accounts: List[Account] = []
+    # Slices still to be exited in every account with orders
+    pending: Dict[str, int] = {}
+    pending_lock: threading.Lock = threading.Lock()
+
+    def record_fill(account: Account, b_slice: Slice, s_slice: Slice) -> None:
+        with pending_lock:
+            pending[account.account_id] -= 1
+        if account in planned_accounts:
+            # The exit buys back the selling leg of the entry and sells its buying leg
+            ExitPlanStore.record_fill(exit_command=exit_command, account_id=account.account_id,
+                                      buying_quantity=-s_slice[1], selling_quantity=-b_slice[1])
+
+    def finish() -> None:
+        verify_exit(accounts=planned_accounts, spread=spread)
+        exited: List[str] = [account_id for account_id, left in pending.items() if left == 0]
+        for account_id in sorted(set(pending) - set(exited)):
+            print("Exit not completed for *****" + str(account_id)[-3:] + ", its exit plan is kept\n")
+        ExitPlanStore.clear(exit_command=exit_command, account_ids=exited)
+        if clear_exit_file and len(exited) == len(pending):
+            ExitFile.remove(exit_command=exit_command)
+
+    command_plan: CommandPlan = CommandPlan(command=command, on_fill=record_fill, finish=finish)
     for account in accounts:
-        result: Dict = account.get_total_number_of_spreads_and_symbols()
-        if result is None:
-            continue
-        if (result["buying_symbol"] != spread.selling_order.symbol
-                or result["selling_symbol"] != spread.buying_order.symbol):
-            print("Exit order mismatch with entry order for " + str(account.account_id))
-            continue
+        plan: Optional[ExitPlan] = plans.get(account.account_id)
+        if (plan is not None and plan.buying_symbol == spread.selling_order.symbol
+                and plan.selling_symbol == spread.buying_order.symbol and plan.total_number_of_spreads() > 0):
+            total_number_of_spreads: int = plan.total_number_of_spreads()
+            planned_accounts.append(account)
+        else:
+            result: Optional[Dict] = account.get_total_number_of_spreads_and_symbols()
+            if result is None:
+                continue
+            if (result["buying_symbol"] != spread.selling_order.symbol
+                    or result["selling_symbol"] != spread.buying_order.symbol):
+                print("Exit order mismatch with entry order for " + str(account.account_id))
+                continue
+            total_number_of_spreads: int = result["total_number_of_spreads"]
         account_id: str = str(account.account_id)
         account_id = "*****" + account_id[-3:]
         print("Account ID: " + account_id)
-        account.create_list_of_orders(spread=spread,
-                                      freeze_quantity=freeze_quantity,
-                                      total_number_of_spreads=result["total_number_of_spreads"])
+        command_plan.add_orders(account=account, spread=spread, freeze_quantity=freeze_quantity,
+                                total_number_of_spreads=total_number_of_spreads)
+        pending[account.account_id] = len(command_plan.order_lists[account.account_id])
         print("\n")
-    Execute.place_order(accounts=accounts)
-    exit_file = codecs.open("exit_file.txt", "w")
-    exit_file.write("")
-    exit_file.close()
-    return None
+    return command_plan
+
+
+def verify_exit(accounts: List[Account] = None, spread: Spread = None) -> None:
+    """
+    Verifies in parallel that the exited spread is no longer open in any of the accounts
+
+    Parameters
+    ----------
+    accounts: List[Account], default: None
+        Accounts exited from their exit plan
+    spread: Spread, default: None
+        Reversed spread that was exited
+    """
+    symbols: List[str] = [spread.buying_order.symbol, spread.selling_order.symbol]
+
+    def verify(account: Account) -> None:
+        result: Optional[Dict] = account.get_total_number_of_spreads_and_symbols()
+        if result is None or result["total_number_of_spreads"] == 0:
+            return None
+        if result["buying_symbol"] in symbols or result["selling_symbol"] in symbols:
+            print("Position still open after exit for " + str(account.account_id) + ": "
+                  + str(result["total_number_of_spreads"]) + " spreads\n")
+
+    all_threads: List[threading.Thread] = []
+    for account in accounts:
+        thread: threading.Thread = threading.Thread(target=verify, kwargs={"account": account}, name="")
+        all_threads.append(thread)
+    for thread in all_threads:
+        thread.daemon = False
+        thread.start()
+    for thread in all_threads:
+        thread.join()
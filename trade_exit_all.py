@@ -1,25 +1,54 @@
 from account import Account
-from typing import List, Dict
-# from SmartApi import SmartConnect
-import threading
-from order import Order
-from time import sleep
+from execute import Execute
+from exit_plan import ExitPlanStore, ExitFile
+from history import HistoryStore
 from index import Index
+from order import Order, Slice
+from retry import Retry, RetryExhausted
+from trading_symbols import TradingSymbols
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+import threading
+
+# Legs of one account placed at the same time, the rate budget of the account paces them
+EXIT_ALL_WORKERS: int = 10
 
 
 def trade_exit_all(accounts: List[Account] = None) -> None:
     """
     Exits all existing open positions
 
+    Positions of all accounts are read concurrently. In every account the short legs are bought back first, and the
+    long legs that hedge them are sold only once all shorts of the same underlying are closed, so no account is ever
+    left with a naked short. Each leg is sliced by the freeze quantity of its index, found from its token, and closed
+    with the product type of its position, so an intraday leg is not turned into a carry-forward one. All slices of an
+    account are sent together at the rate the broker allows. Positions are read again at the end and whatever is
+    still open is listed.
+
     Parameters
     ----------
     accounts: List[Account], default=None
         List of all trading accounts
     """
+    open_legs: Dict[str, Optional[List[Dict]]] = read_open_legs(accounts=accounts)
+    total_legs: int = sum(len(legs or []) for legs in open_legs.values())
+    if total_legs == 0:
+        print("No open positions\n")
+        return None
+    print("Exiting " + str(total_legs) + " open legs in "
+          + str(len([legs for legs in open_legs.values() if legs])) + " accounts\n")
+    tag_prefix: str = Execute.new_tag_prefix(command="EXITALL")
+    HistoryStore.record_command(tag_prefix=tag_prefix, command="EXITALL")
+    freeze_quantities: Dict[str, Optional[int]] = {}
     all_threads: List[threading.Thread] = []
     for account in accounts:
+        legs: Optional[List[Dict]] = open_legs.get(account.account_id)
+        if not legs:
+            continue
         thread: threading.Thread = threading.Thread(target=exit_current_of_a_single_account,
-                                                    kwargs={"account": account},
+                                                    kwargs={"account": account, "legs": legs,
+                                                            "tag_prefix": tag_prefix,
+                                                            "freeze_quantities": freeze_quantities},
                                                     name="")
         all_threads.append(thread)
     for thread in all_threads:
@@ -28,25 +57,158 @@ def trade_exit_all(accounts: List[Account] = None) -> None:
     for thread in all_threads:
         thread.join()
 
+    still_open: Dict[str, Optional[List[Dict]]] = read_open_legs(accounts=accounts)
+    for account_id, legs in still_open.items():
+        if legs is None:
+            continue
+        print("Still open for *****" + str(account_id)[-3:] + ": "
+              + ", ".join(leg["tradingsymbol"] + " " + str(leg["netqty"]) for leg in legs))
+    flat_account_ids: List[str] = [account.account_id for account in accounts
+                                   if account.account_id not in still_open]
+    ExitPlanStore.clear(account_ids=flat_account_ids)
+    if still_open:
+        print("\n" + str(len(still_open)) + " accounts still have open positions\n")
+        return None
+    ExitFile.clear()
+    print("All positions exited\n")
+    return None
+
+
+def read_open_legs(accounts: List[Account] = None) -> Dict[str, Optional[List[Dict]]]:
+    """
+    Reads the open positions of all accounts concurrently
+
+    Parameters
+    ----------
+    accounts: List[Account], default: None
+        List of all trading accounts
+
+    Returns
+    -------
+    Dict[str, Optional[List[Dict]]]:
+        Positions with a non zero net quantity keyed by account ID, None if they could not be read. Accounts without
+        any open position are left out
+    """
+    open_legs: Dict[str, Optional[List[Dict]]] = {}
+    lock: threading.Lock = threading.Lock()
+
+    def read(account: Account) -> None:
+        try:
+            position: Optional[List[Dict]] = Retry.call(fn=lambda: account.smartapi.position()["data"],
+                                                        endpoint="position", account_id=account.account_id,
+                                                        label="Position for exit all")
+        except RetryExhausted:
+            print("Positions not read for *****" + str(account.account_id)[-3:] + ", exit it manually\n")
+            with lock:
+                open_legs[account.account_id] = None
+            return None
+        legs: List[Dict] = [single_position for single_position in position or []
+                            if int(single_position["netqty"]) != 0]
+        if legs:
+            with lock:
+                open_legs[account.account_id] = legs
+
+    all_threads: List[threading.Thread] = []
+    for account in accounts:
+        thread: threading.Thread = threading.Thread(target=read, kwargs={"account": account}, name="")
+        all_threads.append(thread)
+    for thread in all_threads:
+        thread.daemon = False
+        thread.start()
+    for thread in all_threads:
+        thread.join()
+
+    return open_legs
+
+
+def exit_current_of_a_single_account(account: Account = None, legs: List[Dict] = None, tag_prefix: str = None,
+                                     freeze_quantities: Dict[str, Optional[int]] = None) -> None:
+    """
+    Closes the open legs of one account, short legs first
+
+    Parameters
+    ----------
+    account: Account, default: None
+        Account to exit
+    legs: List[Dict], default: None
+        Open positions of the account as returned by the broker
+    tag_prefix: str, default: None
+        Prefix of the order tags of the exit
+    freeze_quantities: Dict[str, Optional[int]], default: None
+        Freeze quantity of every index already looked up, shared by all accounts
+    """
+    masked: str = "*****" + str(account.account_id)[-3:]
+    shorts: List[Tuple[str, str, List[Slice]]] = []
+    longs: List[Tuple[str, str, List[Slice]]] = []
+    # Underlyings with a short leg that is not closed
+    kept: Set[str] = set()
+    for leg in legs:
+        underlying, slices = _slices(leg=leg, freeze_quantities=freeze_quantities)
+        if not slices:
+            print(leg["tradingsymbol"] + " is not an F&O leg of a known index, exit it manually for " + masked + "\n")
+            if int(leg["netqty"]) < 0:
+                kept.add(underlying)
+            continue
+        producttype: str = str(leg.get("producttype") or Order.producttype)
+        if int(leg["netqty"]) < 0:
+            shorts.append((underlying, producttype, slices))
+        else:
+            longs.append((underlying, producttype, slices))
+
+    kept |= _close(account=account, legs=shorts, tag_prefix=tag_prefix, first_position=0)
+    # Hedges stay in place while a short of the same underlying is open
+    hedges: List[Tuple[str, str, List[Slice]]] = [(underlying, producttype, slices)
+                                                  for underlying, producttype, slices in longs
+                                                  if underlying not in kept]
+    if len(hedges) < len(longs):
+        print("Long legs of " + ", ".join(sorted(kept)) + " kept as hedges for " + masked
+              + ", short legs are still open\n")
+    _close(account=account, legs=hedges, tag_prefix=tag_prefix,
+           first_position=sum(len(slices) for _, _, slices in shorts))
+    print("All orders placed for " + str(account.account_name)[:3] + "*****\n")
+
+
+def _slices(leg: Dict = None, freeze_quantities: Dict[str, Optional[int]] = None) -> Tuple[str, List[Slice]]:
+    token: str = str(leg["symboltoken"])
+    instrument: Optional[Tuple[str, str]] = TradingSymbols.get_instrument(token=token)
+    underlying: str = instrument[1] if instrument is not None else str(leg.get("symbolname", ""))
+    if underlying not in freeze_quantities:
+        freeze_quantities[underlying] = Index.get_details(index=underlying).get("freeze_quantity")
+    freeze_quantity: Optional[int] = freeze_quantities[underlying]
+    if not freeze_quantity or leg.get("exchange", Order.exchange) != Order.exchange:
+        return underlying, []
+    quantity: int = abs(int(leg["netqty"]))
+    order: Order = Order(quantity=quantity, symbol=leg["tradingsymbol"], token=token,
+                         tradetype="BUY" if int(leg["netqty"]) < 0 else "SELL")
+    slices: List[Slice] = [(order, freeze_quantity)] * (quantity // freeze_quantity)
+    if quantity % freeze_quantity:
+        slices.append((order, quantity % freeze_quantity))
+    return underlying, slices
+
+
+def _close(account: Account = None, legs: List[Tuple[str, str, List[Slice]]] = None, tag_prefix: str = None,
+           first_position: int = None) -> Set[str]:
+    """
+    Places all slices of the given legs together and returns the underlyings with a slice not completed
+    """
+    placements: List[Tuple[str, Slice, Dict]] = []
+    for underlying, producttype, slices in legs:
+        for order, quantity in slices:
+            leg_tag: str = "buy" if order.tradetype == "BUY" else "sell"
+            tag: str = Execute.order_tag(tag_prefix=tag_prefix, position=first_position + len(placements),
+                                         leg=leg_tag)
+            payload: Dict = dict(order.to_payload(quantity=quantity, tag=tag), producttype=producttype)
+            placements.append((underlying, (order, quantity), payload))
+    if not placements:
+        return set()
+
+    def place(placement: Tuple[str, Slice, Dict]) -> Optional[str]:
+        underlying, (order, quantity), payload = placement
+        status, _ = Execute.place_leg(order=order, account=account, quantity=quantity, payload=payload,
+                                      tag=payload["ordertag"])
+        return None if status == "complete" else underlying
+
+    with ThreadPoolExecutor(max_workers=EXIT_ALL_WORKERS) as pool:
+        failed: Set[str] = {underlying for underlying in pool.map(place, placements) if underlying is not None}
 
-def exit_current_of_a_single_account(account: Account = None) -> None:
-    positions_details: List[Dict] = account.get_current_positions()
-    # smartapi: SmartConnect = account.smartapi
-    for position in positions_details:
-        # if position is closed and position["quantity"] > 0
-        if True:
-            quantity: int = int(position["quantity"])
-            index: str = ""
-            index_details: Dict = Index.get_details(index=index)
-            freeze_quantity: int = index_details["freeze_quantity"]
-            symbol: str = ""
-            token: str = ""
-            tradetype: str = ""
-            while quantity > 0:
-                _: Order = Order(quantity=min(freeze_quantity, quantity),
-                                 symbol=symbol,
-                                 token=token,
-                                 tradetype=tradetype)
-                # smartapi.placeOrderFullResponse(order)
-                quantity = quantity - freeze_quantity
-                sleep(1)
+    return failed
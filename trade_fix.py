@@ -0,0 +1,123 @@
+from account import Account
+from command_plan import CommandPlan
+from reconciliation import Reconciler, Reconciliation, Discrepancy
+from exit_plan import ExitPlanStore, ExitFile
+from execute import Execute
+from basket import Basket
+from spread import Spread
+from order import Slice
+from trade_basket import closed_basket
+from typing import Dict, List, Optional, Tuple
+import threading
+
+# Difference corrected by every slice FIX placed, kept across FIX commands so a FIX of a FIX completes the slice of
+# the original command, and the slices of each difference not completed yet, both keyed by id
+fixed_by: Dict[int, Tuple[Tuple[Slice, ...], Discrepancy]] = {}
+fixes_left: Dict[int, int] = {}
+fix_lock: threading.Lock = threading.Lock()
+
+
+def trade_fix(command: str = None) -> None:
+    """
+    Places the orders suggested by the last reconciliation, all accounts together
+
+    The fix is reconciled as any other command, so FIX can be run again for whatever it could not place. Once all
+    corrections of a slice are filled, the slice is recorded in the exit plan of its trade as its own command would
+    have: the spreads of an ENTRY or EXIT, or the baskets of a BASKET, so the trade is exited with EXIT as usual and
+    the plans of other trades are left as they are. Corrections of an over-fill only remove what the plan never
+    counted, so they are not recorded. A reconciliation is refused once any order was sent after it, such as by
+    EXITALL or an exit rule, as its suggested orders could re-open positions just closed.
+
+    Sample commands:
+        FIX
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    """
+    if command.strip() != "FIX":
+        print("Wrong command\n")
+        return None
+    reconciliation: Optional[Reconciliation] = Reconciler.last()
+    if reconciliation is None:
+        print("No command reconciled yet\n")
+        return None
+    if reconciliation.is_stale():
+        print("Orders were sent after the last reconciliation, its suggested orders are not placed\n")
+        return None
+    plan: Optional[CommandPlan] = Reconciler.fix_plan(reconciliation=reconciliation, on_fill=_fixed)
+    if plan is None:
+        print("No suggested orders\n")
+        return None
+    with fix_lock:
+        for discrepancy in reconciliation.discrepancies:
+            if not discrepancy.fixes or discrepancy.kind == "over-fill":
+                continue
+            fixes_left[id(discrepancy)] = len(discrepancy.fixes)
+            for fix in discrepancy.fixes:
+                fixed_by[id(fix[0])] = (fix, discrepancy)
+    print("Placing " + str(plan.total_orders()) + " slices in " + str(len(plan.accounts)) + " accounts\n")
+    plan.execute()
+    Reconciler.reconcile(plans=[plan])
+    return None
+
+
+def _fixed(account: Account, *slices: Slice) -> None:
+    # A completed slice of FIX, the difference it corrects is recorded once all its slices are completed
+    with fix_lock:
+        fixed: Optional[Tuple[Tuple[Slice, ...], Discrepancy]] = fixed_by.get(id(slices[0]))
+    if fixed is not None:
+        _complete(discrepancy=fixed[1])
+
+
+def _complete(discrepancy: Discrepancy = None) -> None:
+    with fix_lock:
+        left: Optional[int] = fixes_left.get(id(discrepancy))
+        if left is None:
+            return None
+        if left > 1:
+            fixes_left[id(discrepancy)] = left - 1
+            return None
+        fixes_left.pop(id(discrepancy))
+        parent: Optional[Tuple[Tuple[Slice, ...], Discrepancy]] = fixed_by.get(id(discrepancy.slices[0]))
+    if discrepancy.command == "FIX":
+        # The slice of the earlier FIX is now complete
+        if parent is not None:
+            _complete(discrepancy=parent[1])
+        return None
+    _record(discrepancy=discrepancy)
+
+
+def _record(discrepancy: Discrepancy = None) -> None:
+    # Records the completed slice in the exit plan of its trade, as the fill of its own command would have
+    parts: List[str] = discrepancy.command.split()
+    if len(parts) < 4 or parts[0] not in ("ENTRY", "EXIT", "BASKET"):
+        return None
+    slices: Tuple[Slice, ...] = discrepancy.slices
+    if Execute.is_spread(slices=slices) and parts[2][:1] not in ("+", "-"):
+        exit_command: str = "EXIT " + " ".join(parts[1:4])
+        if parts[0] == "EXIT":
+            ExitPlanStore.record_fill(exit_command=exit_command, account_id=discrepancy.account_id,
+                                      buying_quantity=-slices[1][1], selling_quantity=-slices[0][1])
+            return None
+        if discrepancy.account_id not in ExitPlanStore.load(exit_command=exit_command):
+            spread: Spread = Spread()
+            spread.buying_order, spread.selling_order = slices[0][0], slices[1][0]
+            ExitPlanStore.start(exit_command=exit_command, account_id=discrepancy.account_id, spread=spread)
+        ExitPlanStore.record_fill(exit_command=exit_command, account_id=discrepancy.account_id,
+                                  buying_quantity=slices[0][1], selling_quantity=slices[1][1])
+        return None
+    basket: Basket = Basket()
+    basket.create_basket(index=parts[1], legs=parts[2], expiry=parts[3])
+    if not basket.legs:
+        return None
+    closed: Optional[str] = closed_basket(basket=basket) if parts[0] == "BASKET" else None
+    exit_command = closed or basket.exit_command()
+    lots: int = slices[0][1] // slices[0][0].qty
+    closing: bool = parts[0] == "EXIT" or closed is not None
+    ExitPlanStore.record_lots(exit_command=exit_command, account_id=discrepancy.account_id,
+                              lots=-lots if closing else lots)
+    if not closing and exit_command not in ExitFile.commands():
+        ExitFile.add(exit_command=exit_command)
+    return None
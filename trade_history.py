@@ -0,0 +1,157 @@
+from account import Account
+from history import HistoryStore, days_ago
+from typing import Dict, List, Optional, Tuple
+from datetime import date, datetime
+
+# Points of a P&L curve printed at most
+CURVE_POINTS: int = 40
+
+
+def trade_history(command: str = None, my_account: Account = None) -> None:
+    """
+    Queries the local trade history
+
+    PNL prints the P&L curve of an account on a day, the primary account and today by default. SLIPPAGE compares the
+    average fill price of every account with the primary account, per command, symbol and side. LATENCY prints the
+    fill latency of every day, over the last 7 days by default.
+
+    Sample commands:
+        HISTORY PNL [<account id>] [<YYYY-MM-DD>]
+        HISTORY SLIPPAGE [<YYYY-MM-DD>]
+        HISTORY LATENCY [<days>]
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    my_account: Account, default: None
+        My primary trading account
+    """
+    parts: List[str] = command.split()
+    if len(parts) < 2:
+        print("Wrong command\n")
+        return None
+    arguments: List[str] = parts[2:]
+    if parts[1] == "PNL" and len(arguments) <= 2:
+        day: str = date.today().isoformat()
+        account_id: str = my_account.account_id
+        for argument in arguments:
+            if _is_day(text=argument):
+                day = argument
+            else:
+                account_id = argument
+        pnl_curve(account_id=account_id, day=day)
+    elif parts[1] == "SLIPPAGE" and len(arguments) <= 1:
+        day = arguments[0] if arguments else date.today().isoformat()
+        if not _is_day(text=day):
+            print("Wrong command\n")
+            return None
+        slippage(my_account=my_account, day=day)
+    elif parts[1] == "LATENCY" and len(arguments) <= 1:
+        if arguments and not arguments[0].isdigit():
+            print("Wrong command\n")
+            return None
+        latency(days=int(arguments[0]) if arguments else 7)
+    else:
+        print("Wrong command\n")
+    return None
+
+
+def pnl_curve(account_id: str = None, day: str = None) -> None:
+    """
+    Prints the P&L curve of an account on a day
+
+    Parameters
+    ----------
+    account_id: str, default: None
+        Account ID of the account
+    day: str, default: None
+        Day as YYYY-MM-DD
+    """
+    points: List[Tuple[float, float, float, float]] = HistoryStore.pnl_curve(account_id=account_id, day=day)
+    if not points:
+        print("No P&L recorded for *****" + str(account_id)[-3:] + " on " + day + "\n")
+        return None
+    step: int = max(1, -(-len(points) // CURVE_POINTS))
+    shown: List[Tuple[float, float, float, float]] = points[::step]
+    if shown[-1] is not points[-1]:
+        shown.append(points[-1])
+    print("P&L of *****" + str(account_id)[-3:] + " on " + day)
+    print("Time\t\tRealised\tUnrealised\tTotal")
+    for at, realised, unrealised, total in shown:
+        print(datetime.fromtimestamp(at).strftime("%H:%M:%S") + "\t" + str(round(realised, 2)) + "\t\t"
+              + str(round(unrealised, 2)) + "\t\t" + str(round(total, 2)))
+    print("\n")
+    return None
+
+
+def slippage(my_account: Account = None, day: str = None) -> None:
+    """
+    Prints how much worse every account filled than the primary account on a day
+
+    Slippage is the difference between the average prices of an account and of the primary account for the same
+    command, symbol and side, positive when the account paid more on a buy or got less on a sell, in rupees over the
+    filled quantity.
+
+    Parameters
+    ----------
+    my_account: Account, default: None
+        My primary trading account
+    day: str, default: None
+        Day as YYYY-MM-DD
+    """
+    fills: List[Tuple[str, str, str, str, str, float, int]] = HistoryStore.fill_prices(day=day)
+    primary: Dict[Tuple[str, str, str], float] = {(tag_prefix, symbol, tradetype): price
+                                                  for tag_prefix, _, account_id, symbol, tradetype, price, _ in fills
+                                                  if account_id == my_account.account_id}
+    commands: Dict[str, str] = {}
+    # (tag prefix, account ID) -> rupees lost against the primary account
+    slipped: Dict[Tuple[str, str], float] = {}
+    for tag_prefix, command, account_id, symbol, tradetype, price, quantity in fills:
+        primary_price: Optional[float] = primary.get((tag_prefix, symbol, tradetype))
+        if account_id == my_account.account_id or primary_price is None:
+            continue
+        commands[tag_prefix] = command
+        difference: float = price - primary_price if tradetype == "BUY" else primary_price - price
+        slipped[(tag_prefix, account_id)] = slipped.get((tag_prefix, account_id), 0.0) + difference * quantity
+    if not slipped:
+        print("No fills to compare on " + day + "\n")
+        return None
+    print("Slippage against *****" + str(my_account.account_id)[-3:] + " on " + day)
+    for (tag_prefix, account_id), amount in slipped.items():
+        print(commands[tag_prefix] + "\t*****" + str(account_id)[-3:] + "\tRs " + str(round(amount, 2)))
+    print("\n")
+    return None
+
+
+def latency(days: int = None) -> None:
+    """
+    Prints the fill latency of every day
+
+    Parameters
+    ----------
+    days: int, default: None
+        Number of past days to include besides today
+    """
+    latencies_by_day: Dict[str, List[float]] = {}
+    for day, seconds in HistoryStore.fill_latencies(since=days_ago(days=days)):
+        latencies_by_day.setdefault(day, []).append(seconds)
+    if not latencies_by_day:
+        print("No fills recorded in the last " + str(days) + " days\n")
+        return None
+    print("Day\t\tOrders\tAverage\tp95\tMax")
+    for day, latencies in latencies_by_day.items():
+        latencies.sort()
+        p95: float = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(day + "\t" + str(len(latencies)) + "\t" + str(round(sum(latencies) / len(latencies), 3)) + "s\t"
+              + str(round(p95, 3)) + "s\t" + str(round(latencies[-1], 3)) + "s")
+    print("\n")
+    return None
+
+
+def _is_day(text: str = None) -> bool:
+    try:
+        datetime.strptime(text, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
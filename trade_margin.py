@@ -0,0 +1,91 @@
+from account import Account
+from spread import Spread
+from margin import MarginService
+from jobs import Job, JobManager
+from typing import List, Optional
+
+refresh_job: Optional[Job] = None
+
+
+def trade_margin(command: str = None, my_account: Account = None, jobs: JobManager = None) -> None:
+    """
+    Quotes the margin of candidate spreads and manages the strikes kept warm
+
+    Several strikes separated by commas are quoted in parallel. Watched strikes are quoted again in the background by
+    a job, so ENTRY on them usually needs no margin call.
+
+    Sample commands:
+        MARGIN
+        MARGIN <index> <strike>,<strike>,... <expiry>
+        MARGIN WATCH <index> <strike> <expiry>
+        MARGIN UNWATCH <index> <strike> <expiry>
+        MARGIN NIFTY 22000PE,21900PE,21800PE 25APR24
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    my_account: Account, default: None
+        My primary trading account
+    jobs: JobManager, default: None
+        Job manager running the refresh
+    """
+    global refresh_job
+    parts: List[str] = command.split()
+    if len(parts) == 1:
+        watching: List[Spread] = MarginService.watching()
+        if not watching:
+            print("No strikes watched\n")
+            return None
+        for spread in watching:
+            print(spread.selling_order.symbol + "\tRs " + str(spread.margin_per_lot))
+        print("\n")
+        return None
+    if parts[1] in ("WATCH", "UNWATCH"):
+        if len(parts) != 5:
+            print("Wrong command\n")
+            return None
+        spread: Optional[Spread] = _spread(index=parts[2], strike=parts[3], expiry=parts[4])
+        if spread is None:
+            return None
+        if parts[1] == "UNWATCH":
+            if not MarginService.unwatch(spread=spread):
+                print("Strike is not watched\n")
+                return None
+            if not MarginService.watching() and refresh_job is not None:
+                jobs.stop(job_id=refresh_job.job_id)
+            print("Stopped watching " + spread.selling_order.symbol + "\n")
+            return None
+        MarginService.watch(spread=spread)
+        if refresh_job is None:
+            def finished(job: Job) -> None:
+                global refresh_job
+                refresh_job = None
+
+            refresh_job = jobs.start(name="MARGIN REFRESH", target=MarginService.refresh,
+                                     kwargs={"account": my_account}, on_exit=finished)
+        print("Watching " + spread.selling_order.symbol + "\n")
+        return None
+    if len(parts) != 4:
+        print("Wrong command\n")
+        return None
+    spreads: List[Spread] = []
+    for strike in parts[2].split(','):
+        spread: Optional[Spread] = _spread(index=parts[1], strike=strike, expiry=parts[3])
+        if spread is None:
+            return None
+        spreads.append(spread)
+    margins: List[Optional[float]] = MarginService.get_many(spreads=spreads, account=my_account)
+    for spread, margin_per_lot in zip(spreads, margins):
+        print(spread.selling_order.symbol + "\tRs " + str(margin_per_lot))
+    print("\n")
+    return None
+
+
+def _spread(index: str = None, strike: str = None, expiry: str = None) -> Optional[Spread]:
+    spread: Spread = Spread()
+    spread.create_spread(command=index + " " + strike, expiry=expiry)
+    if spread.buying_order is None or spread.selling_order is None:
+        print("Wrong strike " + strike + "\n")
+        return None
+    return spread
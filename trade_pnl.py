@@ -1,40 +1,24 @@
 from account import Account
+from book import Book, BookPoller
+from dashboard import monitor
 from typing import List
-from time import sleep
-import os
+import threading
 
 
-def pnl(accounts: List[Account] = None) -> None:
+def pnl(accounts: List[Account] = None, book: Book = None, poller: BookPoller = None,
+        stop_event: threading.Event = None) -> None:
     """
-    Prints p&l of a trade across all accounts
+    Shows p&l of a trade across all accounts until stopped
 
     Parameters
     ----------
     accounts: List[Account], default: None
         List of accounts to trade
+    book: Book, default: None
+        Shared P&L state
+    poller: BookPoller, default: None
+        Poller keeping the book fresh
+    stop_event: threading.Event, default: None
+        Set to stop showing p&l
     """
-    while True:
-        total_realised: float = 0.0
-        total_unrealised: float = 0.0
-        total_pnl: float = 0.0
-        pnl_string_list: List[str] = []
-        pnl_string: str = "Account ID\t\t\tRealised\t\t\tUnrealised\t\t\tCurrent P&L\n"
-        pnl_string_list.append(pnl_string)
-        for account in accounts:
-            realised, unrealised, current_pnl = account.get_pnl()
-            total_realised += realised
-            total_unrealised += unrealised
-            total_pnl += current_pnl
-            account_id: str = account.account_id
-            account_id = "*****" + account_id[-3:]
-            pnl_string = (account_id + "\t\t\t" + str(realised) + "\t\t\t\t" + str(unrealised)
-                          + "\t\t\t\t" + str(current_pnl) + "\n")
-            pnl_string_list.append(pnl_string)
-        sleep(1)
-        os.system("clear")
-        print("Total realised: Rs " + str(total_realised))
-        print("Total unrealised: Rs " + str(total_unrealised))
-        print("Total p&l: Rs " + str(total_pnl))
-        print("\n")
-        for pnl_string in pnl_string_list:
-            print(pnl_string)
+    monitor(accounts=accounts, book=book, poller=poller, stop_event=stop_event)
@@ -0,0 +1,84 @@
+from trading_symbols import TradingSymbols
+from market_data import MarketDataHub, Quote
+from index import Index
+from strike_selection import StrikeSelector
+from typing import List, Optional, Tuple
+from time import time
+
+# Seconds QUOTE waits for the first tick of a strike just subscribed
+QUOTE_WAIT: float = 2.0
+
+
+def trade_quote(command: str = None, hub: MarketDataHub = None) -> None:
+    """
+    Prints live quotes of strikes and keeps them subscribed
+
+    Strikes stay subscribed on the market-data hub once quoted, so QUOTE alone prints all of them from the cache
+    without waiting for the broker. Strikes and expiries can be relative, as in ENTRY, which also keeps the option
+    chain around the future subscribed for the entries that follow.
+
+    Sample commands:
+        QUOTE
+        QUOTE <index> <strike>,<strike>,... <expiry>
+        QUOTE NIFTY 22000PE,21900PE 25APR24
+        QUOTE NIFTY ATM-2PE,ATM+2CE NEAREST
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    hub: MarketDataHub, default: None
+        Market-data hub of the session
+    """
+    parts: List[str] = command.split()
+    if len(parts) == 1:
+        tokens: List[str] = hub.tokens()
+        if not tokens:
+            print("No strikes subscribed\n")
+            return None
+        _print_quotes(hub=hub, rows=[(_symbol(token=token), token) for token in tokens], wait=0.0)
+        return None
+    if len(parts) != 4:
+        print("Wrong command\n")
+        return None
+    if Index.get_details(index=parts[1]) == {}:
+        print("Index is wrong or not provided\n")
+        return None
+    rows: List[Tuple[str, str]] = []
+    for strike in parts[2].split(','):
+        expiry: str = parts[3]
+        if StrikeSelector.is_relative(strike=strike, expiry=expiry):
+            selection: Optional[Tuple[str, str]] = StrikeSelector.resolve(index=parts[1], strike=strike,
+                                                                          expiry=expiry, hub=hub)
+            if selection is None:
+                return None
+            strike, expiry = selection
+        symbol: str = parts[1] + expiry + strike[:-2] + strike[-2:].upper()
+        token: Optional[str] = TradingSymbols.get_token(symbol=symbol)
+        if token is None:
+            print("Token of " + symbol + " not found\n")
+            return None
+        rows.append((symbol, str(token)))
+    for symbol, token in rows:
+        if token not in hub.tokens():
+            hub.subscribe(token=token)
+    _print_quotes(hub=hub, rows=rows, wait=QUOTE_WAIT)
+    return None
+
+
+def _print_quotes(hub: MarketDataHub = None, rows: List[Tuple[str, str]] = None, wait: float = None) -> None:
+    deadline: float = time() + wait
+    print("Symbol\t\t\tLTP\tBid\tAsk\tAge")
+    for symbol, token in rows:
+        quote: Optional[Quote] = hub.wait(token=token, timeout=max(0.0, deadline - time()))
+        if quote is None:
+            print(symbol + "\tno ticks yet")
+            continue
+        ltp, bid, ask, at = quote
+        print(symbol + "\t" + str(ltp) + "\t" + str(bid) + "\t" + str(ask) + "\t" + str(round(time() - at, 1)) + "s")
+    print("\n")
+
+
+def _symbol(token: str = None) -> str:
+    instrument: Optional[Tuple[str, str]] = TradingSymbols.get_instrument(token=token)
+    return instrument[0] if instrument is not None else token
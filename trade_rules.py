@@ -0,0 +1,115 @@
+from account import Account
+from exit_rules import (ExitScheduler, Rule, TrailingStopRule, AccountMaxLossRule, SpreadStopRule,
+                        TimeExitRule)
+from spread import Spread
+from exit_plan import ExitFile
+from jobs import today_at
+from typing import List, Optional
+from datetime import datetime
+
+
+def trade_rules(command: str = None, accounts: List[Account] = None, my_account: Account = None,
+                scheduler: ExitScheduler = None) -> None:
+    """
+    Adds, removes and lists exit rules
+
+    Sample commands:
+        RULES
+        RULE DEL <id>
+        RULE TRAIL=<amount>
+        RULE MAXLOSS=<amount>
+        RULE TIME=<HH:MM>
+        RULE SPREADSL=<amount> <index> <strike> <expiry>
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Account, default: None
+        My primary trading account
+    scheduler: ExitScheduler, default: None
+        Exit scheduler holding the rules
+    """
+    parts: List[str] = command.split()
+    if parts[0] == "RULES":
+        rules: List[Rule] = scheduler.rules()
+        if not rules:
+            print("No active rules\n")
+            return None
+        for rule in rules:
+            print(str(rule.rule_id) + "\t" + rule.describe())
+        print("\n")
+        return None
+    if len(parts) < 2:
+        print("Incomplete command\n")
+        return None
+    if parts[1] == "DEL":
+        if len(parts) != 3 or not parts[2].isdigit():
+            print("Wrong command\n")
+            return None
+        if scheduler.remove(rule_id=int(parts[2])):
+            print("Rule " + parts[2] + " removed\n")
+        else:
+            print("No rule " + parts[2] + "\n")
+        return None
+    key, _, value = parts[1].partition('=')
+    try:
+        amount: float = float(value) if key != "TIME" else 0.0
+    except ValueError:
+        print("Wrong value for " + key + "\n")
+        return None
+    if key == "SPREADSL":
+        if len(parts) != 5:
+            print("Incomplete command\n")
+            return None
+        spread: Spread = Spread()
+        spread.create_spread(command=parts[2] + " " + parts[3], expiry=parts[4])
+        if spread.buying_order is None or spread.selling_order is None:
+            print("Wrong spread\n")
+            return None
+        rule_id: int = scheduler.add(rule=SpreadStopRule(sl=amount,
+                                                         symbols=(spread.buying_order.symbol,
+                                                                  spread.selling_order.symbol),
+                                                         watch_account_id=my_account.account_id,
+                                                         exit_commands=["EXIT " + " ".join(parts[2:5])]))
+        print("Rule " + str(rule_id) + " added\n")
+        return None
+    exit_commands: List[str] = ExitFile.commands()
+    if not exit_commands:
+        print("No exit command specified\n")
+        return None
+    if key == "TRAIL":
+        if amount <= 0:
+            print("Trail should be positive\n")
+            return None
+        rule_id: int = scheduler.add(rule=TrailingStopRule(trail=amount,
+                                                           watch_account_id=my_account.account_id,
+                                                           exit_commands=exit_commands))
+        print("Rule " + str(rule_id) + " added\n")
+    elif key == "MAXLOSS":
+        if amount <= 0:
+            print("Max loss should be positive\n")
+            return None
+        rule_ids: List[str] = []
+        for account in accounts:
+            rule_ids.append(str(scheduler.add(rule=AccountMaxLossRule(max_loss=amount,
+                                                                      watch_account_id=account.account_id,
+                                                                      exit_commands=exit_commands,
+                                                                      scope_account_id=account.account_id))))
+        print("Rules " + ", ".join(rule_ids) + " added\n")
+    elif key == "TIME":
+        at: Optional[datetime] = today_at(value=value)
+        if at is None:
+            print("Time should be HH:MM\n")
+            return None
+        if at <= datetime.now():
+            print(value + " is already past today, rule not added\n")
+            return None
+        rule_id: int = scheduler.add(rule=TimeExitRule(at=at.timestamp(), label=value, exit_commands=exit_commands))
+        print("Rule " + str(rule_id) + " added\n")
+    else:
+        print("Wrong command\n")
+    return None
+
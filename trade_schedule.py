@@ -0,0 +1,109 @@
+from account import Account
+from command_plan import CommandPlan
+from reconciliation import Reconciler
+from jobs import JobManager, today_at
+from trade_entry import plan_entry
+from spread import Spread
+from index import Index
+from margin import MarginService
+from strike_selection import StrikeSelector
+from typing import List, Optional
+from datetime import datetime
+from time import time
+import threading
+
+# The last moments before the target are spent spinning, sleeping is not precise enough
+SPIN_SECONDS: float = 0.05
+# Seconds before the target the entry is planned, enough to refresh balances, quote the margin and stage the requests
+PLAN_LEAD: float = 5.0
+
+
+def trade_schedule(command: str = None, accounts: List[Account] = None, my_account: Account = None,
+                   jobs: JobManager = None) -> None:
+    """
+    Schedules an entry at an exact time of the day
+
+    The command is checked and the margin quote warmed right away. A job then waits until PLAN_LEAD seconds before the
+    target time, plans the entry on the balances and prices of that moment and builds the request payloads, and only
+    sends the requests at the target time. Once done, it prints how far the first order missed the target. Nothing is
+    written before the entry is planned, so a cancelled entry leaves nothing behind.
+
+    Sample commands:
+        SCHEDULE <HH:MM:SS> ENTRY <index> <strike> <expiry>
+        SCHEDULE 09:15:00 ENTRY NIFTY 22000PE 25APR24
+        SCHEDULE 09:20:00 ENTRY NIFTY ATM-2PE NEAREST
+
+    Parameters
+    ----------
+    command: str, default: None
+        The command
+    accounts: List[Account], default: None
+        List of accounts to trade
+    my_account: Account, default: None
+        My primary trading account
+    jobs: JobManager, default: None
+        Job manager running the scheduled entry
+    """
+    parts: List[str] = command.split(' ', 2)
+    if len(parts) != 3 or parts[2].split(' ')[0] != "ENTRY":
+        print("Wrong command\n")
+        return None
+    at: Optional[datetime] = today_at(value=parts[1])
+    if at is None:
+        print("Time should be HH:MM, HH:MM:SS or HH:MM:SS.ffffff\n")
+        return None
+    target: float = at.timestamp()
+    if target <= time():
+        print("Scheduled time has already passed\n")
+        return None
+    if not _warm(command=parts[2], my_account=my_account):
+        return None
+
+    def run(stop_event: threading.Event = None) -> None:
+        if stop_event.wait(timeout=max(0.0, target - time() - PLAN_LEAD)):
+            print("Scheduled entry cancelled: " + parts[2] + "\n")
+            return None
+        plan: Optional[CommandPlan] = plan_entry(command=parts[2], accounts=accounts, my_account=my_account)
+        if plan is None:
+            print("Scheduled entry not placed: " + parts[2] + "\n")
+            return None
+        plan.stage()
+        print(str(plan.total_orders()) + " slices staged for " + parts[1] + ": " + plan.command + "\n")
+        if stop_event.wait(timeout=max(0.0, target - time() - SPIN_SECONDS)):
+            print("Scheduled entry cancelled: " + plan.command + "\n")
+            return None
+        while time() < target:
+            pass
+        plan.execute()
+        if plan.first_sent_at is None:
+            print("Scheduled entry sent no order: " + plan.command + "\n")
+            return None
+        print("Scheduled entry done: " + plan.command)
+        print("First order sent " + str(round((plan.first_sent_at - target) * 1000, 3)) + " ms after target")
+        print("\n")
+        Reconciler.reconcile(plans=[plan])
+        return None
+
+    job = jobs.start(name=command, target=run)
+    print("Entry scheduled as job " + str(job.job_id) + ", planned " + str(PLAN_LEAD) + "s before " + parts[1] + "\n")
+    return None
+
+
+def _warm(command: str = None, my_account: Account = None) -> bool:
+    # Checks the entry and quotes its margin, a relative strike is only known once the entry is planned
+    entry: List[str] = command.split(' ')
+    if len(entry) != 4:
+        print("Incomplete command\n")
+        return False
+    if Index.get_details(index=entry[1]) == {}:
+        print("Index is wrong or not provided\n")
+        return False
+    if StrikeSelector.is_relative(strike=entry[2], expiry=entry[3]):
+        return True
+    spread: Spread = Spread()
+    spread.create_spread(command=entry[1] + " " + entry[2], expiry=entry[3])
+    if spread.buying_order is None or spread.selling_order is None:
+        print("Wrong trade command\n")
+        return False
+    MarginService.get(spread=spread, account=my_account)
+    return True
@@ -1,7 +1,16 @@
+from typing import Optional, Dict, List, Tuple
+from datetime import date, datetime
 import json
-from typing import Optional, Dict
 
 symbol_map: Dict = {}
+# Token -> (symbol, underlying name), to find the index of a position
+token_map: Dict[str, Tuple[str, str]] = {}
+# (underlying name, expiry as written in symbols) -> strike -> CE or PE -> token
+chain_map: Dict[Tuple[str, str], Dict[int, Dict[str, str]]] = {}
+# Underlying name -> expiry date -> expiry as written in symbols
+expiry_map: Dict[str, Dict[date, str]] = {}
+# Underlying name -> expiry date -> token of the index future
+future_map: Dict[str, Dict[date, str]] = {}
 
 
 class TradingSymbols:
@@ -17,6 +26,14 @@ class TradingSymbols:
         Initializes the symbol map
     get_token(symbol: str = None) -> Optional[str]:
         Returns token for a given symbol
+    get_instrument(token: str = None) -> Optional[Tuple[str, str]]:
+        Returns symbol and underlying name of a given token
+    expiries(index: str = None) -> List[str]:
+        Returns the option expiries of an index not over yet, nearest first
+    option_chain(index: str = None, expiry: str = None) -> Dict[int, Dict[str, str]]:
+        Returns the tokens of all strikes of an expiry
+    future_token(index: str = None) -> Optional[str]:
+        Returns the token of the nearest future of an index
     """
 
     @staticmethod
@@ -34,6 +51,8 @@ class TradingSymbols:
             curr_row = dict(row)
             symbol = curr_row["symbol"]
             symbol_map[symbol] = curr_row["token"]
+            token_map[str(curr_row["token"])] = (symbol, str(curr_row.get("name", "")))
+            _add_to_chain(row=curr_row)
         symbol_file.close()
 
         return None
@@ -57,3 +76,101 @@ class TradingSymbols:
             return symbol_map[symbol]
 
         return None
+
+    @staticmethod
+    def get_instrument(token: str = None) -> Optional[Tuple[str, str]]:
+        """
+        Returns symbol and underlying name of a given token
+
+        Parameters
+        ----------
+        token : str
+            The token for which the instrument is required
+
+        Returns
+        -------
+        Optional[Tuple[str, str]]:
+            Symbol and underlying name, such as NIFTY, of the token
+        """
+        return token_map.get(str(token))
+
+    @staticmethod
+    def expiries(index: str = None) -> List[str]:
+        """
+        Returns the option expiries of an index not over yet, nearest first
+
+        Parameters
+        ----------
+        index : str
+            Index, such as NIFTY
+
+        Returns
+        -------
+        List[str]:
+            Expiries as written in symbols, such as 25APR24
+        """
+        today: date = date.today()
+        return [expiry for day, expiry in sorted(expiry_map.get(index, {}).items()) if day >= today]
+
+    @staticmethod
+    def option_chain(index: str = None, expiry: str = None) -> Dict[int, Dict[str, str]]:
+        """
+        Returns the tokens of all strikes of an expiry
+
+        Parameters
+        ----------
+        index : str
+            Index, such as NIFTY
+        expiry : str
+            Expiry as written in symbols, such as 25APR24
+
+        Returns
+        -------
+        Dict[int, Dict[str, str]]:
+            Strike -> CE or PE -> token, empty if the expiry is not in tokens.json
+        """
+        return chain_map.get((index, expiry), {})
+
+    @staticmethod
+    def future_token(index: str = None) -> Optional[str]:
+        """
+        Returns the token of the nearest future of an index
+
+        Parameters
+        ----------
+        index : str
+            Index, such as NIFTY
+
+        Returns
+        -------
+        Optional[str]:
+            Token of the future expiring first, today included
+        """
+        today: date = date.today()
+        for day, token in sorted(future_map.get(index, {}).items()):
+            if day >= today:
+                return token
+        return None
+
+
+def _add_to_chain(row: Dict = None) -> None:
+    instrument_type: str = str(row.get("instrumenttype", ""))
+    if row.get("exch_seg") != "NFO" or instrument_type not in ("OPTIDX", "FUTIDX"):
+        return None
+    try:
+        day: date = datetime.strptime(str(row["expiry"]), "%d%b%Y").date()
+    except (KeyError, ValueError):
+        return None
+    name: str = str(row.get("name", ""))
+    if instrument_type == "FUTIDX":
+        future_map.setdefault(name, {})[day] = str(row["token"])
+        return None
+    # Symbols carry the expiry as 25APR24 and the strike in rupees, the file has 25APR2024 and the strike in paise
+    expiry: str = day.strftime("%d%b%y").upper()
+    symbol: str = str(row["symbol"])
+    option_type: str = symbol[-2:]
+    strike: int = int(round(float(row.get("strike", 0)) / 100))
+    if option_type not in ("CE", "PE") or symbol != name + expiry + str(strike) + option_type:
+        return None
+    expiry_map.setdefault(name, {})[day] = expiry
+    chain_map.setdefault((name, expiry), {}).setdefault(strike, {})[option_type] = str(row["token"])